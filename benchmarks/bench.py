@@ -0,0 +1,329 @@
+#Benchmark harness for convert and resize
+
+# Generates synthetic images of several sizes and source formats and runs
+# convert (every COMPRESSION_MAP level), resize (shrink -> INTER_AREA,
+# enlarge -> INTER_LINEAR) and renditions (cascaded, and as independent
+# resizes from the source for comparison) through the in-memory library API
+# and through the CLI. Reports images/sec, p50/p99 latency, peak RSS and
+# output bytes as JSON.
+#
+# The threads cases resize a batch of BATCH_IMAGES copies through the CLI,
+# once with OpenCV's own thread pool in every worker (--cv-threads opencv) and
+# once with the cores divided between workers and threads (--cv-threads auto);
+# the report's thread_splits compares the two.
+#
+# --format-table instead encodes a fixed corpus (CORPUS_SEEDS synthetic images
+# per size) with every output format the local cv2 build has, at every
+# COMPRESSION_MAP level, and reports mean bytes and encode ms per image as a
+# table on stderr and under 'formats' in the JSON.
+#
+#   python benchmarks/bench.py --format-table --sizes small medium
+#   python benchmarks/bench.py --output bench.json
+#   python benchmarks/bench.py --save-baseline benchmarks/baseline.json
+#   python benchmarks/bench.py --baseline benchmarks/baseline.json   # exit 1 on regression
+#
+# Every library case runs in a fresh interpreter and every CLI run is a child
+# process, so peak RSS is measured per case and not polluted by earlier cases.
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import statistics
+import multiprocessing
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+MODULE_DIR = REPO_ROOT / "src" / "image_processing"
+CLI_MAIN = MODULE_DIR / "main.py"
+sys.path.insert(0, str(MODULE_DIR))
+
+SIZES = {
+    'small': (640, 480),
+    'medium': (1920, 1080),
+    'large': (4000, 3000),
+}
+SOURCE_FORMATS = ('png', 'jpg', 'tiff')
+LEVELS = ('low', 'medium', 'high')
+RENDITION_FRACTIONS = (1 / 2, 1 / 3, 1 / 4, 1 / 6, 1 / 8, 1 / 12)
+BATCH_IMAGES = 16
+CORPUS_SEEDS = 3
+THREAD_MODES = ('opencv', 'auto')
+# metric -> True if bigger is better
+METRICS = {'images_per_sec': True, 'p50_ms': False, 'p99_ms': False, 'peak_rss_mb': False, 'output_bytes': False}
+
+
+def synthetic_image(width, height, seed=0):
+    """Deterministic photo-like content: smooth gradients plus some noise."""
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    img = np.dstack([x / width * 255, y / height * 255, (x + y) / (width + height) * 255])
+    img += rng.normal(0, 12, img.shape)
+    img = cv2.GaussianBlur(np.clip(img, 0, 255).astype(np.uint8), (0, 0), 1.2)
+    cv2.circle(img, (width // 2, height // 2), min(width, height) // 4, (30, 200, 240), -1)
+    return img
+
+def build_cases(sizes, source_formats, levels):
+    cases = []
+    for size_name in sizes:
+        w, h = SIZES[size_name]
+        for src in source_formats:
+            for fmt in ('jpg', 'png', 'tiff'):
+                if fmt == src:
+                    continue
+                for level in levels:
+                    cases.append({'op': 'convert', 'size': size_name, 'source_format': src, 'format': fmt, 'level': level})
+            cases.append({'op': 'resize', 'size': size_name, 'source_format': src, 'width': w // 2, 'height': h // 2})
+            cases.append({'op': 'resize', 'size': size_name, 'source_format': src, 'width': w * 3 // 2, 'height': h * 3 // 2})
+            for mode in THREAD_MODES:
+                cases.append({'op': 'threads', 'size': size_name, 'source_format': src, 'width': w // 2, 'height': h // 2, 'cv_threads': mode})
+            widths = [int(w * f) for f in RENDITION_FRACTIONS]
+            for mode in ('cascade', 'independent'):
+                cases.append({'op': 'renditions', 'size': size_name, 'source_format': src, 'widths': widths, 'mode': mode})
+    return cases
+
+def case_name(path, case):
+    w, h = SIZES[case['size']]
+    if case['op'] == 'convert':
+        what = f"{case['source_format']}->{case['format']}-{case['level']}"
+    elif case['op'] == 'renditions':
+        what = f"{case['source_format']}->{len(case['widths'])}-widths-{case['mode']}"
+    elif case['op'] == 'threads':
+        what = f"{BATCH_IMAGES}x{case['source_format']}->{case['width']}x{case['height']}-cv-{case['cv_threads']}"
+    else:
+        what = f"{case['source_format']}->{case['width']}x{case['height']}"
+    return f"{path}/{case['op']}/{what}/{w}x{h}"
+
+def summarize(name, latencies, output_bytes, peak_rss_kb):
+    latencies = sorted(latencies)
+    p99_index = min(len(latencies) - 1, int(round(0.99 * (len(latencies) - 1))))
+    return {
+        'name': name,
+        'iterations': len(latencies),
+        'images_per_sec': round(len(latencies) / sum(latencies), 3),
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p99_ms': round(latencies[p99_index] * 1000, 3),
+        'peak_rss_mb': round(peak_rss_kb / 1024, 2),
+        'output_bytes': output_bytes,
+    }
+
+def library_renditions(source, case):
+    import buffers
+    import renditions
+    w, h = SIZES[case['size']]
+    sizes = renditions.rendition_sizes(w, h, case['widths'])
+    if case['mode'] == 'cascade':
+        img = buffers.decode_for_size(source, *sizes[0])
+        frames = [frame for _, _, frame in renditions.cascade(img, sizes)]
+    else:
+        # what separate resize runs do: decode and resample from full size every time
+        frames = [buffers.resize_array(buffers.decode_for_size(source, *size), *size) for size in sizes]
+    return sum(len(buffers.encode(frame, case['source_format'])) for frame in frames)
+
+def library_case(case, repeat, queue):
+    """Runs in a fresh interpreter: decode -> (resize) -> encode, all in memory."""
+    import buffers
+    img = synthetic_image(*SIZES[case['size']])
+    source = bytes(buffers.encode(img, case['source_format'], 'medium'))
+    del img
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if case['op'] == 'convert':
+            output_bytes = len(buffers.encode(buffers.decode(source), case['format'], case['level']))
+        elif case['op'] == 'renditions':
+            output_bytes = library_renditions(source, case)
+        else:
+            decoded = buffers.decode_for_size(source, case['width'], case['height'])
+            output_bytes = len(buffers.encode(buffers.resize_array(decoded, case['width'], case['height']), case['source_format']))
+        latencies.append(time.perf_counter() - start)
+    queue.put((latencies, output_bytes, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+def run_library(case, repeat):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=library_case, args=(case, repeat, queue))
+    proc.start()
+    latencies, output_bytes, rss = queue.get()
+    proc.join()
+    return summarize(case_name('library', case), latencies, output_bytes, rss)
+
+def run_cli(case, repeat, workdir):
+    import buffers
+    src = workdir / f"{case['size']}.{case['source_format']}"
+    if not src.exists():
+        src.write_bytes(buffers.encode(synthetic_image(*SIZES[case['size']]), case['source_format'], 'medium'))
+    if case['op'] == 'convert':
+        dest = workdir / f"out.{case['format']}"
+        cmd = ['convert', '-s', str(src), '-d', str(dest), '-f', case['format'], '-c', case['level']]
+    elif case['op'] == 'threads':
+        batch = workdir / f"batch-{src.name}"
+        if not batch.exists():
+            batch.mkdir()
+            for i in range(BATCH_IMAGES):
+                (batch / f"{i}{src.suffix}").write_bytes(src.read_bytes())
+        dest = workdir / "batch-out"
+        cmd = ['resize', '-s', str(batch), '-d', str(dest), '--width', str(case['width']), '--height', str(case['height']),
+               '--cv-threads', case['cv_threads']]
+    else:
+        dest = workdir / f"out.{case['source_format']}"
+        cmd = ['resize', '-s', str(src), '-d', str(dest), '--width', str(case['width']), '--height', str(case['height'])]
+    latencies, peak = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, str(CLI_MAIN), *cmd, '--force'],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        # wait4 gives the rusage of this child alone
+        _, status, usage = os.wait4(proc.pid, 0)
+        latencies.append(time.perf_counter() - start)
+        if os.waitstatus_to_exitcode(status) != 0:
+            raise RuntimeError(f"CLI failed: {' '.join(cmd)}\n{proc.stderr.read().decode()}")
+        proc.stderr.close()
+        peak = max(peak, usage.ru_maxrss)
+    if case['op'] == 'threads':
+        # latencies are per batch; throughput is per image
+        summary = summarize(case_name('cli', case), latencies, sum(p.stat().st_size for p in dest.iterdir()), peak)
+        summary['images_per_sec'] = round(summary['images_per_sec'] * BATCH_IMAGES, 3)
+        return summary
+    return summarize(case_name('cli', case), latencies, dest.stat().st_size, peak)
+
+def thread_splits(results):
+    """Batch throughput with the auto split against OpenCV's default threads, per threads case."""
+    by_name = {r['name']: r for r in results}
+    splits = []
+    for name, result in by_name.items():
+        if '/threads/' not in name or not name.split('/')[2].endswith('-cv-auto'):
+            continue
+        default = by_name.get(name.replace('-cv-auto/', '-cv-opencv/'))
+        if default:
+            splits.append({'name': name.replace('-cv-auto/', '/'), 'opencv_images_per_sec': default['images_per_sec'],
+                           'auto_images_per_sec': result['images_per_sec'],
+                           'speedup': round(result['images_per_sec'] / default['images_per_sec'], 3)})
+    return splits
+
+def format_table(sizes, repeat):
+    """Mean encoded bytes and encode time per image for every format and level on the corpus."""
+    import buffers
+    rows = []
+    for size_name in sizes:
+        corpus = [synthetic_image(*SIZES[size_name], seed=seed) for seed in range(CORPUS_SEEDS)]
+        for fmt in buffers.available_formats():
+            if fmt == 'jpeg':
+                continue  # the same encoder as jpg
+            for level in buffers.COMPRESSION_MAP[fmt]:
+                total_bytes, latencies = 0, []
+                for img in corpus:
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        data = buffers.encode(img, fmt, level)
+                        latencies.append(time.perf_counter() - start)
+                    total_bytes += len(data)
+                rows.append({'size': size_name, 'format': fmt, 'level': level,
+                             'bytes': total_bytes // len(corpus),
+                             'encode_ms': round(statistics.median(latencies) * 1000, 2)})
+    return rows
+
+def print_format_table(rows, stream=sys.stderr):
+    print(f"{'size':<8} {'format':<6} {'level':<9} {'bytes':>10} {'encode ms':>10}", file=stream)
+    for row in rows:
+        print(f"{row['size']:<8} {row['format']:<6} {row['level']:<9} {row['bytes']:>10} {row['encode_ms']:>10}", file=stream)
+
+def compare(results, baseline, tolerance):
+    """Regressions of results against a baseline, as human-readable lines."""
+    previous = {r['name']: r for r in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        old = previous.get(result['name'])
+        if not old:
+            continue
+        for metric, bigger_is_better in METRICS.items():
+            before, after = old[metric], result[metric]
+            if not before:
+                continue
+            change = (after - before) / before
+            if (bigger_is_better and change < -tolerance) or (not bigger_is_better and change > tolerance):
+                regressions.append(f"{result['name']}: {metric} {before} -> {after} ({change:+.0%})")
+    return regressions
+
+def run(args):
+    import cv2
+    import tempfile
+    cases = build_cases(args.sizes, args.source_formats, args.levels)
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'cv2': cv2.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+        },
+        'results': [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for case in cases:
+            # threads cases measure CLI batches; the library runs one image in one process
+            if 'library' in args.paths and case['op'] != 'threads':
+                results['results'].append(run_library(case, args.repeat))
+            # renditions compares two library strategies; the CLI has only one
+            if 'cli' in args.paths and case['op'] != 'renditions':
+                results['results'].append(run_cli(case, args.cli_repeat, Path(tmp)))
+            print(f"done {case_name('*', case)}", file=sys.stderr)
+    splits = thread_splits(results['results'])
+    if splits:
+        results['thread_splits'] = splits
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark convert/resize throughput, latency and memory')
+    parser.add_argument('--sizes', nargs='+', choices=SIZES, default=list(SIZES))
+    parser.add_argument('--source-formats', nargs='+', choices=SOURCE_FORMATS, default=list(SOURCE_FORMATS))
+    parser.add_argument('--levels', nargs='+', choices=LEVELS, default=list(LEVELS))
+    parser.add_argument('--paths', nargs='+', choices=('library', 'cli'), default=['library', 'cli'])
+    parser.add_argument('--repeat', type=int, default=20, help='Iterations per library case')
+    parser.add_argument('--cli-repeat', type=int, default=5, help='CLI runs per case')
+    parser.add_argument('--quick', action='store_true', help='Small smoke run (small images, png source, medium level)')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--save-baseline', help='Also save the report as a baseline file')
+    parser.add_argument('--baseline', help='Compare with a saved baseline and exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative change before a metric counts as a regression')
+    parser.add_argument('--format-table', action='store_true', help='Only report bytes and encode ms per output format and level')
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.sizes, args.source_formats, args.levels = ['small'], ['png'], ['medium']
+        args.repeat, args.cli_repeat = min(args.repeat, 5), min(args.cli_repeat, 2)
+
+    if args.format_table:
+        rows = format_table(args.sizes, args.repeat)
+        print_format_table(rows)
+        report = json.dumps({'meta': {'python': platform.python_version(), 'corpus_seeds': CORPUS_SEEDS, 'repeat': args.repeat},
+                             'formats': rows}, indent=2)
+        if args.output:
+            Path(args.output).write_text(report)
+        else:
+            print(report)
+        return 0
+
+    results = run(args)
+    report = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(report)
+    else:
+        print(report)
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(report)
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in regressions:
+            print(f"\033[31mREGRESSION {line}\033[0m", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
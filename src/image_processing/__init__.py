@@ -0,0 +1,13 @@
+"""In-memory image processing API.
+
+    from image_processing import decode, encode, resize_array
+
+    img = decode(uploaded_bytes)
+    data = encode(resize_array(img, 800, 600), 'jpg', 'medium')
+    sharp = filter_array(resize_array(img, 400, 300), [['sharpen', [0.8, 1.0]], ['gamma', 1.1]])
+"""
+
+from .buffers import COMPRESSION_MAP, Header, decode, encode, probe, resize_array
+from .filters import filter_array
+
+__all__ = ['COMPRESSION_MAP', 'Header', 'decode', 'encode', 'filter_array', 'probe', 'resize_array']
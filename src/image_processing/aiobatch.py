@@ -0,0 +1,174 @@
+#Asyncio batch engine with overlapped I/O and CPU stages
+
+# For images on slow or network-mounted storage (--engine async). Every image
+# goes through three stages:
+#
+#   read       validate, then outputs.Output.prepare(): pick the destination,
+#              read the source, serve cache hits and near-duplicates
+#   transform  decode -> (resize) -> encode, in a thread pool of --jobs threads
+#   write      outputs.Output.write(): write the output and record it in the
+#              cache, the duplicate index and the manifest
+#
+# read and write run in a separate pool of --io-threads threads, so the disk is
+# busy while the cores encode and the other way round. cv2 releases the GIL
+# while it decodes, resizes and encodes, so the transform threads really run in
+# parallel. The stages are connected by queues of --prefetch images: when the
+# writers fall behind, the transform threads block, then the readers, so at most
+# 2 * io_threads + 2 * prefetch + jobs images are held in memory at once.
+
+import asyncio
+import threading
+import concurrent.futures
+import batch
+import convert
+import outputs
+import resize
+import profiling
+import utilities
+
+# cProfile in several threads at once is not supported everywhere, so with
+# --cprofile the transforms are profiled one at a time
+_cprofile_lock = threading.Lock()
+
+
+class Job:
+    """One image moving through the pipeline."""
+
+    def __init__(self, command, args):
+        self.command = command
+        self.args = args
+        self.source = str(args.source)
+        self.result = None
+        self.stages = {}
+        self.output = None
+        self.data = None
+        self.cprofile = None
+        self.whole = command == 'resize' and getattr(args, 'tiled', False)
+
+    @property
+    def done(self):
+        return self.result is not None
+
+    def run(self, step):
+        """Run one stage in the calling thread and record its timings."""
+        with profiling.trace() as stages:
+            try:
+                step(self)
+            except (SystemExit, Exception) as e:
+                self.result = batch.failure(self.source, e)
+        for name, seconds in stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        return self
+
+    def finish(self):
+        """The batch result, with the stage timings of every thread it went through."""
+        if self.output:
+            self.output.source_bytes = None
+            self.output.decoded = None
+        self.data = None
+        self.result['stages_ms'] = {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+        return self.result
+
+    def succeed(self):
+        self.result = {'source': self.source, 'ok': True, 'destination': str(self.output.dest)}
+
+
+def report(command, args, ext):
+    """The success line of the command, as outputs.Output wants it."""
+    if command == 'convert':
+        return lambda dest, note=None: convert.report_success(dest, ext, cached=note == 'cached')
+    return lambda dest, note=None: resize.report_success(dest, args.width, args.height, note)
+
+def read_step(job):
+    args = job.args
+    if job.whole:
+        # tiled resizes stream the file themselves: the whole job runs in a transform thread
+        return
+    if job.command == 'convert':
+        with profiling.stage('validate'):
+            ext = convert.validateconversionargs(args)
+        operation = convert.operation(args, ext)
+    else:
+        resize.validate_resize_arguments(args)
+        ext = utilities.get_extension(args.destination)
+        operation = resize.operation(args)
+    job.output = outputs.Output(args, operation, ext, report(job.command, args, ext))
+    if job.output.prepare():
+        job.succeed()
+
+def transform_step(job):
+    if job.whole:
+        job.result = batch.run_job(job.command, job.args)
+        return
+    output = job.output
+    if job.command == 'convert':
+        job.data = convert.convert_bytes(job.args, output.ext, output.source_bytes, output.dest, output.decoded)
+    else:
+        job.data = resize.resize_bytes(job.args, output.source_bytes, output.dest, output.decoded)
+    output.release()
+
+def write_step(job):
+    job.output.write(job.data)
+    job.succeed()
+
+def transform_profiled(job):
+    if not getattr(job.args, 'cprofile', None):
+        return job.run(transform_step)
+    with _cprofile_lock, profiling.cprofiled(True) as captured:
+        job.run(transform_step)
+    job.cprofile = captured['stats']
+    return job
+
+
+async def run_pipeline(command, jobs, workers, prefetch, io_threads):
+    """Push every job through read -> transform -> write; returns the results."""
+    loop = asyncio.get_running_loop()
+    pending = [Job(command, args) for args in reversed(jobs)]
+    to_transform = asyncio.Queue(max(1, prefetch))
+    to_write = asyncio.Queue(max(1, prefetch))
+    results = []
+
+    def finished(job):
+        result = job.finish()
+        if job.cprofile:
+            result['cprofile'] = job.cprofile
+        results.append(result)
+
+    async def reader():
+        while pending:
+            job = await loop.run_in_executor(io_pool, pending.pop().run, read_step)
+            if job.done:
+                finished(job)
+            else:
+                # blocks while the transform threads are behind
+                await to_transform.put(job)
+
+    async def transformer():
+        while (job := await to_transform.get()) is not None:
+            await loop.run_in_executor(cpu_pool, transform_profiled, job)
+            if job.done:
+                finished(job)
+            else:
+                await to_write.put(job)
+
+    async def writer():
+        while (job := await to_write.get()) is not None:
+            finished(await loop.run_in_executor(io_pool, job.run, write_step))
+
+    io_threads = max(1, io_threads)
+    with concurrent.futures.ThreadPoolExecutor(io_threads, thread_name_prefix='io') as io_pool, \
+            concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix='transform') as cpu_pool:
+        transformers = [asyncio.create_task(transformer()) for _ in range(workers)]
+        writers = [asyncio.create_task(writer()) for _ in range(io_threads)]
+        await asyncio.gather(*(reader() for _ in range(io_threads)))
+        for _ in transformers:
+            await to_transform.put(None)
+        await asyncio.gather(*transformers)
+        for _ in writers:
+            await to_write.put(None)
+        await asyncio.gather(*writers)
+    return results
+
+def run_jobs(command, jobs, workers, prefetch=8, io_threads=8):
+    """Run a batch through the async pipeline from synchronous code."""
+    return asyncio.run(run_pipeline(command, jobs, max(1, workers), prefetch, io_threads))
@@ -0,0 +1,182 @@
+#Batch mode for convert, resize and filter
+
+# A source can be several files, a directory, a glob pattern or a .txt file
+# listing one image per line. Every image runs in a worker of a process pool
+# (or, with --engine async, goes through the overlapped pipeline in aiobatch)
+# and failures are reported per file instead of stopping the whole run.
+#
+# Big batches can be split across hosts: --shard I/N keeps the images whose
+# path hashes to part I of N, so N runs over the same sources cover every
+# image exactly once; --queue lets any number of runs claim images from a
+# shared work queue instead (workqueue.py). Sharding hashes the resolved
+# path, so the hosts have to mount the sources at the same place.
+
+import re
+import sys
+import copy
+import glob
+import hashlib
+import pathlib
+import argparse
+import convert
+import resize
+import profiling
+import buffers
+import utilities
+
+LIST_SUFFIXES = {'.txt', '.lst'}
+ANSI_RE = re.compile(r'\033\[[0-9;]*m')
+
+
+def is_list_file(path):
+    return isinstance(path, pathlib.Path) and path.is_file() and path.suffix.lower() in LIST_SUFFIXES
+
+def is_batch(sources):
+    """A run is a batch unless it is exactly one plain image file."""
+    if len(sources) != 1:
+        return True
+    source = sources[0]
+    return not isinstance(source, pathlib.Path) or source.is_dir() or is_list_file(source)
+
+def is_distributed(args):
+    """--shard and --queue split a batch across runs: even a single file goes through run_batch."""
+    return bool(getattr(args, 'shard', None) or getattr(args, 'queue', None))
+
+def in_shard(path, shard):
+    """True if path belongs to shard (index, count): the same answer on every host for the same path."""
+    index, count = shard
+    digest = hashlib.sha256(str(path).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % count == index - 1
+
+def expand_sources(sources):
+    """Turn files, directories, glob patterns and list files into a list of image paths."""
+    paths = []
+    for source in sources:
+        if isinstance(source, str):
+            paths.extend(pathlib.Path(p) for p in sorted(glob.glob(source)))
+        elif source.is_dir():
+            # dot files include the temporary files of outputs being written
+            paths.extend(p for p in sorted(source.iterdir())
+                         if p.is_file() and not p.name.startswith('.')
+                         and utilities.is_supported_format(utilities.get_extension(p)))
+        elif is_list_file(source):
+            lines = source.read_text().splitlines()
+            paths.extend(source.parent / line.strip() for line in lines if line.strip())
+        else:
+            paths.append(source)
+    # the same file can be matched twice (e.g. a directory and a glob)
+    unique = {}
+    for p in paths:
+        unique.setdefault(p.expanduser().resolve(), p)
+    return list(unique)
+
+def default_name(args, source):
+    """The file name single-file mode would give this source without --destination."""
+    if args.command == 'convert':
+        probe = argparse.Namespace(format=args.format, destination=None)
+        return f"{source.stem}_converted.{utilities.determineformat(probe)}"
+    if args.command == 'filter':
+        return f"{source.stem}_filtered{source.suffix}"
+    return f"{source.stem}_resized{source.suffix}"
+
+def job_args(args, source):
+    """Build the namespace for one image of the batch."""
+    job = copy.copy(args)
+    job.source = source
+    if args.destination:
+        # in batch mode --destination is an output directory
+        job.destination = str(pathlib.Path(args.destination).expanduser() / default_name(args, source))
+    return job
+
+def run_one(command, args):
+    """Run a single convert/resize job and return a result instead of exiting."""
+    with profiling.cprofiled(getattr(args, 'cprofile', None)) as captured, profiling.trace() as stages:
+        result = run_job(command, args)
+    result['stages_ms'] = {name: round(seconds * 1000, 3) for name, seconds in stages.items()}
+    if captured:
+        result['cprofile'] = captured['stats']
+    return result
+
+def run_job(command, args):
+    source = str(args.source)
+    try:
+        match command:
+            case 'convert':
+                dest = convert.validatecommandsandconvert(args)
+            case 'resize' | 'filter':
+                resize.validate_resize_arguments(args)
+                dest = resize.resize_image(args)
+            case _:
+                raise ValueError(f"Unknown batch command: {command}")
+    except (SystemExit, Exception) as e:
+        return failure(source, e)
+    return {'source': source, 'ok': True, 'destination': str(dest)}
+
+def failure(source, exc):
+    """The result of a job that raised instead of finishing."""
+    if isinstance(exc, SystemExit):
+        # utilities.error() exits with the coloured message as exit code
+        return {'source': source, 'ok': False, 'error': ANSI_RE.sub('', str(exc.code)).strip()}
+    return {'source': source, 'ok': False, 'error': f"{type(exc).__name__}: {exc}"}
+
+def run_single(args, recorder):
+    """Process one image like a batch of one; returns 1 on failure."""
+    buffers.set_threads(utilities.execution_plan(args, [args.source])[1])
+    result = run_one(args.command, args)
+    recorder.add(args.command, result)
+    if not result['ok']:
+        print(f"\033[31m{result['error']}\033[0m", file=sys.stderr)
+        return 1
+    return 0
+
+def run_batch(args, recorder=None):
+    """Process every source of the batch and return the number of failures."""
+    recorder = recorder or profiling.Recorder()
+    sources = expand_sources(args.source)
+    if not sources:
+        utilities.error("No images found for the given source(s).")
+    shard = getattr(args, 'shard', None)
+    if shard and getattr(args, 'queue', None):
+        utilities.error("--shard and --queue split the batch in different ways: use one of them.")
+    if shard:
+        sources = [source for source in sources if in_shard(source, shard)]
+    if args.destination:
+        dest_dir = pathlib.Path(args.destination).expanduser()
+        if dest_dir.is_file():
+            utilities.error(f"In batch mode the destination must be a directory: {dest_dir}")
+        dest_dir.mkdir(parents=True, exist_ok=True)
+
+    workers, threads = utilities.execution_plan(args, sources)
+    if getattr(args, 'queue', None):
+        if getattr(args, 'engine', 'process') == 'async':
+            utilities.error("--queue runs with the process engine only.")
+        import workqueue
+        return workqueue.run_queue(args, sources, workers, threads, recorder)
+    jobs = [job_args(args, source) for source in sources]
+    if getattr(args, 'engine', 'process') == 'async':
+        import aiobatch
+        buffers.set_threads(threads)  # the transform threads share one process
+        results = aiobatch.run_jobs(args.command, jobs, workers, args.prefetch, args.io_threads)
+        failures = report(args.command, results, recorder)
+    elif workers == 1:
+        buffers.set_threads(threads)
+        results = (run_one(args.command, job) for job in jobs)
+        failures = report(args.command, results, recorder)
+    else:
+        import concurrent.futures  # keeps startup cheap for single images
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=buffers.set_threads,
+                                                    initargs=(threads,)) as pool:
+            futures = [pool.submit(run_one, args.command, job) for job in jobs]
+            failures = report(args.command, (f.result() for f in concurrent.futures.as_completed(futures)), recorder)
+
+    print(f"Processed {len(jobs)} image(s): {len(jobs) - failures} succeeded, {failures} failed")
+    return failures
+
+def report(command, results, recorder):
+    failures = 0
+    for result in results:
+        recorder.add(command, result)
+        if not result['ok']:
+            failures += 1
+            print(f"\033[31mFailed: {result['source']}: {result['error']}\033[0m", file=sys.stderr)
+    return failures
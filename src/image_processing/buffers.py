@@ -0,0 +1,633 @@
+#In-memory image API
+
+# decode/encode/resize work on bytes, memoryviews and NumPy arrays, so images
+# can be processed without touching the filesystem. convert and resize are thin
+# file-based layers over these functions. Errors are raised as ValueError; the
+# CLI turns them into its usual error messages.
+#
+# This module only depends on cv2 and NumPy so it can also be imported as
+# `image_processing.buffers` (see __init__.py). Both are imported on first use,
+# so importing the CLI modules (and `--help` or argument errors) stays cheap;
+# probe() below only needs the standard library.
+
+import struct
+import functools
+import importlib
+import collections
+
+
+class LazyModule:
+    """Stands in for a module and imports it the first time an attribute is used.
+
+    setup, if given, is called with the module right after the import.
+    """
+
+    def __init__(self, name, setup=None):
+        self._name = name
+        self._module = None
+        self._setup = setup
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            module = importlib.import_module(self._name)
+            if self._setup:
+                self._setup(module)
+            self._module = module
+        return getattr(self._module, attr)
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+
+# Threads OpenCV may use inside one call; None keeps its default (all cores).
+_threads = None
+
+def _thread_setting(count):
+    # setNumThreads: -1 restores the default, 0 runs in the calling thread without a pool
+    if count is None:
+        return -1
+    return count if count > 1 else 0
+
+def _apply_threads(module):
+    if _threads is not None:
+        module.setNumThreads(_thread_setting(_threads))
+
+def set_threads(count):
+    """Let cv2 use count threads per call (None: OpenCV's default); applied on first use if not yet imported."""
+    global _threads
+    _threads = count
+    if cv2.loaded:
+        cv2.setNumThreads(_thread_setting(count))
+
+
+cv2 = LazyModule('cv2', setup=_apply_threads)
+np = LazyModule('numpy')
+
+COMPRESSION_MAP = {
+    'png': {
+        'low': 1,
+        'medium': 5,
+        'high': 9,
+    },
+    'jpg': {
+        'low': 95,
+        'medium': 85,
+        'high': 70,
+    },
+    'jpeg': {
+        'low': 95,
+        'medium': 85,
+        'high': 70,
+    },
+    'tiff': {
+        'low': 1,
+        'medium': 5,   # LZW
+        'high': 8,     # Deflate
+    },
+    # optional codecs, offered when the local cv2 build has them (see available_formats)
+    'webp': {
+        'low': 95,
+        'medium': 80,
+        'high': 65,
+        'lossless': 101,   # quality above 100 switches libwebp to lossless
+    },
+    'avif': {
+        # (quality, speed): a higher speed (0-10) encodes faster and slightly larger
+        'low': (90, 6),
+        'medium': (75, 8),
+        'high': (60, 9),
+    },
+}
+CORE_FORMATS = ('png', 'jpg', 'jpeg', 'tiff')
+OPTIONAL_FORMATS = ('webp', 'avif')
+
+# the cv2.IMWRITE_* parameters a COMPRESSION_MAP value sets, in the order of a tuple value
+COMPRESSION_FLAGS = {
+    'png': ('IMWRITE_PNG_COMPRESSION',),
+    'tiff': ('IMWRITE_TIFF_COMPRESSION',),
+    'jpg': ('IMWRITE_JPEG_QUALITY',),
+    'jpeg': ('IMWRITE_JPEG_QUALITY',),
+    'webp': ('IMWRITE_WEBP_QUALITY',),
+    'avif': ('IMWRITE_AVIF_QUALITY', 'IMWRITE_AVIF_SPEED'),
+}
+
+REDUCED_COLOR_FLAGS = {
+    2: 'IMREAD_REDUCED_COLOR_2',
+    4: 'IMREAD_REDUCED_COLOR_4',
+    8: 'IMREAD_REDUCED_COLOR_8',
+}
+REDUCED_GRAYSCALE_FLAGS = {
+    2: 'IMREAD_REDUCED_GRAYSCALE_2',
+    4: 'IMREAD_REDUCED_GRAYSCALE_4',
+    8: 'IMREAD_REDUCED_GRAYSCALE_8',
+}
+
+# sample types each encoder writes; anything else is scaled to 8 bits first,
+# since cv2 would saturate a 16-bit image into a white 8-bit one
+ENCODER_DEPTHS = {
+    'jpg': ('uint8',),
+    'jpeg': ('uint8',),
+    'png': ('uint8', 'uint16'),
+    'webp': ('uint8',),
+    # 16-bit AVIF needs 10 or 12-bit samples, so 16-bit sources are written as 8-bit
+    'avif': ('uint8',),
+}
+
+
+def compression_flags(formatImg):
+    """The cv2.imwrite flags that a COMPRESSION_MAP value sets for this format."""
+    return [getattr(cv2, name) for name in COMPRESSION_FLAGS.get(formatImg, COMPRESSION_FLAGS['png'])]
+
+def compression_flag(formatImg):
+    """The cv2.imwrite flag that controls compression (or quality) for this format."""
+    return compression_flags(formatImg)[0]
+
+def write_params(formatImg, level):
+    """cv2.imwrite/imencode parameters for a format and a COMPRESSION_MAP level."""
+    if level is None:
+        return []
+    if formatImg not in COMPRESSION_MAP:
+        raise ValueError(f"Unsupported format: {formatImg}")
+    if level not in COMPRESSION_MAP[formatImg]:
+        raise ValueError(f"Unsupported compression level: {level}")
+    value = COMPRESSION_MAP[formatImg][level]
+    values = value if isinstance(value, tuple) else (value,)
+    return [param for pair in zip(compression_flags(formatImg), values) for param in pair]
+
+@functools.cache
+def available_formats():
+    """The formats this cv2 build can write and read back: the core ones plus any optional codec it has."""
+    img = np.zeros((8, 8, 3), dtype=np.uint8)
+    formats = list(CORE_FORMATS)
+    for fmt in OPTIONAL_FORMATS:
+        try:
+            ok, buf = cv2.imencode(f".{fmt}", img)
+            ok = ok and cv2.imdecode(buf, cv2.IMREAD_UNCHANGED) is not None
+        except cv2.error:
+            ok = False
+        if ok:
+            formats.append(fmt)
+    return tuple(formats)
+
+def as_buffer(data):
+    """View bytes, bytearray, memoryview or a uint8 array as a 1-D uint8 array without copying."""
+    if isinstance(data, np.ndarray):
+        if data.dtype != np.uint8:
+            raise ValueError(f"Encoded data must be uint8, got {data.dtype}")
+        return data.reshape(-1)
+    return np.frombuffer(data, dtype=np.uint8)
+
+def decode(data, flags=None):
+    """Decode an encoded image (PNG, JPEG, TIFF...) held in memory."""
+    if flags is None:
+        flags = cv2.IMREAD_COLOR
+    buf = as_buffer(data)
+    if buf.size == 0:
+        raise ValueError("Cannot decode an empty buffer")
+    img = cv2.imdecode(buf, flags)
+    if img is None:
+        raise ValueError("Could not decode image data")
+    return img
+
+def decode_unchanged(data):
+    """Decode keeping the source layout: grayscale, alpha and 16-bit samples are not converted.
+
+    Sources that carry an EXIF orientation (JPEG) are still turned upright,
+    which cv2 skips for IMREAD_UNCHANGED; JPEG has no alpha to lose.
+    """
+    try:
+        header = probe(data)
+    except ValueError:
+        header = None  # left to the decoder to report
+    if header and (header.format == 'jpeg' or header.orientation not in (None, 1)):
+        return decode(data, cv2.IMREAD_ANYCOLOR | cv2.IMREAD_ANYDEPTH)
+    return decode(data, cv2.IMREAD_UNCHANGED)
+
+def encodable(img, fmt):
+    """img in a sample type the fmt encoder writes: as is when it already is (no copy)."""
+    depths = ENCODER_DEPTHS.get(fmt.lower().lstrip('.'))
+    if depths is None or img.dtype.name in depths:
+        return img
+    if img.dtype == np.uint16:
+        return cv2.convertScaleAbs(img, alpha=255 / 65535)
+    if img.dtype.kind == 'f':
+        return cv2.convertScaleAbs(img, alpha=255)
+    return cv2.convertScaleAbs(img)
+
+def encode(img, fmt, level=None):
+    """Encode an image to `fmt` at a low/medium/high level (None = encoder defaults).
+
+    Returns a memoryview over the encoded bytes; pass it to bytes() if a copy is needed.
+    """
+    fmt = fmt.lower().lstrip('.')
+    return _encode(encodable(img, fmt), fmt, write_params(fmt, level))
+
+def _encode(img, fmt, params):
+    ok, buf = cv2.imencode(f".{fmt}", img, params)
+    if not ok:
+        raise ValueError(f"Could not encode image as {fmt}")
+    return memoryview(buf).cast('B')
+
+def _luma(img):
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    return img.astype(np.float32)
+
+def ssim(a, b):
+    """Mean structural similarity (Wang et al., 11x11 Gaussian window) of the luma of two images."""
+    peak = float(np.iinfo(a.dtype).max) if a.dtype.kind in 'ui' else 1.0
+    c1, c2 = (0.01 * peak) ** 2, (0.03 * peak) ** 2
+    a, b = _luma(a), _luma(b)
+    def blur(x):
+        return cv2.GaussianBlur(x, (11, 11), 1.5)
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a * mu_a
+    var_b = blur(b * b) - mu_b * mu_b
+    cov = blur(a * b) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a * mu_a + mu_b * mu_b + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+def quality_loss(img, data):
+    """How much encoding lost, as 100 * (1 - SSIM) between img and the decoded data."""
+    return 100.0 * (1.0 - ssim(img, decode(data, cv2.IMREAD_UNCHANGED)))
+
+def _lowest(lo, hi, ok):
+    """Smallest value in lo..hi for which ok() holds, assuming it keeps holding above it."""
+    if not ok(hi):
+        return None
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ok(mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+def _highest(lo, hi, ok):
+    """Largest value in lo..hi for which ok() holds, assuming it keeps holding below it."""
+    if not ok(lo):
+        return None
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if ok(mid):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def encode_for_target(img, fmt, target_bytes=None, max_loss=None):
+    """Encode with the setting that meets a byte budget and/or a quality-loss limit.
+
+    Trial encodes run in memory on the decoded image and every setting is tried
+    at most once. JPEG: the highest quality that fits target_bytes; with
+    max_loss, the lowest quality (smallest file) whose quality_loss() is within
+    it, which must then also fit target_bytes. PNG is lossless: the lowest
+    compression level that fits target_bytes. Returns (data, setting) and
+    raises ValueError if no setting meets the limits.
+    """
+    fmt = fmt.lower().lstrip('.')
+    img = encodable(img, fmt)
+    trials = {}
+    def trial(value):
+        if value not in trials:
+            trials[value] = _encode(img, fmt, [compression_flag(fmt), value])
+        return trials[value]
+    def fits(value):
+        return len(trial(value)) <= target_bytes
+
+    match fmt:
+        case 'jpg' | 'jpeg':
+            if max_loss is not None:
+                quality = _lowest(1, 100, lambda q: quality_loss(img, trial(q)) <= max_loss)
+                if quality is None:
+                    raise ValueError(f"No JPEG quality keeps the quality loss within {max_loss}")
+                if target_bytes is not None and not fits(quality):
+                    raise ValueError(f"Quality {quality} is needed for a loss within {max_loss}, "
+                                     f"but it takes {len(trial(quality))} bytes (budget {target_bytes})")
+            else:
+                quality = _highest(1, 100, fits)
+                if quality is None:
+                    raise ValueError(f"Even JPEG quality 1 takes {len(trial(1))} bytes (budget {target_bytes})")
+            return trial(quality), quality
+        case 'png':
+            if target_bytes is None:
+                # lossless: every level meets a quality-loss limit
+                return encode(img, fmt), None
+            level = _lowest(0, 9, fits)
+            if level is None:
+                raise ValueError(f"Even PNG compression 9 takes {len(trial(9))} bytes (budget {target_bytes})")
+            return trial(level), level
+        case _:
+            raise ValueError(f"Target size and quality-loss search support JPEG and PNG, not {fmt}")
+
+# Header-only probing
+#
+# probe() reads the format, size, channels and bit depth from the first bytes
+# of a PNG, JPEG or TIFF without decoding any pixels, plus what the header
+# tells about how it was encoded: the JPEG quality (when its quantization
+# tables are the standard libjpeg ones scaled for a quality, as cv2 writes
+# them), the zlib level class of a PNG and the TIFF compression. is_noop()
+# uses that to spot conversions and resizes that would only re-encode the
+# source, which the CLI then copies byte for byte instead: faster, and
+# without a second generation of JPEG loss.
+
+Header = collections.namedtuple('Header', 'format width height channels bit_depth setting orientation')
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_CHANNELS = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}
+# JPEG frame headers that carry the image size (SOF0-SOF15 minus DHT/JPG/DAC)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+JPEG_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD9)}
+# IJG base tables (natural order) that libjpeg scales for a quality setting
+JPEG_LUMA_TABLE = (
+    16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99,
+)
+JPEG_CHROMA_TABLE = (
+    17, 18, 24, 47, 99, 99, 99, 99, 18, 21, 26, 66, 99, 99, 99, 99,
+    24, 26, 56, 99, 99, 99, 99, 99, 47, 66, 99, 99, 99, 99, 99, 99,
+) + (99,) * 32
+# DQT segments list the 64 entries in zigzag order: natural index of each
+JPEG_ZIGZAG = (
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63,
+)
+TIFF_WIDTH, TIFF_HEIGHT, TIFF_BITS, TIFF_COMPRESSION, TIFF_ORIENTATION, TIFF_SAMPLES = 256, 257, 258, 259, 274, 277
+EXIF_ORIENTATION = 0x0112
+FORMAT_FAMILIES = {'jpg': 'jpeg', 'jpeg': 'jpeg', 'png': 'png', 'tif': 'tiff', 'tiff': 'tiff'}
+
+
+def probe(data):
+    """Header of an encoded image held in memory, or None if it is not a PNG, JPEG or TIFF.
+
+    Raises ValueError if the signature is there but the header is damaged.
+    """
+    view = memoryview(data)
+    if view.ndim != 1 or view.format != 'B':
+        view = view.cast('B')
+    return parse_header(lambda offset, size: bytes(view[offset:offset + size]))
+
+def parse_header(read):
+    """probe() over read(offset, size), so files can be probed without reading them whole."""
+    head = read(0, 8)
+    try:
+        if head == PNG_SIGNATURE:
+            return _png_header(read)
+        if head[:2] == b'\xff\xd8':
+            return _jpeg_header(read)
+        if head[:4] in (b'II*\x00', b'MM\x00*'):
+            return _tiff_header(read)
+    except struct.error:
+        raise ValueError("Truncated image header")
+    return None
+
+def _png_header(read):
+    ihdr = read(8, 25)
+    if len(ihdr) < 25 or ihdr[4:8] != b'IHDR':
+        raise ValueError("PNG without an IHDR chunk")
+    width, height, bit_depth, color_type = struct.unpack('>IIBB', ihdr[8:18])
+    if not width or not height or color_type not in PNG_CHANNELS:
+        raise ValueError("Damaged PNG header")
+    # the zlib header of the first IDAT records the compression level class
+    setting = None
+    offset = 8
+    while True:
+        chunk = read(offset, 10)
+        if len(chunk) < 8:
+            break
+        length, kind = struct.unpack('>I4s', chunk[:8])
+        if kind == b'IDAT':
+            if len(chunk) == 10:
+                setting = chunk[9] >> 6
+            break
+        offset += 12 + length
+    return Header('png', width, height, PNG_CHANNELS[color_type], bit_depth, setting, None)
+
+def _jpeg_header(read):
+    tables = {}
+    orientation = None
+    offset = 2
+    while True:
+        marker = read(offset, 4)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise ValueError("JPEG without a frame header")
+        if marker[1] == 0xFF:
+            # fill byte
+            offset += 1
+            continue
+        if marker[1] in JPEG_STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if len(marker) < 4:
+            raise ValueError("JPEG without a frame header")
+        length = marker[2] << 8 | marker[3]
+        if marker[1] in JPEG_SOF_MARKERS:
+            frame = read(offset + 4, 6)
+            if len(frame) < 6:
+                raise ValueError("Truncated JPEG frame header")
+            bit_depth, height, width, channels = struct.unpack('>BHHB', frame)
+            if not width or not height:
+                raise ValueError("Damaged JPEG frame header")
+            return Header('jpeg', width, height, channels, bit_depth, _jpeg_quality(tables), orientation)
+        if marker[1] == 0xDB:
+            _read_dqt(read(offset + 4, length - 2), tables)
+        elif marker[1] == 0xE1 and orientation is None:
+            segment = read(offset + 4, length - 2)
+            if segment[:6] == b'Exif\x00\x00':
+                try:
+                    orientation = _tiff_header(lambda o, n: segment[6 + o:6 + o + n], EXIF_ORIENTATION)
+                except ValueError:
+                    pass
+        offset += 2 + length
+
+def _read_dqt(segment, tables):
+    i = 0
+    while i < len(segment):
+        precision, table = segment[i] >> 4, segment[i] & 0x0F
+        size = 128 if precision else 64
+        if i + 1 + size > len(segment):
+            raise ValueError("Truncated JPEG quantization table")
+        values = struct.unpack('>64H' if precision else '>64B', segment[i + 1:i + 1 + size])
+        natural = [0] * 64
+        for zigzag, index in enumerate(JPEG_ZIGZAG):
+            natural[index] = values[zigzag]
+        tables[table] = tuple(natural)
+        i += 1 + size
+
+def _jpeg_quality(tables):
+    """The libjpeg quality whose scaled standard tables are exactly these, or None."""
+    if 0 not in tables:
+        return None
+    for quality in range(1, 101):
+        scale = 5000 // quality if quality < 50 else 200 - 2 * quality
+        if all(tables[i] == tuple(min(max((v * scale + 50) // 100, 1), 255) for v in base)
+               for i, base in ((0, JPEG_LUMA_TABLE), (1, JPEG_CHROMA_TABLE)) if i in tables):
+            return quality
+    return None
+
+def _tiff_header(read, wanted=None):
+    """TIFF header; with wanted (a tag), just that tag's value from the first IFD (for EXIF)."""
+    head = read(0, 8)
+    if len(head) < 8:
+        raise ValueError("Truncated TIFF header")
+    endian = '<' if head[:2] == b'II' else '>'
+    (ifd,) = struct.unpack(endian + 'I', head[4:])
+    count = read(ifd, 2)
+    if len(count) < 2:
+        raise ValueError("TIFF header points past the end of the file")
+    (count,) = struct.unpack(endian + 'H', count)
+    entries = read(ifd + 2, 12 * count)
+    tags = {}
+    for i in range(0, len(entries) - 11, 12):
+        tag, typ, n, value = struct.unpack(endian + 'HHI4s', entries[i:i + 12])
+        if typ == 3:
+            tags[tag] = struct.unpack(endian + 'H', value[:2])[0], n, value
+        elif typ == 4:
+            tags[tag] = struct.unpack(endian + 'I', value)[0], n, value
+    if wanted is not None:
+        return tags[wanted][0] if wanted in tags else None
+    if TIFF_WIDTH not in tags or TIFF_HEIGHT not in tags:
+        raise ValueError("TIFF without an image size")
+    samples = tags.get(TIFF_SAMPLES, (1,))[0]
+    bits, n, value = tags.get(TIFF_BITS, (1, 1, b''))
+    if n > 2:
+        # one entry per sample, stored elsewhere when they do not fit in the entry
+        (where,) = struct.unpack(endian + 'I', value)
+        bits = struct.unpack(endian + 'H', read(where, 2))[0]
+    return Header('tiff', tags[TIFF_WIDTH][0], tags[TIFF_HEIGHT][0], samples, bits,
+                  tags.get(TIFF_COMPRESSION, (1,))[0], tags.get(TIFF_ORIENTATION, (None,))[0])
+
+def jpeg_size(data):
+    """(width, height) from a JPEG header without decoding, or None if not a JPEG."""
+    try:
+        header = probe(data)
+    except ValueError:
+        return None
+    if header is None or header.format != 'jpeg':
+        return None
+    return header.width, header.height
+
+def _zlib_level_class(level):
+    # the 2-bit FLEVEL zlib writes into its header for a compression level
+    return 0 if level < 2 else 1 if level < 6 else 2 if level == 6 else 3
+
+def is_noop(header, fmt, level=None, size=None):
+    """True if decoding and encoding as fmt (at level, at size) would only re-encode the source.
+
+    The source has to be in the same format, at the target size, stored
+    upright, and, when a level is given, encoded with that level's setting.
+    level None accepts any setting: the caller has no compression option.
+    """
+    if header is None or header.orientation not in (None, 1):
+        return False
+    if FORMAT_FAMILIES.get(fmt.lower().lstrip('.')) != header.format:
+        return False
+    if size is not None and tuple(size) != (header.width, header.height):
+        return False
+    if level is None:
+        return True
+    expected = COMPRESSION_MAP[fmt.lower().lstrip('.')][level]
+    if header.format == 'png':
+        expected = _zlib_level_class(expected)
+    return header.setting == expected
+
+def reduction_factor(src_width, src_height, width, height):
+    """Largest JPEG DCT scale (8, 4, 2) that still decodes at least width x height."""
+    for factor in (8, 4, 2):
+        if src_width // factor >= width and src_height // factor >= height:
+            return factor
+    return 1
+
+def decode_for_size(data, width, height):
+    """Decode an image that will be resized to width x height, keeping its layout (decode_unchanged).
+
+    Large JPEG downscales are decoded at 1/2, 1/4 or 1/8 resolution by libjpeg,
+    which costs roughly that fraction of the time and memory. The result is
+    still at least width x height; other formats are decoded in full.
+    """
+    try:
+        header = probe(data)
+    except ValueError:
+        header = None
+    if header is None or header.format != 'jpeg':
+        return decode_unchanged(data)
+    factor = reduction_factor(header.width, header.height, width, height)
+    if factor == 1:
+        return decode_unchanged(data)
+    flags = REDUCED_GRAYSCALE_FLAGS if header.channels == 1 else REDUCED_COLOR_FLAGS
+    img = decode(data, getattr(cv2, flags[factor]))
+    h, w = img.shape[:2]
+    if w < width or h < height:
+        # EXIF orientation swapped the axes: the header size was not the displayed size
+        return decode_unchanged(data)
+    return img
+
+def choose_interpolation(img, width, height):
+    """Area for shrinking, linear for enlarging."""
+    h, w = img.shape[:2]
+    if width < w and height < h:
+        return cv2.INTER_AREA
+    return cv2.INTER_LINEAR
+
+def resize_array(img, width, height):
+    """Resize a decoded image to width x height."""
+    if width <= 0 or height <= 0:
+        raise ValueError("Width and height must be positive integers.")
+    return cv2.resize(img, (width, height), interpolation=choose_interpolation(img, width, height))
+
+# Perceptual hashes
+#
+# fingerprint() summarises what an image looks like, not its bytes: a 64-bit
+# difference hash (dHash: is each pixel of a 9 x 8 grayscale thumbnail
+# brighter than its right neighbour?) plus the mean colour, which dHash
+# ignores. Re-saved JPEGs and copies with stripped metadata land within a few
+# bits of each other. The thumbnail comes from a reduced JPEG decode, so
+# hashing a JPEG costs about 1/64 of a full decode. Other formats are decoded
+# in full; shared_decode() gives that decode to the caller so the transform
+# that follows does not decode the source a second time.
+
+Fingerprint = collections.namedtuple('Fingerprint', 'dhash colour width height channels')
+HASH_BITS = 64
+
+
+def dhash(img):
+    """64-bit difference hash of a decoded image."""
+    small = cv2.resize(_luma(img), (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def mean_colour(img):
+    """Mean of every channel in 0-255 units, alpha included."""
+    peak = float(np.iinfo(img.dtype).max) if img.dtype.kind in 'ui' else 1.0
+    means = cv2.mean(img)[:img.shape[2] if img.ndim == 3 else 1]
+    return tuple(round(m * 255 / peak) for m in means)
+
+def shared_decode(data):
+    """The full decode fingerprint() would make of data, or None for JPEG (hashed from a reduced decode) and undecodable data."""
+    try:
+        header = probe(data)
+        if header is None or header.format == 'jpeg':
+            return None
+        return decode_unchanged(data)
+    except ValueError:
+        return None  # left to the decoder to report
+
+def fingerprint(data, img=None):
+    """Fingerprint of an encoded image; raises ValueError if it cannot be decoded.
+
+    img is data already decoded (shared_decode), to hash instead of decoding again.
+    """
+    header = probe(data)
+    if header is None:
+        raise ValueError("Unsupported image format")
+    if img is None:
+        img = decode_for_size(data, 64, 64)
+    return Fingerprint(dhash(img), mean_colour(img), header.width, header.height, header.channels)
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
@@ -0,0 +1,199 @@
+#Content-addressed result cache
+
+# Results are stored under a key made from the SHA-256 of the source bytes and
+# the normalised operation (format, COMPRESSION_MAP value, target size,
+# interpolation policy). A hit is served by hard-linking (or copying) the
+# cached file to the destination, so identical work is never decoded or
+# encoded twice. The cache is bounded in bytes and evicts the least recently
+# used entries; hits and misses are counted in stats.json next to the entries.
+# Eviction has to list the whole tree, so once over budget it frees down to
+# LOW_WATER of the budget and the next stores fit without another scan.
+#
+# Entries are hard-linked to published outputs, so a lookup must not touch
+# them: recency lives in the cache's own index (used.json), never in the
+# entries' mtimes. Lookups only append a line to access.log under a shared
+# lock, so concurrent readers do not wait for each other; the log is folded
+# into stats.json and used.json under the exclusive lock when an entry is
+# stored, when the stats are read, or once it grows past FOLD_BYTES.
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import pathlib
+import tempfile
+import contextlib
+import buffers
+import utilities
+
+DEFAULT_CACHE_DIR = pathlib.Path('~/.cache/image_processing').expanduser()
+DEFAULT_MAX_MB = 1024
+STATS_FILE = 'stats.json'
+USED_FILE = 'used.json'
+ACCESS_LOG = 'access.log'
+LOCK_FILE = '.lock'
+FOLD_BYTES = 64 * 1024
+LOW_WATER = 0.9
+
+
+def add_cache_arguments(parser):
+    """Add the cache options shared by convert and resize."""
+    parser.add_argument('--cache', nargs='?', const=str(DEFAULT_CACHE_DIR), help=f'Reuse results from a content-addressed cache (default dir: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_MB, help='Maximum cache size in megabytes before old entries are evicted')
+    parser.add_argument('--cache-stats', action='store_true', help='Print cache hit/miss statistics after the run')
+
+def from_args(args):
+    """The cache configured on the command line, or None."""
+    root = getattr(args, 'cache', None)
+    if not root:
+        return None
+    return ResultCache(root, getattr(args, 'cache_max_mb', DEFAULT_MAX_MB) * 1024 * 1024)
+
+def report(args):
+    results = from_args(args)
+    if results and getattr(args, 'cache_stats', False):
+        stats = results.stats()
+        print(f"Cache {results.root}: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['bytes'] / (1024 * 1024):.1f} MB, {stats['evictions']} evictions")
+
+def normalized_format(fmt):
+    fmt = fmt.lower().lstrip('.')
+    return 'jpg' if fmt == 'jpeg' else fmt
+
+def convert_operation(formatImg, level):
+    return {'op': 'convert', 'format': normalized_format(formatImg),
+            'level': buffers.COMPRESSION_MAP[formatImg][level]}
+
+def resize_operation(width, height, fmt, exact=False):
+    # encoder defaults, interpolation picked from the source/target sizes
+    return {'op': 'resize', 'width': width, 'height': height, 'format': normalized_format(fmt),
+            'level': None, 'interpolation': 'auto', 'decode': 'full' if exact else 'reduced'}
+
+def operation_key(source_bytes, operation):
+    """Cache key for running `operation` (a dict) on these source bytes."""
+    digest = hashlib.sha256(source_bytes).hexdigest()
+    op = hashlib.sha256(json.dumps(operation, sort_keys=True).encode()).hexdigest()
+    return f"{digest}-{op[:16]}"
+
+
+class ResultCache:
+    """On-disk LRU cache of encoded results."""
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.root = pathlib.Path(root).expanduser().resolve()
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def entry_path(self, key, ext):
+        return self.root / key[:2] / f"{key}.{ext}"
+
+    @contextlib.contextmanager
+    def locked(self, mode=fcntl.LOCK_EX):
+        with open(self.root / LOCK_FILE, 'a') as lock:
+            fcntl.flock(lock, mode)
+            yield
+
+    def read_json(self, name, default):
+        try:
+            return json.loads((self.root / name).read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return default
+
+    @contextlib.contextmanager
+    def locked_stats(self):
+        """Read-modify-write stats.json and used.json under an exclusive lock, with the access log folded in."""
+        with self.locked():
+            stats = self.read_json(STATS_FILE, {'hits': 0, 'misses': 0, 'bytes': 0, 'evictions': 0})
+            used = self.read_json(USED_FILE, {})
+            log = self.root / ACCESS_LOG
+            try:
+                lines = log.read_text().splitlines()
+            except FileNotFoundError:
+                lines = []
+            for line in lines:
+                kind, _, rest = line.partition(' ')
+                if kind == 'hit':
+                    when, _, name = rest.partition(' ')
+                    used[name] = max(used.get(name, 0), float(when))
+                    stats['hits'] += 1
+                elif kind == 'miss':
+                    stats['misses'] += 1
+            yield stats, used
+            (self.root / STATS_FILE).write_text(json.dumps(stats))
+            (self.root / USED_FILE).write_text(json.dumps(used))
+            if lines:
+                log.write_text('')
+
+    def stats(self):
+        with self.locked_stats() as (stats, _):
+            return dict(stats)
+
+    def lookup(self, key, ext):
+        """Path of the cached result or None. Counts a hit or a miss."""
+        path = self.entry_path(key, ext)
+        hit = path.exists()
+        with self.locked(fcntl.LOCK_SH), open(self.root / ACCESS_LOG, 'a') as log:
+            log.write(f"hit {time.time()} {path.name}\n" if hit else "miss\n")
+            size = log.tell()
+        if size > FOLD_BYTES:
+            with self.locked_stats():
+                pass
+        return path if hit else None
+
+    def store(self, key, ext, data):
+        """Add an encoded result and evict old entries if over budget."""
+        path = self.entry_path(key, ext)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        existed = path.exists()
+        os.replace(tmp, path)
+        with self.locked_stats() as (stats, used):
+            used[path.name] = time.time()
+            if not existed:
+                stats['bytes'] += len(data)
+            if stats['bytes'] > self.max_bytes:
+                self.evict(stats, used)
+        return path
+
+    def evict(self, stats, used):
+        """Drop least recently used entries until the cache is down to LOW_WATER of its budget. Caller holds the lock."""
+        entries = []
+        for path in self.root.glob('??/*'):
+            if path.suffix == '.tmp':
+                continue
+            st = path.stat()
+            # entries from before the index have only their mtime
+            entries.append((used.get(path.name, st.st_mtime), st.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes * LOW_WATER:
+                break
+            path.unlink(missing_ok=True)
+            used.pop(path.name, None)
+            total -= size
+            stats['evictions'] += 1
+        stats['bytes'] = total
+
+    @staticmethod
+    def materialize(entry, dest, replace=True):
+        """Put a cached result at dest, as a hard link when possible. Returns the path used."""
+        tmp = utilities.temp_path(dest)
+        tmp.unlink()
+        try:
+            os.link(entry, tmp)
+        except OSError:
+            # different filesystem or no hard links: fall back to a copy
+            shutil.copyfile(entry, tmp)
+        return utilities.publish(tmp, dest, replace)
+
+    def serve(self, key, ext, dest, replace=True):
+        """Materialize a cached result at dest. Returns the path used, or None on a miss."""
+        entry = self.lookup(key, ext)
+        if entry is None:
+            return None
+        return self.materialize(entry, dest, replace)
@@ -0,0 +1,105 @@
+#Clients for the `serve` worker
+
+# Both clients speak the JSON-lines protocol of server.py and keep one
+# connection open, so many jobs can be sent without reconnecting. This module
+# does not import cv2 and is cheap to import from other services.
+
+import json
+import socket
+import asyncio
+
+DEFAULT_SOCKET = '/tmp/image_processing.sock'
+
+
+def convert_job(source, destination=None, format=None, compression='medium', force=False):
+    return {'op': 'convert', 'source': str(source), 'destination': destination and str(destination),
+            'format': format, 'compression': compression, 'force': force}
+
+def resize_job(source, width, height, destination=None, force=False):
+    return {'op': 'resize', 'source': str(source), 'destination': destination and str(destination),
+            'width': width, 'height': height, 'force': force}
+
+
+class Client:
+    """Blocking client: every call sends one job and waits for its result."""
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(str(path))
+        self.reader = self.sock.makefile('rb')
+
+    def request(self, job):
+        self.sock.sendall(json.dumps(job).encode() + b'\n')
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection")
+        return json.loads(line)
+
+    def convert(self, source, **kwargs):
+        return self.request(convert_job(source, **kwargs))
+
+    def resize(self, source, width, height, **kwargs):
+        return self.request(resize_job(source, width, height, **kwargs))
+
+    def ping(self):
+        return self.request({'op': 'ping'})
+
+    def shutdown(self):
+        return self.request({'op': 'shutdown'})
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncClient:
+    """asyncio client. Use `await AsyncClient.connect(path)`."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, path=DEFAULT_SOCKET):
+        reader, writer = await asyncio.open_unix_connection(str(path))
+        return cls(reader, writer)
+
+    async def request(self, job):
+        # one job in flight per connection keeps results in order
+        async with self.lock:
+            self.writer.write(json.dumps(job).encode() + b'\n')
+            await self.writer.drain()
+            line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection")
+        return json.loads(line)
+
+    async def convert(self, source, **kwargs):
+        return await self.request(convert_job(source, **kwargs))
+
+    async def resize(self, source, width, height, **kwargs):
+        return await self.request(resize_job(source, width, height, **kwargs))
+
+    async def ping(self):
+        return await self.request({'op': 'ping'})
+
+    async def shutdown(self):
+        return await self.request({'op': 'shutdown'})
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
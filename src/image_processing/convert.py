@@ -1,35 +1,89 @@
 import sys
 import argparse
-import cv2
-import pathlib
+import cache
+import dedupe
+import manifest
+import outputs
+import stream
+import profiling
+import buffers
 import utilities
 
 def convertimage(args, formatImg):
-    realDest = utilities.givecorrectdestination(args.destination, args.force)
-    img = cv2.imread(args.source)
-    ok = cv2.imwrite(realDest, img, [args.format, args.compression])
-    if not ok:
-        utilities.error(f"Failed to write image to {realDest}")
-    print(f"\033[32mImage converted successfully: {realDest} to the format {formatImg}\033[0m")
+    output = outputs.Output(args, operation(args, formatImg), formatImg,
+                            lambda dest, note=None: report_success(dest, formatImg, cached=note == 'cached'))
+    if output.prepare():
+        return output.dest
+    return output.write(convert_bytes(args, formatImg, output.source_bytes, output.dest, output.decoded))
+
+def convert_bytes(args, formatImg, source_bytes, realDest, img=None):
+    """Decode the source bytes (unless img is their decode already) and encode them as formatImg (no file access)."""
+    if unchanged(args, formatImg, source_bytes):
+        return source_bytes
+    if img is None:
+        try:
+            with profiling.stage('decode'):
+                img = buffers.decode_unchanged(source_bytes)
+        except ValueError:
+            utilities.error(f"Could not read the source image: {args.source}")
+    try:
+        return encode_image(args, img, formatImg)
+    except ValueError as e:
+        utilities.error(f"Failed to write image to {realDest}: {e}")
+
+def unchanged(args, formatImg, source_bytes):
+    """True if the source is already formatImg at the -c level, so its bytes are the result."""
+    if searching(args):
+        return False
+    with profiling.stage('probe'):
+        try:
+            header = buffers.probe(source_bytes)
+        except ValueError:
+            return False
+        return buffers.is_noop(header, formatImg, args.compression)
+
+def searching(args):
+    return getattr(args, 'target_bytes', None) is not None or getattr(args, 'max_quality_loss', None) is not None
+
+def encode_image(args, img, formatImg):
+    """Encode at the -c level, or search for the setting that meets --target-bytes/--max-quality-loss."""
+    if not searching(args):
+        with profiling.stage('encode'):
+            return buffers.encode(img, formatImg, args.compression)
+    with profiling.stage('search'):
+        data, setting = buffers.encode_for_target(img, formatImg, args.target_bytes, args.max_quality_loss)
+    if setting is not None:
+        name = 'quality' if formatImg in ('jpg', 'jpeg') else 'compression'
+        print(f"Chose {name} {setting}: {len(data)} bytes", file=sys.stderr)
+    return data
+
+def operation(args, formatImg):
+    """What the cache and the manifest know about this conversion."""
+    op = cache.convert_operation(formatImg, args.compression)
+    if searching(args):
+        op.update(level=None, target_bytes=args.target_bytes, max_quality_loss=args.max_quality_loss)
+    return op
+
+def report_success(realDest, formatImg, cached=False):
+    note = " (cached)" if cached else ""
+    utilities.info(f"\033[32mImage converted successfully: {realDest} to the format {formatImg}{note}\033[0m")
 
 def validatecommandsandconvert(args):
+    with profiling.stage('validate'):
+        formatImg = validateconversionargs(args)
+    return convertimage(args, formatImg)
+
+def validateconversionargs(args):
     #VALIDATE INPUT
     formatImg = utilities.determineformat(args)
     utilities.validate_supported_format_string(formatImg, "format")
-
-    inputFormat = formatImg
-    match inputFormat:
-        case 'png':
-            inputFormat = cv2.IMWRITE_PNG_COMPRESSION
-        case 'tiff':
-            inputFormat = cv2.IMWRITE_TIFF_COMPRESSION
-        case 'jpg' | 'jpeg':
-            inputFormat = cv2.IMWRITE_JPEG_QUALITY
-        case _:
-            inputFormat = cv2.IMWRITE_PNG_COMPRESSION #SHOULD NOT HAPPEN ANYWAY
+    utilities.validate_compression(formatImg, args.compression)
+    if searching(args) and formatImg not in SEARCH_FORMATS:
+        utilities.error(f"--target-bytes and --max-quality-loss need a JPEG or PNG output, not {formatImg}")
 
     args.source = utilities.normalize_source(args.source)
     utilities.validate_supported_format(args.source, "source")
+    utilities.probe_source(args.source)
 
     if args.destination:
         suffix = f".{formatImg}"
@@ -39,37 +93,22 @@ def validatecommandsandconvert(args):
     args.destination = utilities.prepare_destination(args.destination, args.source, suffix)
     utilities.validate_supported_format(args.destination, "destination")
 
-    args.format = inputFormat
-    COMPRESSION_MAP = {
-            'png': {
-                        'low': 1,
-                        'medium': 5,
-                        'high': 9,
-                    },
-            'jpg': {
-                        'low': 95,
-                        'medium': 85,
-                        'high': 70,
-                    },
-            'jpeg': {
-                        'low': 95,
-                        'medium': 85,
-                        'high': 70,
-                    },
-            'tiff': {
-                        'low': 1,
-                        'medium': 5,   # LZW
-                        'high': 8,     # Deflate
-                    }
-    }
-    args.compression = COMPRESSION_MAP[formatImg][args.compression]
-    convertimage(args, formatImg)
+    args.format = formatImg
+    return formatImg
+
+SEARCH_FORMATS = ('jpg', 'jpeg', 'png')
 
 def parseimageconversionargs(subparsers, parent):
     #IMAGE CONVERSION
     convert_parser = subparsers.add_parser('convert', help='Convert image format', parents=[parent])
-    convert_parser.add_argument('-s', '--source', type=utilities.valid_file, required=True, help='Source image')
-    convert_parser.add_argument('-d', '--destination', help='Destination image.')
+    convert_parser.add_argument('-s', '--source', type=utilities.valid_source, nargs='+', required=True, help='Source image(s), directory, glob, .txt file list or - for stdin')
+    convert_parser.add_argument('-d', '--destination', help='Destination image, or - for stdout.')
     convert_parser.add_argument('-f', '--format', help='Output format.')
-    LEVELS = ('low', 'medium', 'high')
-    convert_parser.add_argument('-c', '--compression', choices=LEVELS, default='medium', help='Compression level (low, medium, high')
+    convert_parser.add_argument('-c', '--compression', choices=utilities.COMPRESSION_LEVELS, default='medium', help='Compression level (low, medium, high; lossless for WebP)')
+    convert_parser.add_argument('--target-bytes', type=utilities.byte_size, help='Best quality that fits this many bytes (e.g. 200000, 200K, 1.5M); overrides -c')
+    convert_parser.add_argument('--max-quality-loss', type=utilities.non_negative_float, metavar='PERCENT', help='Smallest JPEG whose loss, 100 * (1 - SSIM), stays within PERCENT; overrides -c')
+    utilities.add_batch_arguments(convert_parser)
+    cache.add_cache_arguments(convert_parser)
+    dedupe.add_dedupe_arguments(convert_parser)
+    manifest.add_incremental_arguments(convert_parser)
+    stream.add_stream_arguments(convert_parser)
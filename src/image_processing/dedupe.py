@@ -0,0 +1,164 @@
+#Near-duplicate sources: reuse the output of a visually identical image
+
+# The result cache only matches identical bytes. Re-uploads of the same photo
+# (re-saved JPEGs, stripped metadata) have different bytes but the same
+# pixels, give or take compression noise. With --dedupe INDEX every written
+# output is recorded in a SQLite file under the perceptual fingerprint of its
+# source (buffers.fingerprint). A later source whose hash is within
+# --dedupe-distance bits of a recorded one, with the same size, layout and
+# mean colour and the same operation, gets that output linked or copied
+# instead of being decoded and encoded.
+#
+# Lookups use multi-index hashing: the 64-bit hash is split into CHUNKS
+# 16-bit chunks with an index each. Two hashes at most d bits apart have at
+# least one chunk at most d // CHUNKS bits apart (pigeonhole), so a search
+# only probes the few chunk values that close and checks the full distance of
+# those candidates. With the default distance every probe is an exact match
+# on an indexed column, which stays fast at millions of entries.
+
+import os
+import json
+import argparse
+import pathlib
+import itertools
+import collections
+import cache
+import buffers
+import utilities
+
+CHUNKS = 4
+CHUNK_BITS = buffers.HASH_BITS // CHUNKS
+DEFAULT_DISTANCE = 3
+MAX_DISTANCE = 3 * CHUNKS - 1
+# mean colours further apart than this (0-255 units, per channel) are different images
+COLOUR_TOLERANCE = 6
+
+SCHEMA = ['''CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    grp TEXT NOT NULL,
+    hash INTEGER NOT NULL,
+    colour TEXT NOT NULL,
+    source TEXT NOT NULL,
+    output TEXT NOT NULL UNIQUE,
+    c0 INTEGER NOT NULL,
+    c1 INTEGER NOT NULL,
+    c2 INTEGER NOT NULL,
+    c3 INTEGER NOT NULL
+)'''] + [f'CREATE INDEX IF NOT EXISTS sources_c{i} ON sources (grp, c{i})' for i in range(CHUNKS)]
+
+Key = collections.namedtuple('Key', 'group hash colour')
+Match = collections.namedtuple('Match', 'source output distance')
+
+
+def add_dedupe_arguments(parser):
+    parser.add_argument('--dedupe', metavar='INDEX', help='Reuse the output of a near-duplicate source recorded in this index (SQLite)')
+    parser.add_argument('--dedupe-distance', type=distance_value, default=DEFAULT_DISTANCE,
+                        help=f'Most differing bits of the 64-bit perceptual hash for a near-duplicate (0-{MAX_DISTANCE})')
+
+def distance_value(text):
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text} is not a whole number")
+    if not 0 <= value <= MAX_DISTANCE:
+        raise argparse.ArgumentTypeError(f"The distance must be between 0 and {MAX_DISTANCE}")
+    return value
+
+def from_args(args):
+    """The duplicate index configured on the command line, or None."""
+    path = getattr(args, 'dedupe', None)
+    if not path:
+        return None
+    return DuplicateIndex(path, getattr(args, 'dedupe_distance', DEFAULT_DISTANCE))
+
+def report_duplicate(output, match):
+    utilities.info(f"\033[33mNear-duplicate of {match.source} ({match.distance} bits apart), reused: {output}\033[0m")
+
+def chunks(value):
+    mask = (1 << CHUNK_BITS) - 1
+    return [(value >> (CHUNK_BITS * i)) & mask for i in range(CHUNKS)]
+
+def neighbours(chunk, radius):
+    """Every CHUNK_BITS-bit value at most radius bits away from chunk."""
+    values = []
+    for r in range(radius + 1):
+        for bits in itertools.combinations(range(CHUNK_BITS), r):
+            flipped = chunk
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+def signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class DuplicateIndex:
+    """SQLite file of the outputs written so far, by the fingerprint of their source."""
+
+    def __init__(self, path, max_distance=DEFAULT_DISTANCE):
+        import sqlite3  # convert and resize import this module on every run
+        path = pathlib.Path(path).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # every batch worker records its outputs here while others look up theirs: WAL keeps the
+        # lookups from waiting on a write, and the async engine hands the index between threads
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.max_distance = max_distance
+
+    def key(self, source_bytes, operation, img=None):
+        """Where this source and operation go in the index; None if the source cannot be hashed.
+
+        img is the source already decoded (buffers.shared_decode), if there is one.
+        """
+        try:
+            fp = buffers.fingerprint(source_bytes, img)
+        except ValueError:
+            return None  # left to the decoder to report
+        # only sources of the same size and layout, run through the same operation, share outputs
+        group = json.dumps([operation, fp.width, fp.height, fp.channels], sort_keys=True)
+        return Key(group, fp.dhash, fp.colour)
+
+    def candidates(self, key):
+        """Rows of the group that share a chunk (within the probe radius) with the key."""
+        radius = self.max_distance // CHUNKS
+        queries, params = [], []
+        for i, chunk in enumerate(chunks(key.hash)):
+            probes = neighbours(chunk, radius)
+            queries.append(f"SELECT hash, colour, source, output FROM sources WHERE grp = ? AND c{i} IN ({', '.join('?' * len(probes))})")
+            params += [key.group, *probes]
+        return self.db.execute(' UNION '.join(queries), params).fetchall()
+
+    def find(self, key):
+        """The closest recorded source whose output still exists, or None."""
+        matches = []
+        for stored, colour, source, output in self.candidates(key):
+            distance = buffers.hamming(stored & ((1 << 64) - 1), key.hash)
+            if distance > self.max_distance:
+                continue
+            if max(abs(a - b) for a, b in zip(json.loads(colour), key.colour)) > COLOUR_TOLERANCE:
+                continue
+            matches.append(Match(source, output, distance))
+        for match in sorted(matches, key=lambda m: m.distance):
+            if os.path.exists(match.output):
+                return match
+        return None
+
+    def serve(self, key, dest, replace=True):
+        """Put the output of a near-duplicate at dest. Returns (path, match), or None if there is none."""
+        match = self.find(key) if key else None
+        if match is None:
+            return None
+        if os.path.abspath(match.output) == os.path.abspath(dest):
+            return pathlib.Path(dest), match
+        return cache.ResultCache.materialize(match.output, dest, replace), match
+
+    def record(self, key, source, output):
+        if key is None:
+            return
+        self.db.execute('INSERT OR REPLACE INTO sources (grp, hash, colour, source, output, c0, c1, c2, c3) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (key.group, signed(key.hash), json.dumps(key.colour), str(source), str(output), *chunks(key.hash)))
@@ -0,0 +1,219 @@
+#Blur, sharpen and recolour
+
+# The filter options run a chain of steps, in the order given, on the decoded
+# image before it is encoded:
+#
+#   filter -s photo.jpg --sharpen 0.8 --gamma 1.1 --recolour 1.05,1,0.95
+#   resize -s photo.jpg --width 800 --height 600 --sharpen 0.5
+#
+# `filter` is resize without a size (--width/--height are optional), so both
+# commands go through the same read -> decode -> (resize) -> filter -> encode
+# path, with a single decode and a single encode, and share batch mode, the
+# cache and --incremental.
+#
+# filter_array() runs a chain of steps such as
+#
+#   [['blur', 2.0], ['sharpen', [1.5, 1.0]], ['gamma', 1.2], ['levels', [16, 235]], ['recolour', [1.1, 1.0, 0.9]]]
+#
+# in place on a decoded array. Point operations (gamma, levels, recolour) that
+# follow each other are composed into one lookup table per channel and applied
+# in a single cv2.LUT pass; consecutive blurs add up into one Gaussian. Blurs
+# and unsharp masks use separable kernels (two 1-D passes instead of one 2-D
+# pass). Alpha channels are never recoloured. Levels are given in 0-255 units
+# and scaled for 16-bit images.
+#
+# filter_array() only needs cv2 and NumPy (through buffers), so it is also
+# exported by the in-memory API (see __init__.py); the command-line modules are
+# imported by the functions that build the filter command.
+
+import argparse
+try:
+    from . import buffers  # imported as image_processing.filters
+except ImportError:
+    import buffers
+
+cv2 = buffers.cv2
+np = buffers.np
+
+FILTER_HELP = {
+    'blur': ('SIGMA', 'Gaussian blur with this standard deviation in pixels'),
+    'sharpen': ('AMOUNT[,SIGMA]', 'Unsharp mask: add AMOUNT times the detail finer than SIGMA (default 1) pixels'),
+    'gamma': ('GAMMA', 'Gamma correction: out = in ** (1 / GAMMA), so above 1 brightens'),
+    'levels': ('LOW,HIGH', 'Stretch LOW..HIGH (0-255) to the full range'),
+    'recolour': ('R,G,B', 'Multiply the red, green and blue channels by these gains'),
+}
+
+
+class FilterStep(argparse.Action):
+    """Append [name, value] to args.filters, keeping the order of the options."""
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        steps = list(getattr(namespace, 'filters', None) or [])
+        steps.append([self.const, values])
+        namespace.filters = steps
+
+
+def add_filter_arguments(parser):
+    parsers = {
+        'blur': positive_float,
+        'sharpen': sharpen_value,
+        'gamma': positive_float,
+        'levels': levels_value,
+        'recolour': gains_value,
+    }
+    for name, value_type in parsers.items():
+        metavar, help_text = FILTER_HELP[name]
+        parser.add_argument(f'--{name}', dest='filters', action=FilterStep, const=name, type=value_type,
+                            metavar=metavar, help=help_text)
+    parser.set_defaults(filters=None)
+
+def add_filter_command(subparsers, parent):
+    """Add the filter command: the resize path without a size."""
+    import cache
+    import dedupe
+    import manifest
+    import utilities
+    filter_parser = subparsers.add_parser('filter', help='Blur, sharpen or recolour an image', parents=[parent])
+    filter_parser.add_argument('-s', '--source', type=utilities.valid_source, nargs='+', required=True, help='Source image(s), directory, glob or .txt file list')
+    filter_parser.add_argument('-d', '--destination', help='Destination image.')
+    filter_parser.add_argument('--width', type=int, help='Also resize to this width (needs --height)')
+    filter_parser.add_argument('--height', type=int, help='Also resize to this height (needs --width)')
+    utilities.add_batch_arguments(filter_parser)
+    filter_parser.add_argument('--exact', action='store_true', help='Always decode at full resolution (no reduced JPEG decode for large downscales)')
+    add_filter_arguments(filter_parser)
+    cache.add_cache_arguments(filter_parser)
+    dedupe.add_dedupe_arguments(filter_parser)
+    manifest.add_incremental_arguments(filter_parser)
+
+def positive_float(text):
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text} is not a number")
+    if value <= 0:
+        raise argparse.ArgumentTypeError("The value must be positive")
+    return value
+
+def numbers(text, count):
+    parts = text.split(',')
+    if len(parts) not in count:
+        raise argparse.ArgumentTypeError(f"Expected {' or '.join(map(str, count))} comma-separated numbers, got {text!r}")
+    try:
+        return [float(p) for p in parts]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text} is not a list of numbers")
+
+def sharpen_value(text):
+    values = numbers(text, (1, 2))
+    amount, sigma = values[0], values[1] if len(values) == 2 else 1.0
+    if amount <= 0 or sigma <= 0:
+        raise argparse.ArgumentTypeError("The amount and sigma must be positive")
+    return [amount, sigma]
+
+def levels_value(text):
+    low, high = numbers(text, (2,))
+    if not 0 <= low < high <= 255:
+        raise argparse.ArgumentTypeError("Levels need 0 <= LOW < HIGH <= 255")
+    return [low, high]
+
+def gains_value(text):
+    gains = numbers(text, (3,))
+    if min(gains) < 0:
+        raise argparse.ArgumentTypeError("Gains must not be negative")
+    return gains
+
+def validate_filter_arguments(args):
+    """The filter command needs a step, and a size is all or nothing."""
+    import utilities
+    if not getattr(args, 'filters', None):
+        utilities.error(f"Give at least one filter: {', '.join('--' + name for name in FILTER_HELP)}")
+    if (args.width is None) != (args.height is None):
+        utilities.error("--width and --height go together.")
+
+# Filter chain
+
+FILTER_STEPS = ('blur', 'sharpen', 'gamma', 'levels', 'recolour')
+POINT_STEPS = ('gamma', 'levels', 'recolour')
+
+
+def gaussian_kernel(sigma):
+    size = 2 * max(1, int(3 * sigma + 0.5)) + 1
+    return cv2.getGaussianKernel(size, sigma)
+
+def _point_curve(step, value, table, channels):
+    """Apply one point operation to the normalized [0, 1] table (levels x channels)."""
+    color = table[:, :3] if channels == 4 else table
+    match step:
+        case 'gamma':
+            np.power(color, 1.0 / value, out=color)
+        case 'levels':
+            low, high = value[0] / 255, value[1] / 255
+            np.clip((color - low) / (high - low), 0.0, 1.0, out=color)
+        case 'recolour':
+            if channels < 3:
+                raise ValueError("recolour needs a colour image")
+            # gains are given as R,G,B; cv2 keeps channels as B,G,R
+            for index, gain in zip((2, 1, 0), value):
+                np.clip(table[:, index] * gain, 0.0, 1.0, out=table[:, index])
+
+def plan_filters(steps, dtype, channels):
+    """Fuse the steps into passes: ('lut', table), ('blur', sigma) or ('sharpen', amount, sigma)."""
+    passes = []
+    for step, value in steps:
+        if step not in FILTER_STEPS:
+            raise ValueError(f"Unknown filter: {step}")
+        if step in POINT_STEPS:
+            if not passes or passes[-1][0] != 'lut':
+                if dtype not in (np.uint8, np.uint16):
+                    raise ValueError(f"{step} needs 8- or 16-bit samples, not {dtype}")
+                levels = np.iinfo(dtype).max + 1
+                identity = np.linspace(0.0, 1.0, levels)[:, None]
+                passes.append(('lut', np.repeat(identity, channels, axis=1)))
+            _point_curve(step, value, passes[-1][1], channels)
+        elif step == 'blur':
+            if passes and passes[-1][0] == 'blur':
+                # two Gaussians in a row are one Gaussian
+                value = (passes.pop()[1] ** 2 + value ** 2) ** 0.5
+            passes.append(('blur', value))
+        else:
+            amount, sigma = value
+            passes.append(('sharpen', amount, sigma))
+    return [finish_table(p, dtype) if p[0] == 'lut' else p for p in passes]
+
+def finish_table(lut_pass, dtype):
+    table = lut_pass[1]
+    peak = np.iinfo(dtype).max
+    return 'lut', np.rint(table * peak).astype(dtype)
+
+def filter_array(img, steps):
+    """Run a filter chain on a decoded image, in place where cv2 allows it. Returns the image."""
+    if not steps:
+        return img
+    if not img.flags.writeable:
+        img = img.copy()
+    channels = img.shape[2] if img.ndim == 3 else 1
+    for kind, *params in plan_filters(steps, img.dtype, channels):
+        match kind:
+            case 'blur':
+                kernel = gaussian_kernel(params[0])
+                cv2.sepFilter2D(img, -1, kernel, kernel, dst=img, borderType=cv2.BORDER_REFLECT_101)
+            case 'sharpen':
+                amount, sigma = params
+                kernel = gaussian_kernel(sigma)
+                blurred = cv2.sepFilter2D(img, -1, kernel, kernel, borderType=cv2.BORDER_REFLECT_101)
+                # unsharp mask: img + amount * (img - blurred), saturated to the sample range
+                cv2.addWeighted(img, 1.0 + amount, blurred, -amount, 0, dst=img)
+            case 'lut':
+                apply_table(img, params[0])
+    return img
+
+def apply_table(img, table):
+    if img.dtype == np.uint8:
+        # cv2.LUT takes one table per channel as a 256 x 1 image with that many channels
+        lut = table[:, 0] if img.ndim == 2 else np.ascontiguousarray(table).reshape(256, 1, -1)
+        cv2.LUT(img, lut, dst=img)
+    elif img.ndim == 2:
+        np.take(table[:, 0], img, out=img)
+    else:
+        for c in range(img.shape[2]):
+            img[..., c] = table[img[..., c], c]
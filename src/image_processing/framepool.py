@@ -0,0 +1,120 @@
+#Shared-memory frame pool
+
+# Worker processes that get a decoded image as a task argument receive a
+# pickled copy of every pixel: tens of MB per image and per worker. A
+# FramePool is one multiprocessing.shared_memory block cut into fixed-size
+# slots. The owner copies a decoded frame into a free slot with put() and
+# passes the small FrameHandle to workers, which map the slot with frame()
+# and read the pixels in place. release() hands the slot back for the next
+# frame; put() waits while every slot is in use, which bounds the memory of a
+# producer that runs ahead of its workers.
+#
+# Lifetime: the process that creates the pool owns the block and must close()
+# it (or use it as a context manager), which also unlinks it. Workers only
+# attach: they map each block once and keep it until they exit.
+
+import threading
+import collections
+import buffers
+
+np = buffers.np
+
+FrameHandle = collections.namedtuple('FrameHandle', 'pool slot offset shape dtype')
+
+# blocks this (worker) process has attached to: {name: SharedMemory}
+_attached = {}
+
+
+class FramePool:
+    """Fixed-size slots for decoded frames in one shared-memory block."""
+
+    def __init__(self, slots, slot_bytes):
+        from multiprocessing import shared_memory  # only for commands that use worker processes
+        if slots <= 0 or slot_bytes <= 0:
+            raise ValueError("A frame pool needs at least one slot of at least one byte")
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.name = self.shm.name
+        self.free = list(range(slots - 1, -1, -1))
+        self.available = threading.Condition()
+        self.puts = 0
+        self.waits = 0
+        self.peak = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def put(self, img, timeout=None):
+        """Copy a frame into a free slot and return its handle; waits while the pool is full."""
+        img = np.ascontiguousarray(img)
+        if img.nbytes > self.slot_bytes:
+            raise ValueError(f"A {img.nbytes}-byte frame does not fit in {self.slot_bytes}-byte slots")
+        with self.available:
+            if not self.free:
+                self.waits += 1
+                if not self.available.wait_for(lambda: self.free, timeout):
+                    raise TimeoutError(f"No free slot in the frame pool after {timeout} s")
+            slot = self.free.pop()
+            self.puts += 1
+            self.peak = max(self.peak, self.in_use)
+        handle = FrameHandle(self.name, slot, slot * self.slot_bytes, img.shape, img.dtype.str)
+        slot_array(self.shm.buf, handle)[...] = img
+        return handle
+
+    def release(self, handle):
+        """Hand a slot back once no worker reads its frame any more."""
+        with self.available:
+            if handle.pool != self.name or handle.slot in self.free:
+                raise ValueError(f"Slot {handle.slot} of {handle.pool} is not in use in this pool")
+            self.free.append(handle.slot)
+            self.available.notify()
+
+    @property
+    def in_use(self):
+        return self.slots - len(self.free)
+
+    def stats(self):
+        """Occupancy of the pool, for logs and --pool-stats."""
+        with self.available:
+            return {
+                'slots': self.slots,
+                'slot_bytes': self.slot_bytes,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak,
+                'puts': self.puts,
+                'waits': self.waits,
+            }
+
+    def close(self):
+        """Free the block. Frames still mapped by workers stay valid until they exit."""
+        if self.shm is None:
+            return
+        _attached.pop(self.name, None)
+        self.shm.unlink()
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # arrays over the block are still alive here; it is unmapped when they go
+        self.shm = None
+
+
+def slot_array(buf, handle):
+    count = int(np.prod(handle.shape, dtype=np.int64))
+    return np.frombuffer(buf, dtype=handle.dtype, count=count, offset=handle.offset).reshape(handle.shape)
+
+def frame(handle):
+    """The frame behind a handle, mapped read-only from the shared block (no copy)."""
+    if handle.pool not in _attached:
+        from multiprocessing import shared_memory
+        _attached[handle.pool] = shared_memory.SharedMemory(name=handle.pool)
+    img = slot_array(_attached[handle.pool].buf, handle)
+    img.flags.writeable = False
+    return img
+
+def format_stats(stats):
+    return (f"Frame pool: {stats['peak_in_use']}/{stats['slots']} slot(s) in use at peak, "
+            f"{stats['slot_bytes'] / 1024 ** 2:.1f} MB each, {stats['puts']} frame(s), {stats['waits']} wait(s)")
@@ -0,0 +1,165 @@
+#Job descriptors and bulk processing
+
+# A job descriptor is a flat dict such as
+#
+#   {"op": "resize", "source": "a.jpg", "destination": "out/a.jpg", "width": 320, "height": 240}
+#   {"op": "convert", "source": "b.png", "format": "jpg", "compression": "high"}
+#
+# The socket server takes them as JSON lines. `bulk` reads a whole file of
+# them, as JSON lines or as CSV with a header row using the same field names,
+# and runs every row through the same validation as the convert/resize
+# commands in a pool of worker processes. Rows are read lazily and only a few
+# jobs per worker are in flight, and every result is appended to a JSON-lines
+# report as soon as it is ready, so a manifest of a million rows runs in
+# constant memory.
+
+import os
+import sys
+import csv
+import json
+import argparse
+import contextlib
+import batch
+import buffers
+import profiling
+import utilities
+
+JOB_DEFAULTS = {
+    'convert': {'destination': None, 'format': None, 'compression': 'medium', 'force': False},
+    'resize': {'destination': None, 'width': None, 'height': None, 'force': False},
+}
+INT_FIELDS = ('width', 'height')
+BOOL_FIELDS = ('force',)
+# extra fields a descriptor may carry that are passed back in its result
+PASSTHROUGH_FIELDS = ('id',)
+IN_FLIGHT_PER_WORKER = 4
+
+
+def add_bulk_arguments(subparsers, parent):
+    """Add arguments for the bulk command."""
+    bulk_parser = subparsers.add_parser('bulk', help='Run convert/resize jobs from a CSV or JSON-lines file', parents=[parent])
+    bulk_parser.add_argument('-i', '--input', required=True, help='Job file (.csv, .jsonl), or - for JSON lines on stdin')
+    bulk_parser.add_argument('--input-format', choices=('jsonl', 'csv'), help='Format of the job file (default: from its extension)')
+    bulk_parser.add_argument('--report', default='-', help='Where to append the JSON-lines report (default: stdout)')
+    utilities.add_jobs_argument(bulk_parser)
+
+def job_namespace(job):
+    """Turn a job descriptor into the namespace convert/resize expect."""
+    if not isinstance(job, dict):
+        raise ValueError("A job must be an object")
+    op = job.get('op')
+    if op not in JOB_DEFAULTS:
+        raise ValueError(f"Unknown op: {op!r} (expected one of {', '.join(JOB_DEFAULTS)})")
+    if not job.get('source'):
+        raise ValueError("Missing 'source'")
+    fields = dict(JOB_DEFAULTS[op])
+    unknown = set(job) - set(fields) - {'op', 'source', *PASSTHROUGH_FIELDS}
+    if unknown:
+        raise ValueError(f"Unknown field(s) for {op}: {', '.join(sorted(unknown))}")
+    fields.update({k: job[k] for k in fields if k in job})
+    # JSON values reach here as they were sent; CSV cells went through parse_csv_row
+    for key in INT_FIELDS:
+        value = fields.get(key)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value <= 0):
+            raise ValueError(f"{key} must be a positive integer, got {value!r}")
+    for key in BOOL_FIELDS:
+        if not isinstance(fields[key], bool):
+            raise ValueError(f"{key} must be true or false, got {fields[key]!r}")
+    return argparse.Namespace(command=op, source=job['source'], **fields)
+
+def parse_csv_row(row):
+    """CSV cells are strings: drop empty ones and convert numbers and booleans."""
+    job = {k.strip(): v.strip() for k, v in row.items() if k and v is not None and v.strip()}
+    for key in INT_FIELDS:
+        if key in job:
+            try:
+                job[key] = int(job[key])
+            except ValueError:
+                raise ValueError(f"{key} must be an integer, got {job[key]!r}")
+    for key in BOOL_FIELDS:
+        if key in job:
+            job[key] = job[key].lower() in ('1', 'true', 'yes', 'y')
+    return job
+
+def read_jobs(stream, fmt):
+    """Yield (line number, descriptor or ValueError) for every row, one at a time."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            try:
+                yield reader.line_num, parse_csv_row(row)
+            except ValueError as e:
+                yield reader.line_num, e
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, ValueError(f"Invalid JSON: {e}")
+
+def input_format(args):
+    if args.input_format:
+        return args.input_format
+    return 'csv' if utilities.get_extension(args.input) == 'csv' else 'jsonl'
+
+@contextlib.contextmanager
+def open_stream(path, mode):
+    if path == '-':
+        yield sys.stdin if 'r' in mode else sys.stdout
+        return
+    with open(path, mode, newline='' if 'r' in mode else None) as f:
+        yield f
+
+def quiet_worker(threads=None):
+    # per-image messages would end up in the middle of a report written to stdout
+    sys.stdout = open(os.devnull, 'w')
+    buffers.set_threads(threads)
+
+def run_bulk(args):
+    """Run every job of the input file; returns the number of failed jobs."""
+    import concurrent.futures  # keeps startup cheap for the other commands
+    recorder = profiling.Recorder.from_args(args)
+    # the number of jobs is not known before the input has been read
+    workers, threads = utilities.split_cores(utilities.available_cpus(), getattr(args, 'jobs', None), sys.maxsize,
+                                             cv_threads=getattr(args, 'cv_threads', 'auto'))
+    total = failures = 0
+
+    def write(line, job, command, result):
+        nonlocal total, failures
+        total += 1
+        result = {'line': line, **{k: job[k] for k in PASSTHROUGH_FIELDS if isinstance(job, dict) and k in job}, **result}
+        recorder.add(command, result)
+        result.pop('cprofile', None)
+        if not result['ok']:
+            failures += 1
+        report.write(json.dumps(result) + '\n')
+
+    def collect(futures):
+        for future in futures:
+            line, job, command = pending.pop(future)
+            write(line, job, command, future.result())
+
+    with open_stream(args.input, 'r') as stream, open_stream(args.report, 'a') as report, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=quiet_worker, initargs=(threads,)) as pool:
+        pending = {}
+        for line, job in read_jobs(stream, input_format(args)):
+            try:
+                if isinstance(job, ValueError):
+                    raise job
+                ns = job_namespace(job)
+            except ValueError as e:
+                source = job.get('source') if isinstance(job, dict) else None
+                write(line, job, 'invalid', {'source': source, 'ok': False, 'error': str(e)})
+                continue
+            ns.force = ns.force or args.force
+            ns.cprofile = args.cprofile
+            pending[pool.submit(batch.run_one, ns.command, ns)] = (line, job, ns.command)
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                collect(done)
+        collect(concurrent.futures.as_completed(list(pending)))
+    recorder.close()
+    print(f"Processed {total} job(s): {total - failures} succeeded, {failures} failed", file=sys.stderr)
+    return failures
@@ -1,27 +1,62 @@
 import sys
 import argparse
-import cv2
-import pathlib
+import batch
+import cache
+import profiling
 import resize
+import server
+import stream
+import pipeline
+import jobs
+import renditions
+import filters
 import convert
 import utilities
 
+# cv2 and NumPy are only imported once an image is actually decoded or encoded
+# (see buffers.LazyModule), so --help and argument errors start fast.
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    common = utilities.generalargs()
+    subparsers = parser.add_subparsers(dest='command')
+    convert.parseimageconversionargs(subparsers, common)
+    resize.add_resize_arguments(subparsers, common)
+    filters.add_filter_command(subparsers, common)
+    server.add_serve_arguments(subparsers, common)
+    pipeline.add_pipeline_arguments(subparsers, common)
+    renditions.add_renditions_arguments(subparsers, common)
+    jobs.add_bulk_arguments(subparsers, common)
+    return parser
+
 #Main here
-parser = argparse.ArgumentParser()
-common = utilities.generalargs()
-subparsers = parser.add_subparsers(dest='command')
-convert.parseimageconversionargs(subparsers, common)
-resize.add_resize_arguments(subparsers, common)
-args = parser.parse_args()
-def main():
+def main(argv=None):
+    args = build_parser().parse_args(argv)
     if args.command is None:
         sys.exit("Please provide some arguments.")
+    utilities.apply_execution(args)
+    if args.command in ('convert', 'resize', 'filter'):
+        # single images go through the same job runner as batches so both report stages
+        recorder = profiling.Recorder.from_args(args)
+        if stream.is_stream(args):
+            failures = stream.run(args, recorder)
+        elif batch.is_batch(args.source) or batch.is_distributed(args):
+            failures = batch.run_batch(args, recorder)
+        else:
+            args.source = args.source[0]
+            failures = batch.run_single(args, recorder)
+        recorder.close()
+        cache.report(args)
+        sys.exit(1 if failures else 0)
     match args.command:
-        case 'convert':
-            convert.validatecommandsandconvert(args) #Easier for now to have it in one function
-        case 'resize':
-            resize.validate_resize_arguments(args)
-            resize.resize_image(args)
+        case 'pipeline':
+            pipeline.pipeline_from_args(args)
+        case 'renditions':
+            renditions.renditions_from_args(args)
+        case 'bulk':
+            sys.exit(1 if jobs.run_bulk(args) else 0)
+        case 'serve':
+            server.serve(args)
         case _:
             print("Argument not recognized.")
 
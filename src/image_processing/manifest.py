@@ -0,0 +1,129 @@
+#Incremental mode: skip sources whose output is up to date
+
+# With --incremental MANIFEST every finished image is recorded in a SQLite file:
+# source path, operation (the cache operation plus the requested destination),
+# source mtime/size/SHA-256 and the output path. On the next run an image whose
+# source still has the same mtime and size, and whose output still exists, is
+# skipped after one stat() and one primary-key lookup. If only the mtime changed
+# (a touch or a fresh checkout) the SHA-256 decides. A changed source is written
+# over its previous output instead of getting a new name_1.png.
+#
+# Each process opens a manifest once (open_manifest) and every job and thread
+# in it shares that connection.
+
+import os
+import json
+import hashlib
+import pathlib
+import functools
+import threading
+import utilities
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS outputs (
+    source TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    output TEXT NOT NULL,
+    PRIMARY KEY (source, operation)
+)'''
+
+
+def add_incremental_arguments(parser):
+    parser.add_argument('--incremental', metavar='MANIFEST', help='Skip images whose output recorded in this manifest (SQLite) is up to date')
+
+def entry(args, operation):
+    """The manifest entry for this job, or None without --incremental."""
+    path = getattr(args, 'incremental', None)
+    if not path:
+        return None
+    key = json.dumps(dict(operation, destination=str(args.destination)), sort_keys=True)
+    return Entry(open_manifest(os.path.abspath(os.path.expanduser(path))), pathlib.Path(args.source), key)
+
+def open_manifest(path):
+    """The Manifest at this absolute path, opened once per process."""
+    # keyed by pid too: a forked batch worker must not share its parent's connection
+    return _open_manifest(path, os.getpid())
+
+@functools.lru_cache(maxsize=None)
+def _open_manifest(path, pid):
+    return Manifest(path)
+
+def report_skip(output):
+    utilities.info(f"\033[33mUp to date, skipped: {output}\033[0m")
+
+
+class Manifest:
+    """SQLite file of the outputs produced by earlier runs."""
+
+    def __init__(self, path):
+        import sqlite3  # only needed with --incremental
+        path = pathlib.Path(path).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # batch workers share the file: wait for the lock instead of failing.
+        # The threads of a process (--engine async) share the connection, one statement at a time.
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(SCHEMA)
+        self.lock = threading.Lock()
+
+    def lookup(self, source, operation):
+        with self.lock:
+            return self.db.execute('SELECT mtime_ns, size, sha256, output FROM outputs WHERE source = ? AND operation = ?',
+                                   (str(source), operation)).fetchone()
+
+    def record(self, source, operation, st, sha256, output):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?)',
+                            (str(source), operation, st.st_mtime_ns, st.st_size, sha256, str(output)))
+
+
+class Entry:
+    """What the manifest knows about one source and operation."""
+
+    def __init__(self, manifest, source, operation):
+        self.manifest = manifest
+        self.source = source
+        self.operation = operation
+        self.stat = os.stat(source)
+        self.row = manifest.lookup(source, operation)
+        self.sha256 = None
+
+    @property
+    def output(self):
+        """The previous output, if it is still there."""
+        if self.row and os.path.exists(self.row[3]):
+            return pathlib.Path(self.row[3])
+        return None
+
+    def unchanged(self, source_bytes=None):
+        """True if the previous output is still valid for the source.
+
+        Without source_bytes only mtime and size are compared. With them, a
+        source whose content has not changed counts as unchanged too, and the
+        new mtime is recorded so the next run skips it after a stat().
+        """
+        if self.output is None:
+            return False
+        mtime_ns, size, sha256, output = self.row
+        if (mtime_ns, size) == (self.stat.st_mtime_ns, self.stat.st_size):
+            return True
+        if source_bytes is None or sha256 is None or size != self.stat.st_size:
+            return False
+        if self.digest(source_bytes) != sha256:
+            return False
+        self.manifest.record(self.source, self.operation, self.stat, sha256, output)
+        return True
+
+    def digest(self, source_bytes):
+        """SHA-256 of the source, computed once."""
+        if self.sha256 is None:
+            self.sha256 = hashlib.sha256(source_bytes).hexdigest()
+        return self.sha256
+
+    def record(self, output, source_bytes=None):
+        """Remember output as the result for the source (hashed if source_bytes is given)."""
+        if source_bytes is not None:
+            self.digest(source_bytes)
+        self.manifest.record(self.source, self.operation, self.stat, self.sha256, output)
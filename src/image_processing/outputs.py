@@ -0,0 +1,125 @@
+#One output on its way from the source to the destination
+
+# convert, resize/filter and the async batch engine write their outputs the
+# same way around their own decode -> encode step:
+#
+#   prepare()  manifest check, destination, read the source, then serve the
+#              output from the incremental manifest, the result cache or the
+#              duplicate index if one of them has it
+#   write()    write the encoded bytes and record them in the duplicate index,
+#              the cache and the manifest
+#
+# Between the two the caller turns source_bytes into the encoded output,
+# starting from decoded when the duplicate index already had to decode the
+# source in full. The async engine runs the two halves in different threads.
+
+import pathlib
+import buffers
+import cache
+import dedupe
+import manifest
+import profiling
+import utilities
+
+
+class Output:
+    """The destination of one job and where its result may already be found."""
+
+    def __init__(self, args, operation, ext, report):
+        # report(dest, note=None) prints the command's success line; note is 'cached' for cache hits
+        self.args = args
+        self.operation = operation
+        self.ext = ext
+        self.report = report
+        self.entry = None
+        self.results = None
+        self.key = None
+        self.index = None
+        self.near = None
+        self.dest = None
+        self.replace = True
+        self.source_bytes = None
+        self.decoded = None
+
+    def prepare(self, read=True):
+        """Pick the destination and serve the output without encoding if possible; True when it is done.
+
+        With read=False only the manifest and the destination are settled, for
+        callers that stream the source themselves (tiled resizes).
+        """
+        args = self.args
+        with profiling.stage('manifest'):
+            self.entry = manifest.entry(args, self.operation)
+            skip = self.entry and self.entry.unchanged()
+        if skip:
+            self.dest = self.entry.output
+            manifest.report_skip(self.dest)
+            return True
+        with profiling.stage('destination'):
+            # a changed source replaces its previous output instead of getting a new name
+            previous = self.entry.output if self.entry else None
+            self.dest = previous or utilities.givecorrectdestination(args.destination, args.force)
+            self.replace = bool(args.force or previous)
+        if not read:
+            return False
+        with profiling.stage('read'):
+            self.source_bytes = pathlib.Path(args.source).read_bytes()
+        if self.entry:
+            with profiling.stage('manifest'):
+                skip = self.entry.unchanged(self.source_bytes)
+            if skip:
+                manifest.report_skip(self.dest)
+                return True
+        self.results = cache.from_args(args)
+        if self.results:
+            with profiling.stage('cache'):
+                self.key = cache.operation_key(self.source_bytes, self.operation)
+                served = self.results.serve(self.key, self.ext, self.dest, self.replace)
+            if served:
+                self.dest = served
+                self.published('cached')
+                return True
+        self.index = dedupe.from_args(args)
+        if self.index:
+            with profiling.stage('dedupe'):
+                self.decoded = buffers.shared_decode(self.source_bytes)
+                self.near = self.index.key(self.source_bytes, self.operation, self.decoded)
+                served = self.index.serve(self.near, self.dest, self.replace)
+            if served:
+                self.dest, match = served
+                if self.entry:
+                    self.entry.record(self.dest, self.source_bytes)
+                self.decoded = None
+                dedupe.report_duplicate(self.dest, match)
+                return True
+        return False
+
+    def release(self):
+        """Drop the source once it is encoded; the manifest keeps only the hash of its bytes."""
+        if self.entry and self.source_bytes is not None:
+            self.entry.digest(self.source_bytes)
+        self.source_bytes = None
+        self.decoded = None
+
+    def write(self, data):
+        """Write the encoded output and record it everywhere it is looked up. Returns the path written."""
+        with profiling.stage('write'):
+            written = utilities.write_image(self.dest, data, self.replace)
+        if not written:
+            utilities.error(f"Failed to write the output image: {self.dest}")
+        self.dest = written
+        if self.index:
+            with profiling.stage('dedupe'):
+                self.index.record(self.near, self.args.source, self.dest)
+        if self.results:
+            with profiling.stage('cache'):
+                self.results.store(self.key, self.ext, data)
+        self.published()
+        return self.dest
+
+    def published(self, note=None):
+        """Record an output that is in place at dest and report it."""
+        if self.entry:
+            with profiling.stage('manifest'):
+                self.entry.record(self.dest, self.source_bytes)
+        self.report(self.dest, note)
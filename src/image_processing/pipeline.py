@@ -0,0 +1,175 @@
+#Decode once, write many outputs
+
+# A pipeline decodes the source a single time and writes every requested
+# output straight from the in-memory array: an optional resize (same
+# interpolation choice as `resize`) followed by an encode with one of the
+# COMPRESSION_MAP levels. Outputs that share a size share the resize.
+#
+# CLI:  pipeline -s photo.jpg -o thumb.jpg,width=160,height=120,compression=high
+#                             -o medium.png,width=800,height=600
+#                             -o master.tiff
+# Each --output is a destination optionally followed by key=value pairs
+# (width, height, format, compression). --spec takes the same outputs as a
+# JSON list of objects.
+#
+# The outputs are written by worker processes (-j, one per CPU by default), one
+# per output size. The decoded source goes into a shared-memory frame pool
+# (framepool.py) and the workers read it in place instead of each receiving a
+# pickled copy.
+
+import sys
+import json
+import argparse
+import pathlib
+import buffers
+import resize
+import framepool
+import utilities
+
+OUTPUT_KEYS = ('destination', 'width', 'height', 'format', 'compression')
+
+
+def add_pipeline_arguments(subparsers, parent):
+    """Add arguments for the pipeline command."""
+    pipeline_parser = subparsers.add_parser('pipeline', help='Decode an image once and write several outputs', parents=[parent])
+    pipeline_parser.add_argument('-s', '--source', type=utilities.valid_file, required=True, help='Source image')
+    pipeline_parser.add_argument('-o', '--output', action='append', default=[], type=parse_output_spec, help='Output: destination[,width=W,height=H,format=F,compression=C]')
+    pipeline_parser.add_argument('--spec', type=utilities.valid_file, help='JSON file with a list of outputs')
+    utilities.add_jobs_argument(pipeline_parser, 'Worker processes for the outputs (the decoded source is shared, not copied)')
+    pipeline_parser.add_argument('--pool-stats', action='store_true', help='With -j, print the occupancy of the shared frame pool')
+
+def parse_output_spec(text):
+    """Parse 'thumb.jpg,width=160,height=120' into an output dict."""
+    parts = [p.strip() for p in text.split(',') if p.strip()]
+    spec = {}
+    for part in parts:
+        key, sep, value = part.partition('=')
+        if not sep:
+            if 'destination' in spec:
+                raise argparse.ArgumentTypeError(f"Unexpected value '{part}' in output '{text}'")
+            spec['destination'] = part
+            continue
+        key = key.strip()
+        if key not in OUTPUT_KEYS:
+            raise argparse.ArgumentTypeError(f"Unknown key '{key}' in output '{text}'")
+        spec[key] = value.strip()
+    for key in ('width', 'height'):
+        if key in spec:
+            try:
+                spec[key] = int(spec[key])
+            except ValueError:
+                raise argparse.ArgumentTypeError(f"{key} must be an integer in output '{text}'")
+    return spec
+
+def plan_output(source, spec):
+    """Validate one output spec and resolve its destination, format and level."""
+    if not isinstance(spec, dict):
+        utilities.error(f"Each output must be an object, got {json.dumps(spec)}")
+    unknown = set(spec) - set(OUTPUT_KEYS)
+    if unknown:
+        utilities.error(f"Unknown output key(s): {', '.join(sorted(unknown))}")
+    out = argparse.Namespace(**{key: spec.get(key) for key in OUTPUT_KEYS})
+    if (out.width is None) != (out.height is None):
+        utilities.error("An output needs both width and height, or neither.")
+    for key in ('width', 'height'):
+        value = spec.get(key)
+        # --spec JSON is not checked by argparse; bool is an int subclass
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            utilities.error(f"{key} must be an integer in output {json.dumps(spec)}")
+    if out.width is not None:
+        resize.validate_dimensions(out.width, out.height)
+
+    formatImg = utilities.determineformat(out)
+    utilities.validate_supported_format_string(formatImg, "format")
+    out.compression = out.compression or 'medium'
+    utilities.validate_compression(formatImg, out.compression)
+
+    if out.destination:
+        suffix = f".{formatImg}"
+    elif out.width is not None:
+        suffix = f"_{out.width}x{out.height}.{formatImg}"
+    else:
+        suffix = f"_converted.{formatImg}"
+    out.destination = utilities.prepare_destination(out.destination, source, suffix)
+    utilities.validate_supported_format(out.destination, "destination")
+    out.format = formatImg
+    return out
+
+def run_pipeline(source, outputs, force=False, jobs=1, pool_stats=False, cv_threads='auto'):
+    """Decode source once and write every output. Returns the written paths.
+
+    jobs None means one worker process per CPU, 1 writes the outputs in this process.
+    """
+    if not outputs:
+        utilities.error("The pipeline needs at least one output.")
+    source = utilities.normalize_source(source)
+    utilities.validate_supported_format(source, "source")
+    # validate everything before decoding so a bad spec fails fast
+    plans = [plan_output(source, spec) for spec in outputs]
+
+    try:
+        img = buffers.decode_unchanged(source.read_bytes())
+    except ValueError:
+        utilities.error(f"Failed to read the source image: {source}")
+
+    # outputs that share a size share the resize
+    groups = {}
+    for i, out in enumerate(plans):
+        size = (out.width, out.height) if out.width is not None else None
+        groups.setdefault(size, []).append((i, out))
+
+    written = [None] * len(plans)
+    workers, threads = utilities.split_cores(utilities.available_cpus(), jobs, len(groups),
+                                             img.shape[0] * img.shape[1], cv_threads)
+    if workers == 1:
+        for size, group in groups.items():
+            for i, path in write_outputs(img, size, group, force):
+                written[i] = path
+        return written
+
+    import concurrent.futures  # keeps startup cheap for the other commands
+    with framepool.FramePool(1, img.nbytes) as pool:
+        handle = pool.put(img)
+        del img
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=buffers.set_threads,
+                                                    initargs=(threads,)) as executor:
+            futures = [executor.submit(write_shared, handle, size, group, force) for size, group in groups.items()]
+            for future in futures:
+                for i, path in future.result():
+                    written[i] = path
+        pool.release(handle)
+        if pool_stats:
+            print(framepool.format_stats(pool.stats()), file=sys.stderr)
+    return written
+
+def write_outputs(img, size, group, force):
+    """Resize img to size (None: as is) and write every (index, output) of the group."""
+    frame = img if size is None else buffers.resize_array(img, *size)
+    written = []
+    for i, out in group:
+        realdest = utilities.givecorrectdestination(out.destination, force)
+        try:
+            data = buffers.encode(frame, out.format, out.compression)
+        except ValueError as e:
+            # in a worker the SystemExit is re-raised by future.result() in the parent
+            utilities.error(f"Failed to encode the output image {out.destination}: {e}")
+        path = utilities.write_image(realdest, data, force)
+        if not path:
+            utilities.error(f"Failed to write the output image: {realdest}")
+        utilities.info(f"\033[32mWrote {path} ({frame.shape[1]}x{frame.shape[0]}, {out.format})\033[0m")
+        written.append((i, path))
+    return written
+
+def write_shared(handle, size, group, force):
+    # runs in a worker process: the source is mapped from the frame pool
+    return write_outputs(framepool.frame(handle), size, group, force)
+
+def pipeline_from_args(args):
+    outputs = list(args.output)
+    if args.spec:
+        try:
+            outputs.extend(json.loads(pathlib.Path(args.spec).read_text()))
+        except json.JSONDecodeError as e:
+            utilities.error(f"Invalid pipeline spec {args.spec}: {e}")
+    return run_pipeline(args.source, outputs, args.force, getattr(args, 'jobs', None),
+                        getattr(args, 'pool_stats', False), getattr(args, 'cv_threads', 'auto'))
@@ -0,0 +1,133 @@
+#Per-stage timing and profiling
+
+# convert and resize wrap their hot path in `stage(...)` blocks (validate,
+# destination, read, cache, decode, transform, encode, write). Timings are only
+# collected inside a `trace()`, which batch.run_one opens for every job, so the
+# single-file CLI, batch workers and the socket server all report the same
+# stages. A Recorder writes the traces as JSON lines (--profile), a
+# Prometheus text dump (--metrics) and merged cProfile stats (--cprofile).
+
+import time
+import json
+import marshal
+import pathlib
+import threading
+import contextlib
+
+_local = threading.local()
+
+
+def add_profile_arguments(parser):
+    parser.add_argument('--profile', metavar='FILE', help='Write per-image stage timings as JSON lines')
+    parser.add_argument('--metrics', metavar='FILE', help='Write aggregated stage timings in Prometheus text format')
+    parser.add_argument('--cprofile', metavar='FILE', help='Write cProfile stats (pstats format) for the processing code')
+
+@contextlib.contextmanager
+def stage(name):
+    """Time a block and add it to the current trace, if there is one."""
+    current = getattr(_local, 'trace', None)
+    if current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current[name] = current.get(name, 0.0) + time.perf_counter() - start
+
+@contextlib.contextmanager
+def trace():
+    """Collect stage timings (in seconds) of the enclosed work into a dict."""
+    previous = getattr(_local, 'trace', None)
+    _local.trace = {}
+    try:
+        yield _local.trace
+    finally:
+        _local.trace = previous
+
+@contextlib.contextmanager
+def cprofiled(enabled):
+    """Run the block under cProfile; yields a dict that receives marshalled stats."""
+    captured = {}
+    if not enabled:
+        yield captured
+        return
+    import cProfile  # only needed with --cprofile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield captured
+    finally:
+        profiler.disable()
+        profiler.create_stats()
+        captured['stats'] = marshal.dumps(profiler.stats)
+
+
+class _LoadedStats:
+    """Lets pstats.Stats load stats that came back from a worker process."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class Recorder:
+    """Collects job results and writes the requested trace outputs."""
+
+    def __init__(self, profile=None, metrics=None, cprofile=None):
+        self.profile = open(profile, 'a') if profile else None
+        self.metrics = metrics
+        self.cprofile = cprofile
+        self.stats = None
+        self.totals = {}
+        self.counts = {}
+        self.images = {}
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(getattr(args, 'profile', None), getattr(args, 'metrics', None), getattr(args, 'cprofile', None))
+
+    @property
+    def enabled(self):
+        return bool(self.profile or self.metrics or self.cprofile)
+
+    def add(self, command, result):
+        stages = result.get('stages_ms', {})
+        status = 'ok' if result.get('ok') else 'error'
+        self.images[(command, status)] = self.images.get((command, status), 0) + 1
+        for name, ms in stages.items():
+            self.totals[name] = self.totals.get(name, 0.0) + ms / 1000
+            self.counts[name] = self.counts.get(name, 0) + 1
+        if self.profile:
+            line = {'command': command, 'source': result.get('source'), 'destination': result.get('destination'),
+                    'ok': result.get('ok'), 'total_ms': round(sum(stages.values()), 3), 'stages_ms': stages}
+            self.profile.write(json.dumps(line) + '\n')
+        if self.cprofile and result.get('cprofile'):
+            import pstats  # only needed with --cprofile
+            loaded = _LoadedStats(marshal.loads(result['cprofile']))
+            if self.stats is None:
+                self.stats = pstats.Stats(loaded)
+            else:
+                self.stats.add(loaded)
+
+    def prometheus(self):
+        lines = ['# HELP image_processing_stage_seconds Time spent in each processing stage.',
+                 '# TYPE image_processing_stage_seconds summary']
+        for name in sorted(self.totals):
+            lines.append(f'image_processing_stage_seconds_sum{{stage="{name}"}} {self.totals[name]:.6f}')
+            lines.append(f'image_processing_stage_seconds_count{{stage="{name}"}} {self.counts[name]}')
+        lines += ['# HELP image_processing_images_total Images processed.',
+                  '# TYPE image_processing_images_total counter']
+        for (command, status), count in sorted(self.images.items()):
+            lines.append(f'image_processing_images_total{{command="{command}",status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        if self.profile:
+            self.profile.close()
+        if self.metrics:
+            pathlib.Path(self.metrics).write_text(self.prometheus())
+        if self.cprofile and self.stats is not None:
+            self.stats.dump_stats(self.cprofile)
@@ -0,0 +1,110 @@
+#Responsive-image renditions
+
+# `renditions` writes several widths of one source for srcset/picture markup:
+#
+#   renditions -s photo.jpg --widths 320 640 960 1280 1920 -d public/img
+#
+# The source is decoded once (at reduced JPEG resolution when the largest
+# width allows it) and the renditions are made as a cascade: the largest from
+# the source, every smaller one from the next larger rendition with INTER_AREA.
+# Each step works on far fewer pixels than a resize from full resolution.
+# Heights follow the source aspect ratio, rounded per width, so rounding does
+# not add up along the cascade. Widths above the source width are skipped
+# rather than upscaled. Next to the images, <stem>.renditions.json lists every
+# rendition with its size and byte count.
+
+import sys
+import json
+import pathlib
+import buffers
+import utilities
+
+cv2 = buffers.cv2
+
+
+def add_renditions_arguments(subparsers, parent):
+    """Add arguments for the renditions command."""
+    renditions_parser = subparsers.add_parser('renditions', help='Write several widths of an image plus a JSON manifest', parents=[parent])
+    renditions_parser.add_argument('-s', '--source', type=utilities.valid_file, required=True, help='Source image')
+    renditions_parser.add_argument('--widths', type=utilities.positive_int, nargs='+', required=True, help='Target widths in pixels')
+    renditions_parser.add_argument('-d', '--destination', help='Output directory (default: next to the source)')
+    renditions_parser.add_argument('-f', '--format', help='Output format (default: the source format)')
+    renditions_parser.add_argument('-c', '--compression', choices=utilities.COMPRESSION_LEVELS, default='medium', help='Compression level (low, medium, high; lossless for WebP)')
+
+def rendition_sizes(src_width, src_height, widths):
+    """(width, height) per requested width, largest first, without upscales or duplicates."""
+    sizes = []
+    for width in sorted(set(widths), reverse=True):
+        if width > src_width:
+            continue
+        sizes.append((width, max(1, round(width * src_height / src_width))))
+    return sizes
+
+def cascade(img, sizes):
+    """Yield (width, height, frame) for sizes (largest first), each made from the previous frame."""
+    previous = img
+    for width, height in sizes:
+        if (width, height) != previous.shape[1::-1]:
+            previous = cv2.resize(previous, (width, height), interpolation=cv2.INTER_AREA)
+        yield width, height, previous
+
+def make_renditions(source, widths, destination=None, formatImg=None, level='medium', force=False):
+    """Write the renditions and their manifest; returns the manifest as a dict."""
+    source = utilities.normalize_source(source)
+    utilities.validate_supported_format(source, "source")
+    formatImg = (formatImg or utilities.get_extension(source)).lower()
+    utilities.validate_supported_format_string(formatImg, "format")
+    utilities.validate_compression(formatImg, level)
+    out_dir = pathlib.Path(destination).expanduser() if destination else source.parent
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    data = source.read_bytes()
+    try:
+        size = buffers.jpeg_size(data)
+        if size is None:
+            img = buffers.decode_unchanged(data)
+        else:
+            # JPEG: decode at the lowest DCT scale that still covers the largest rendition
+            largest = max((max(w, h) for w, h in rendition_sizes(*size, widths)), default=max(size))
+            img = buffers.decode_for_size(data, largest, largest)
+            if (img.shape[1] >= img.shape[0]) != (size[0] >= size[1]):
+                size = size[::-1]  # EXIF orientation: the header has the stored, not the displayed size
+        if size is None:
+            size = img.shape[1::-1]
+        sizes = rendition_sizes(*size, widths)
+        if sizes and (img.shape[1] < sizes[0][0] or img.shape[0] < sizes[0][1]):
+            img = buffers.decode_unchanged(data)
+    except ValueError:
+        utilities.error(f"Failed to read the source image: {source}")
+    skipped = sorted(set(widths) - {w for w, _ in sizes})
+    if skipped:
+        print(f"\033[33mSkipped widths larger than the source ({size[0]} px): {', '.join(map(str, skipped))}\033[0m", file=sys.stderr)
+    if not sizes:
+        utilities.error("None of the widths fits the source.")
+
+    renditions = []
+    for width, height, frame in cascade(img, sizes):
+        dest = out_dir / f"{source.stem}-{width}w.{formatImg}"
+        encoded = buffers.encode(frame, formatImg, level)
+        path = utilities.write_image(dest, encoded, force)
+        if not path:
+            utilities.error(f"Failed to write the output image: {dest}")
+        utilities.info(f"\033[32mWrote {path} ({width}x{height}, {len(encoded)} bytes)\033[0m")
+        renditions.append({'width': width, 'height': height, 'path': path.name, 'bytes': len(encoded)})
+
+    manifest = {
+        'source': str(source),
+        'width': size[0],
+        'height': size[1],
+        'format': formatImg,
+        'renditions': sorted(renditions, key=lambda r: r['width']),
+    }
+    manifest_path = utilities.write_image(out_dir / f"{source.stem}.renditions.json",
+                                          json.dumps(manifest, indent=2).encode(), True)
+    if not manifest_path:
+        utilities.error(f"Failed to write the manifest in {out_dir}")
+    utilities.info(f"\033[32mManifest: {manifest_path}\033[0m")
+    return manifest
+
+def renditions_from_args(args):
+    return make_renditions(args.source, args.widths, args.destination, args.format, args.compression, args.force)
@@ -6,59 +6,169 @@
 # Error messages are displayed for invalid dimension.
 
 import sys
+import shutil
 import argparse
-import pathlib
-import cv2
+import cache
+import dedupe
+import manifest
+import outputs
+import profiling
+import tiled
+import filters
+import buffers
 import utilities
 
 
 MAX_DIMENSION = 4096
+MAX_TILED_DIMENSION = 32768
 
 
 
 def add_resize_arguments(subparsers, parent):
     """Add arguments for the resize command."""
     resize_parser = subparsers.add_parser('resize', help='Resize an image to specified dimensions', parents=[parent])
-    resize_parser.add_argument('-s', '--source', type=utilities.valid_file, required=True, help='Source image')
+    resize_parser.add_argument('-s', '--source', type=utilities.valid_source, nargs='+', required=True, help='Source image(s), directory, glob or .txt file list')
     resize_parser.add_argument('-d', '--destination', help='Destination image.')
     resize_parser.add_argument('--width', type=int, required=True, help='Target width of the output image')
     resize_parser.add_argument('--height', type=int, required=True, help='Target height of the output image')
+    utilities.add_batch_arguments(resize_parser)
+    resize_parser.add_argument('--tiled', action='store_true', help=f'Resample in strips with bounded memory (up to {MAX_TILED_DIMENSION} px from an uncompressed TIFF to a TIFF)')
+    resize_parser.add_argument('--max-memory', type=int, default=tiled.DEFAULT_MAX_MEMORY_MB, help='Memory ceiling in MB for --tiled')
+    resize_parser.add_argument('--exact', action='store_true', help='Always decode at full resolution (no reduced JPEG decode for large downscales)')
+    filters.add_filter_arguments(resize_parser)
+    cache.add_cache_arguments(resize_parser)
+    dedupe.add_dedupe_arguments(resize_parser)
+    manifest.add_incremental_arguments(resize_parser)
     
+def validate_dimensions(width, height, limit=MAX_DIMENSION):
+    """Validate a target width and height."""
+    if width <= 0 or height <= 0:
+        utilities.error("Width and height must be positive integers.")
+    if width > limit or height > limit:
+        utilities.error(f"Width and height must not exceed {limit}.")
+
 def validate_resize_arguments(args):
     """Validate the resize arguments."""
-    if args.width <= 0 or args.height <= 0:
-        utilities.error("Width and height must be positive integers.")
-    if args.width > MAX_DIMENSION or args.height > MAX_DIMENSION:
-        utilities.error(f"Width and height must not exceed {MAX_DIMENSION}.")
+    with profiling.stage('validate'):
+        check_resize_arguments(args)
+
+def check_resize_arguments(args):
+    filtering = getattr(args, 'command', 'resize') == 'filter'
+    if filtering:
+        filters.validate_filter_arguments(args)
+    if getattr(args, 'tiled', False) and getattr(args, 'filters', None):
+        utilities.error("--tiled does not run filters; drop --tiled or the filter options.")
+    limit = MAX_TILED_DIMENSION if getattr(args, 'tiled', False) else MAX_DIMENSION
+    if not filtering or args.width is not None:
+        validate_dimensions(args.width, args.height, limit)
     
     # validate source path
     args.source = utilities.normalize_source(args.source)
     utilities.validate_supported_format(args.source, "source")
+    utilities.probe_source(args.source)
 
     # destination
-    args.destination = utilities.prepare_destination(args.destination, args.source, "_resized" + args.source.suffix)
+    suffix = "_filtered" if filtering else "_resized"
+    args.destination = utilities.prepare_destination(args.destination, args.source, suffix + args.source.suffix)
     utilities.validate_supported_format(args.destination, "destination")
+    if getattr(args, 'tiled', False) and max(args.width, args.height) > MAX_DIMENSION:
+        # only these are never held whole, see tiled.py
+        if utilities.get_extension(args.destination) not in ('tif', 'tiff') or not tiled.streamable(args.source):
+            utilities.error(f"--tiled beyond {MAX_DIMENSION} px needs an uncompressed TIFF source and a TIFF destination.")
+
+def operation(args):
+    """What the cache and the manifest know about this resize."""
+    op = cache.resize_operation(args.width, args.height, utilities.get_extension(args.destination), getattr(args, 'exact', False))
+    if getattr(args, 'tiled', False):
+        op['tiled'] = True
+    if getattr(args, 'filters', None):
+        op['filters'] = args.filters
+    return op
 
 def resize_image(args):
     """Resize the image to the specified dimensions."""
-    img = cv2.imread(str(args.source))
+    # an existing destination gets a stem_N name unless --force is given; in
+    # incremental mode a changed source replaces its previous output instead
+    output = outputs.Output(args, operation(args), utilities.get_extension(args.destination),
+                            lambda dest, note=None: report_success(dest, args.width, args.height, note))
+    tiling = getattr(args, 'tiled', False)
+    if output.prepare(read=not tiling):
+        return output.dest
+    if tiling:
+        return resize_tiled(args, output)
+    return output.write(resize_bytes(args, output.source_bytes, output.dest, output.decoded))
+
+def resize_tiled(args, output):
+    """Resample the file in strips into a temporary file next to the destination, then publish it in one step."""
+    realdest = output.dest
+    tmp = utilities.temp_path(realdest, realdest.suffix)
+    try:
+        if buffers.is_noop(utilities.probe_source(args.source), output.ext, size=(args.width, args.height)):
+            with profiling.stage('copy'):
+                shutil.copyfile(args.source, tmp)
+        else:
+            with profiling.stage('tiled'):
+                tiled.resize_file(args.source, tmp, args.width, args.height,
+                                  getattr(args, 'max_memory', tiled.DEFAULT_MAX_MEMORY_MB) * 1024 * 1024)
+        output.dest = utilities.publish(tmp, realdest, output.replace)
+    except ValueError as e:
+        tmp.unlink(missing_ok=True)
+        utilities.error(f"Failed to resize {args.source}: {e}")
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        utilities.error(f"Failed to write the output image: {realdest}")
+    output.published("tiled")
+    return output.dest
+
+def resize_bytes(args, source_bytes, realdest, img=None):
+    """Decode, resize, filter and re-encode the source bytes for realdest (no file access).
+
+    A source that already has the target size and format is returned as is,
+    unless there are filters to run. Without a size (filter) only the filters run.
+    img is the full decode of the source if the caller already has it.
+    """
+    steps = getattr(args, 'filters', None)
+    sized = args.width is not None
+    if not steps:
+        with profiling.stage('probe'):
+            try:
+                noop = buffers.is_noop(buffers.probe(source_bytes), utilities.get_extension(realdest), size=(args.width, args.height))
+            except ValueError:
+                noop = False  # left to the decoder to report
+        if noop:
+            return source_bytes
     if img is None:
-        utilities.error(f"Failed to read the source image: {args.source}")
-    
-    # choose interpolation: area for shrinking, linear for enlarging
-    h, w = img.shape[:2]
-    if args.width < w and args.height < h:
-        interp = cv2.INTER_AREA
-    else:
-        interp = cv2.INTER_LINEAR
+        try:
+            with profiling.stage('decode'):
+                if getattr(args, 'exact', False) or not sized:
+                    img = buffers.decode_unchanged(source_bytes)
+                else:
+                    img = buffers.decode_for_size(source_bytes, args.width, args.height)
+        except ValueError:
+            utilities.error(f"Failed to read the source image: {args.source}")
     
-    resized_img = cv2.resize(img, (args.width, args.height), interpolation=interp)
+    resized_img = img
+    if sized:
+        with profiling.stage('transform'):
+            resized_img = buffers.resize_array(img, args.width, args.height)
+    if steps:
+        # after the resize, so the filters touch the smaller of the two images
+        try:
+            with profiling.stage('filter'):
+                filters.filter_array(resized_img, steps)
+        except ValueError as e:
+            utilities.error(f"Failed to filter {args.source}: {e}")
     
-    # ensure the destination path is unique if it already exists. If --force is not specified, we will generate a unique path.
-    realdest = utilities.givecorrectdestination(args.destination, args.force)
-    
-    ok = cv2.imwrite(str(realdest), resized_img)
-    if not ok:
+    try:
+        with profiling.stage('encode'):
+            return buffers.encode(resized_img, utilities.get_extension(realdest))
+    except ValueError:
         utilities.error(f"Failed to write the output image: {realdest}")
-    
-    print(f"\033[32mImage resized successfully: {realdest} ({args.width}x{args.height}\033[0m)")
+
+def report_success(realdest, width, height, note=None):
+    if width is None:
+        note = f" ({note})" if note else ""
+        utilities.info(f"\033[32mImage filtered successfully: {realdest}{note}\033[0m")
+        return
+    note = f", {note}" if note else ""
+    utilities.info(f"\033[32mImage resized successfully: {realdest} ({width}x{height}{note}\033[0m)")
@@ -0,0 +1,102 @@
+#Long-running worker mode
+
+# `serve` starts once, keeps cv2 and its codecs loaded and accepts convert/resize
+# jobs (see jobs.py for the descriptor) as JSON lines over a Unix domain socket. Every job is answered with one
+# JSON line holding the result and the time it took. See client.py for the
+# blocking and asyncio clients.
+
+import os
+import json
+import time
+import socket
+import signal
+import pathlib
+import threading
+import socketserver
+import jobs
+import batch
+import buffers
+import utilities
+
+DEFAULT_SOCKET = '/tmp/image_processing.sock'
+
+
+def add_serve_arguments(subparsers, parent):
+    """Add arguments for the serve command."""
+    serve_parser = subparsers.add_parser('serve', help='Run a worker that accepts jobs over a Unix socket', parents=[parent])
+    serve_parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f'Unix socket path (default: {DEFAULT_SOCKET})')
+
+def warm_up():
+    """Import and exercise the codecs once so the first job does not pay for it."""
+    img = buffers.np.zeros((8, 8, 3), dtype=buffers.np.uint8)
+    for fmt in ('png', 'jpg', 'tiff'):
+        buffers.decode(buffers.encode(img, fmt))
+
+def handle_job(job):
+    """Run one job and return the JSON-serialisable result."""
+    start = time.perf_counter()
+    try:
+        args = jobs.job_namespace(job)
+    except (ValueError, TypeError, AttributeError) as e:
+        result = {'ok': False, 'error': str(e)}
+    else:
+        result = batch.run_one(args.command, args)
+    result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    if isinstance(job, dict) and 'id' in job:
+        result['id'] = job['id']
+    return result
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """Read one JSON job per line and answer with one JSON result per line."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                result = {'ok': False, 'error': f"Invalid JSON: {e}"}
+            else:
+                if isinstance(job, dict) and job.get('op') == 'ping':
+                    result = {'ok': True, 'pid': os.getpid()}
+                elif isinstance(job, dict) and job.get('op') == 'shutdown':
+                    result = {'ok': True}
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                else:
+                    result = handle_job(job)
+            self.wfile.write(json.dumps(result).encode() + b'\n')
+            self.wfile.flush()
+
+
+class JobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def remove_stale_socket(path):
+    if not path.exists():
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(str(path))
+        except OSError:
+            path.unlink()
+            return
+    utilities.error(f"Another server is already listening on {path}")
+
+def serve(args):
+    """Run the job server until it receives a shutdown job or a signal."""
+    path = pathlib.Path(args.socket).expanduser()
+    remove_stale_socket(path)
+    warm_up()
+    server = JobServer(str(path), JobHandler)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    print(f"\033[32mListening on {path}\033[0m", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
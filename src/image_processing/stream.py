@@ -0,0 +1,145 @@
+#Streaming mode for shell and container pipelines
+
+# `convert -s -` reads the encoded source from stdin and `-d -` writes the
+# encoded result to stdout, so no temporary files are needed:
+#
+#   curl -s https://example.com/photo.png | main.py convert -s - -d - -f jpg > photo.jpg
+#
+# The bytes read are decoded in place (cv2.imdecode over a view of the read
+# buffer) and the encoded result is written straight from the cv2 buffer.
+# With --framed both sides are a stream of frames, each a 4-byte big-endian
+# length followed by that many bytes of encoded image, so one process can
+# convert any number of images. A frame that fails to convert is answered with
+# an empty frame (length 0) to keep the stream in step, and reported on stderr.
+# Messages always go to stderr, since stdout may carry image data.
+
+import sys
+import struct
+import batch
+import buffers
+import convert
+import profiling
+import utilities
+
+STDIO = '-'
+FRAME_HEADER = struct.Struct('>I')
+
+
+def add_stream_arguments(parser):
+    parser.add_argument('--framed', action='store_true', help='With -s - / -d -: a stream of length-prefixed images instead of a single image')
+
+def is_stream(args):
+    return STDIO in args.source or args.destination == STDIO
+
+def read_exactly(stream, buf, size):
+    """Fill the first size bytes of buf from stream; False on a clean end of stream."""
+    view = memoryview(buf)[:size]
+    got = 0
+    while got < size:
+        n = stream.readinto(view[got:])
+        if not n:
+            if got:
+                raise EOFError(f"Stream ended in the middle of a frame ({got} of {size} bytes)")
+            return False
+        got += n
+    return True
+
+def read_frames(stream):
+    """Yield the frames of a length-prefixed stream as views into one reused buffer."""
+    header = bytearray(FRAME_HEADER.size)
+    buf = bytearray()
+    while read_exactly(stream, header, FRAME_HEADER.size):
+        (size,) = FRAME_HEADER.unpack(header)
+        if size > len(buf):
+            buf = bytearray(size)
+        if not read_exactly(stream, buf, size):
+            raise EOFError("Stream ended after a frame header")
+        yield memoryview(buf)[:size]
+
+def write_frame(stream, data):
+    stream.write(FRAME_HEADER.pack(len(data)))
+    stream.write(data)
+
+def convert_data(args, data, formatImg):
+    """Encoded bytes in, encoded bytes (a memoryview) out."""
+    if convert.unchanged(args, formatImg, data):
+        return data
+    with profiling.stage('decode'):
+        img = buffers.decode_unchanged(data)
+    return convert.encode_image(args, img, formatImg)
+
+def sources(args):
+    """(name, data) for every input image: stdin, or the files given with -s."""
+    if args.source == [STDIO]:
+        stdin = sys.stdin.buffer
+        if args.framed:
+            try:
+                for i, frame in enumerate(read_frames(stdin)):
+                    yield f"<stdin frame {i}>", frame
+            except EOFError as e:
+                utilities.error(str(e))
+        else:
+            yield "<stdin>", stdin.read()
+        return
+    paths = batch.expand_sources(args.source)
+    if len(paths) > 1 and not args.framed:
+        utilities.error("Several images need --framed to be written to one stream.")
+    for path in paths:
+        yield str(path), path.read_bytes()
+
+def check_stream_args(args):
+    if args.command != 'convert':
+        utilities.error("Reading from stdin or writing to stdout (-) is only supported by convert.")
+    if STDIO in args.source and args.source != [STDIO]:
+        utilities.error("'-s -' cannot be combined with other sources.")
+    if args.framed and args.destination != STDIO:
+        utilities.error("--framed writes its frames to stdout: use -d -.")
+    if args.source == [STDIO] and not args.destination:
+        utilities.error("Reading from stdin needs a destination: -d FILE or -d -.")
+    formatImg = utilities.determineformat(args) if args.destination != STDIO else (args.format or 'png').lower()
+    utilities.validate_supported_format_string(formatImg, "format")
+    utilities.validate_compression(formatImg, args.compression)
+    if convert.searching(args) and formatImg not in convert.SEARCH_FORMATS:
+        utilities.error(f"--target-bytes and --max-quality-loss need a JPEG or PNG output, not {formatImg}")
+    return formatImg
+
+def run(args, recorder):
+    """Convert from/to stdin and stdout; returns the number of failed images."""
+    formatImg = check_stream_args(args)
+    stdout = sys.stdout.buffer
+    failures = 0
+    count = 0
+    for name, data in sources(args):
+        count += 1
+        with profiling.trace() as stages:
+            try:
+                out = convert_data(args, data, formatImg)
+            except ValueError as e:
+                out = None
+                result = {'source': name, 'ok': False, 'error': str(e)}
+            else:
+                result = {'source': name, 'ok': True, 'destination': args.destination}
+            if args.destination != STDIO:
+                if out is not None:
+                    with profiling.stage('write'):
+                        dest = utilities.prepare_destination(args.destination, None, "")
+                        path = utilities.write_image(dest, out, args.force)
+                    if path is None:
+                        result = {'source': name, 'ok': False, 'error': f"Failed to write image to {args.destination}"}
+                    else:
+                        result['destination'] = str(path)
+            else:
+                with profiling.stage('write'):
+                    if args.framed:
+                        write_frame(stdout, b'' if out is None else out)
+                    elif out is not None:
+                        stdout.write(out)
+        result['stages_ms'] = {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()}
+        recorder.add(args.command, result)
+        if not result['ok']:
+            failures += 1
+            print(f"\033[31mFailed: {name}: {result['error']}\033[0m", file=sys.stderr)
+    stdout.flush()
+    if args.framed:
+        print(f"Converted {count - failures} of {count} frame(s) to {formatImg}", file=sys.stderr)
+    return failures
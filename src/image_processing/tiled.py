@@ -0,0 +1,299 @@
+#Tiled resize for images larger than the memory budget
+
+# The source is read in horizontal strips and every strip is resampled on its
+# own, so only a few rows of the source are in memory at a time. Uncompressed
+# TIFFs (what scanners usually write) are read band by band straight from
+# their strips; any other source has to be decoded whole, which is refused
+# when the decoded image would not fit in --max-memory.
+# Each band of output rows is computed from exactly the source rows its
+# interpolation taps touch (area coverage when shrinking, two linear taps
+# otherwise), which gives the same result as cv2.resize within rounding.
+# TIFF output is written strip by strip; other formats are assembled in memory
+# and encoded at the end because cv2 encoders need the whole image, so they too
+# are refused when the output does not fit in --max-memory. Only an
+# uncompressed TIFF source with a TIFF output works in bounded memory at any
+# size, which is why resize allows more than MAX_DIMENSION only for those.
+
+import math
+import struct
+import pathlib
+import buffers
+
+cv2 = buffers.cv2
+np = buffers.np
+
+DEFAULT_MAX_MEMORY_MB = 256
+
+# TIFF tags used by the reader and the writer
+WIDTH, HEIGHT, BITS, COMPRESSION, PHOTOMETRIC = 256, 257, 258, 259, 262
+STRIP_OFFSETS, SAMPLES, ROWS_PER_STRIP, STRIP_COUNTS = 273, 277, 278, 279
+PLANAR, EXTRA_SAMPLES, SAMPLE_FORMAT = 284, 338, 339
+TIFF_TYPES = {1: 'B', 3: 'H', 4: 'I', 16: 'Q'}
+SHORT, LONG = 3, 4
+
+
+class ArrayStrips:
+    """Row access to an image that is already decoded into an array."""
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+
+    def rows(self, y0, y1):
+        return self.array[y0:y1]
+
+
+class TiffStrips:
+    """Row access to an uncompressed TIFF: every band is read from the file on its own.
+
+    Nothing of the file stays mapped or cached in the process, so the working
+    set is the band being resampled, whatever the size of the source.
+    """
+
+    def __init__(self, path, offset, dtype, shape, rgb):
+        self.path = path
+        self.offset = offset
+        self.dtype = dtype
+        self.shape = shape
+        self.rgb = rgb
+        self.row_bytes = int(np.prod(shape[1:])) * dtype.itemsize
+
+    def rows(self, y0, y1):
+        band = np.empty((y1 - y0,) + self.shape[1:], dtype=self.dtype)
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset + y0 * self.row_bytes)
+            if f.readinto(memoryview(band).cast('B')) != band.nbytes:
+                raise ValueError("Truncated TIFF strip data")
+        if self.rgb and band.ndim == 3:
+            # TIFF stores RGB(A), cv2 works in BGR(A)
+            band = band[..., [2, 1, 0, 3][:band.shape[2]]]
+        return band
+
+
+def read_tiff_layout(path):
+    """(offset, dtype, shape, rgb) of an uncompressed, contiguous, chunky TIFF. None for any other file."""
+    with open(path, 'rb') as f:
+        header = f.read(8)
+        if len(header) < 8 or header[:2] not in (b'II', b'MM'):
+            return None
+        endian = '<' if header[:2] == b'II' else '>'
+        magic, ifd = struct.unpack(endian + 'HI', header[2:])
+        if magic != 42:
+            return None
+        f.seek(ifd)
+        (count,) = struct.unpack(endian + 'H', f.read(2))
+        tags = {}
+        for _ in range(count):
+            tag, typ, n, value = struct.unpack(endian + 'HHI4s', f.read(12))
+            if typ not in TIFF_TYPES:
+                continue
+            fmt = endian + TIFF_TYPES[typ] * n
+            size = struct.calcsize(fmt)
+            if size > 4:
+                here = f.tell()
+                f.seek(struct.unpack(endian + 'I', value)[0])
+                raw = f.read(size)
+                f.seek(here)
+            else:
+                raw = value[:size]
+            tags[tag] = struct.unpack(fmt, raw)
+
+    def tag(key, default=None):
+        return tags.get(key, (default,))
+
+    width, height = tag(WIDTH)[0], tag(HEIGHT)[0]
+    samples = tag(SAMPLES, 1)[0]
+    bits = set(tag(BITS, 1))
+    photometric = tag(PHOTOMETRIC)[0]
+    if (tag(COMPRESSION, 1)[0] != 1 or tag(PLANAR, 1)[0] != 1 or set(tag(SAMPLE_FORMAT, 1)) != {1}
+            or len(bits) != 1 or bits.isdisjoint({8, 16}) or photometric not in (1, 2)
+            or samples not in (1, 3, 4) or width is None or height is None):
+        return None
+    offsets, counts = tags.get(STRIP_OFFSETS), tags.get(STRIP_COUNTS)
+    if not offsets or not counts or len(offsets) != len(counts):
+        return None
+    if any(offsets[i] + counts[i] != offsets[i + 1] for i in range(len(offsets) - 1)):
+        return None
+    dtype = np.dtype(np.uint8) if bits == {8} else np.dtype(endian + 'u2')
+    shape = (height, width, samples) if samples > 1 else (height, width)
+    if sum(counts) < int(np.prod(shape)) * dtype.itemsize:
+        return None
+    return offsets[0], dtype, shape, photometric == 2
+
+def streamable(path):
+    """True if the source can be read in bands instead of being decoded whole."""
+    path = pathlib.Path(path)
+    return path.suffix.lower() in ('.tif', '.tiff') and read_tiff_layout(path) is not None
+
+def open_strips(path, max_memory=None):
+    """Row reader for the source: band by band when the file allows it.
+
+    Other sources are decoded whole; with max_memory that is refused
+    (ValueError) if the decoded image would not fit.
+    """
+    path = pathlib.Path(path)
+    if path.suffix.lower() in ('.tif', '.tiff'):
+        layout = read_tiff_layout(path)
+        if layout:
+            return TiffStrips(path, *layout)
+    if max_memory is not None:
+        with open(path, 'rb') as f:
+            def read(offset, size):
+                f.seek(offset)
+                return f.read(size)
+            header = buffers.parse_header(read)
+        if header is None:
+            raise ValueError("--tiled cannot tell the decoded size of this source; convert it to an uncompressed TIFF first")
+        # the encoded file and the decoded image are held at once
+        needed = header.width * header.height * header.channels * (2 if header.bit_depth > 8 else 1) + path.stat().st_size
+        if needed > max_memory:
+            raise ValueError(f"Decoding this {header.format} source takes {needed / 2 ** 20:.0f} MB, over --max-memory; "
+                             "only uncompressed TIFFs are read in bands")
+    # compressed or other formats: no partial decoding in cv2, decode once
+    return ArrayStrips(buffers.decode_unchanged(path.read_bytes()))
+
+def vertical_taps(src_h, dst_h, interp):
+    """For each output row, the (source row, weight) pairs that produce it."""
+    scale = src_h / dst_h
+    taps = []
+    for oy in range(dst_h):
+        if interp == cv2.INTER_AREA:
+            start, end = oy * scale, (oy + 1) * scale
+            row = []
+            for sy in range(int(start), min(math.ceil(end), src_h)):
+                overlap = min(end, sy + 1) - max(start, sy)
+                if overlap > 1e-9:
+                    row.append((sy, overlap / scale))
+            taps.append(row)
+        else:
+            fy = (oy + 0.5) * scale - 0.5
+            y0 = math.floor(fy)
+            t = fy - y0
+            if y0 < 0:
+                y0, t = 0, 0.0
+            if y0 >= src_h - 1:
+                y0, t = src_h - 1, 0.0
+            taps.append([(y0, 1.0 - t)] + ([(y0 + 1, t)] if t > 0 else []))
+    return taps
+
+def band_rows(src_shape, dtype, width, height, max_memory):
+    """How many output rows to compute per band within the memory ceiling."""
+    src_h, src_w = src_shape[:2]
+    channels = src_shape[2] if len(src_shape) > 2 else 1
+    src_row = src_w * channels * (dtype.itemsize + 4)        # source strip + float copy
+    out_row = width * channels * 4 * 2                       # horizontal pass + band result
+    per_output_row = (src_h / height + 2) * (src_row + width * channels * 4) + out_row
+    return int(max(1, min(height, max_memory // per_output_row)))
+
+def resize_tiled(strips, width, height, max_memory=DEFAULT_MAX_MEMORY_MB * 1024 * 1024):
+    """Yield (y0, band) output bands of the resized image, top to bottom."""
+    src_h, src_w = strips.shape[:2]
+    interp = buffers.choose_interpolation(strips, width, height)
+    taps = vertical_taps(src_h, height, interp)
+    rows = band_rows(strips.shape, strips.dtype, width, height, max_memory)
+    info = np.iinfo(strips.dtype)
+    for y0 in range(0, height, rows):
+        band_taps = taps[y0:y0 + rows]
+        lo = min(sy for row in band_taps for sy, _ in row)
+        hi = max(sy for row in band_taps for sy, _ in row) + 1
+        # the source rows this band needs, including the overlap with its neighbours
+        src = strips.rows(lo, hi).astype(np.float32)
+        horizontal = cv2.resize(src, (width, hi - lo), interpolation=interp)
+        weights = np.zeros((len(band_taps), hi - lo), dtype=np.float32)
+        for i, row in enumerate(band_taps):
+            for sy, w in row:
+                weights[i, sy - lo] += w
+        band = weights @ horizontal.reshape(hi - lo, -1)
+        band = np.clip(np.rint(band), info.min, info.max).astype(strips.dtype)
+        yield y0, band.reshape((len(band_taps), width) + src.shape[2:])
+
+
+class TiffWriter:
+    """Write an uncompressed TIFF strip by strip."""
+
+    def __init__(self, path, width, height, channels, dtype):
+        self.width, self.height, self.channels, self.dtype = width, height, channels, np.dtype(dtype)
+        if width * height * channels * self.dtype.itemsize >= 2 ** 32:
+            raise ValueError("Output is larger than 4 GB, which classic TIFF cannot hold")
+        self.file = open(path, 'wb')
+        self.file.write(b'II*\x00\x00\x00\x00\x00')
+        self.offsets, self.counts = [], []
+        self.rows_per_strip = None
+
+    def write(self, band):
+        if self.rows_per_strip is None:
+            self.rows_per_strip = band.shape[0]
+        if band.ndim == 3 and band.shape[2] >= 3:
+            band = band[..., [2, 1, 0, 3][:band.shape[2]]]
+        data = np.ascontiguousarray(band, dtype=self.dtype.newbyteorder('<')).tobytes()
+        self.offsets.append(self.file.tell())
+        self.counts.append(len(data))
+        self.file.write(data)
+
+    def write_array(self, values, typ):
+        """Write a tag value that does not fit in 4 bytes; returns its offset."""
+        if self.file.tell() % 2:
+            self.file.write(b'\x00')
+        offset = self.file.tell()
+        self.file.write(struct.pack('<' + TIFF_TYPES[typ] * len(values), *values))
+        return offset
+
+    def close(self):
+        bits = self.dtype.itemsize * 8
+        entries = [
+            (WIDTH, LONG, [self.width]),
+            (HEIGHT, LONG, [self.height]),
+            (BITS, SHORT, [bits] * self.channels),
+            (COMPRESSION, SHORT, [1]),
+            (PHOTOMETRIC, SHORT, [2 if self.channels >= 3 else 1]),
+            (STRIP_OFFSETS, LONG, self.offsets),
+            (SAMPLES, SHORT, [self.channels]),
+            (ROWS_PER_STRIP, LONG, [self.rows_per_strip or self.height]),
+            (STRIP_COUNTS, LONG, self.counts),
+            (PLANAR, SHORT, [1]),
+        ]
+        if self.channels == 4:
+            entries.append((EXTRA_SAMPLES, SHORT, [0]))  # unspecified: cv2 reads it back unpremultiplied
+        packed = []
+        for tag, typ, values in entries:
+            size = struct.calcsize(TIFF_TYPES[typ]) * len(values)
+            if size > 4:
+                value = struct.pack('<I', self.write_array(values, typ))
+            else:
+                value = struct.pack('<' + TIFF_TYPES[typ] * len(values), *values).ljust(4, b'\x00')
+            packed.append(struct.pack('<HHI', tag, typ, len(values)) + value)
+        if self.file.tell() % 2:
+            self.file.write(b'\x00')
+        ifd = self.file.tell()
+        self.file.write(struct.pack('<H', len(packed)) + b''.join(packed) + b'\x00\x00\x00\x00')
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', ifd))
+        self.file.close()
+
+
+def resize_file(source, dest, width, height, max_memory=DEFAULT_MAX_MEMORY_MB * 1024 * 1024):
+    """Resize source into dest with a bounded working set. Returns dest.
+
+    Raises ValueError if the source or the output cannot be handled within max_memory.
+    """
+    strips = open_strips(source, max_memory)
+    channels = strips.shape[2] if len(strips.shape) > 2 else 1
+    dest = pathlib.Path(dest)
+    if dest.suffix.lower() in ('.tif', '.tiff'):
+        writer = TiffWriter(dest, width, height, channels, strips.dtype)
+        try:
+            for _, band in resize_tiled(strips, width, height, max_memory):
+                writer.write(band)
+        finally:
+            writer.close()
+        return dest
+    needed = width * height * channels * strips.dtype.itemsize
+    if needed > max_memory:
+        raise ValueError(f"A {width}x{height} {dest.suffix.lstrip('.')} output is encoded in one piece and takes "
+                         f"{needed / 2 ** 20:.0f} MB, over --max-memory; write a TIFF instead")
+    out = np.empty((height, width) + strips.shape[2:], dtype=strips.dtype)
+    for y0, band in resize_tiled(strips, width, height, max_memory):
+        out[y0:y0 + band.shape[0]] = band
+    dest.write_bytes(buffers.encode(out, dest.suffix))
+    return dest
@@ -1,24 +1,107 @@
+import os
+import re
 import sys
+import glob
+import tempfile
+import threading
 import argparse
-import cv2
 import pathlib
+import buffers
+import profiling
 
-SUPPORTED_FORMATS = {'png', 'jpg', 'jpeg', 'tiff'}
+SUPPORTED_FORMATS = set(buffers.CORE_FORMATS)
+COMPRESSION_LEVELS = ('low', 'medium', 'high', 'lossless')
+
+# Numbered names (stem_N.ext) already present in a directory, from one scan per
+# directory and process: {directory: {(stem, suffix): highest N}}. Names handed
+# out by unique_path/next_numbered are added, so a batch never scans or stats
+# its way through name_1, name_2... and there is no limit on N. _bases remembers
+# which path each handed-out name numbers, so publish() can number the original
+# again when it loses the name to another writer.
+_numbered = {}
+_bases = {}
+_numbered_lock = threading.Lock()
+NUMBERED_RE = re.compile(r'(.+)_(\d+)(\.[^.]+)$')
+
+def _scan_numbered(directory):
+    index = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            m = NUMBERED_RE.match(entry.name)
+            if m:
+                key = (m.group(1), m.group(3))
+                index[key] = max(index.get(key, 0), int(m.group(2)))
+    return index
 
 def unique_path(path):
+    """path if it is free, otherwise the next stem_N name after the highest one in its directory."""
+    path = pathlib.Path(path)
     if not path.exists():
         return path
-    stem = path.stem
-    suffix = path.suffix
-    parent = path.parent
-    max_iterations = 127
-    i = 1
-    while i < max_iterations:
-        candidate = parent / f"{stem}_{i}{suffix}"
-        if not candidate.exists():
-            return candidate
-        i += 1
-    raise RuntimeError("Could not find a unique filename")
+    return next_numbered(path)
+
+def next_numbered(path, rescan=False):
+    """The next stem_N name for path; rescan picks up names other processes took since the last scan."""
+    path = pathlib.Path(path)
+    with _numbered_lock:
+        if rescan or path.parent not in _numbered:
+            index = _scan_numbered(path.parent)
+            # names handed out here but not written yet are taken too
+            for key, n in _numbered.get(path.parent, {}).items():
+                index[key] = max(index.get(key, 0), n)
+            _numbered[path.parent] = index
+        index = _numbered[path.parent]
+        key = (path.stem, path.suffix)
+        index[key] = index.get(key, 0) + 1
+        numbered = path.parent / f"{path.stem}_{index[key]}{path.suffix}"
+        _bases[numbered] = path
+        return numbered
+
+def temp_path(dest, suffix='.tmp'):
+    """A new hidden file next to dest to write into before publish()."""
+    dest = pathlib.Path(dest)
+    fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=f'.{dest.stem}.', suffix=suffix)
+    os.close(fd)
+    return pathlib.Path(tmp)
+
+def publish(tmp, dest, replace):
+    """Atomically move a finished temp file to dest and return where it ended up.
+
+    With replace an existing dest is swapped out in one rename. Otherwise dest
+    is never overwritten: the file is hard-linked in, which fails if the name
+    was taken meanwhile (e.g. by another worker), and then the next free
+    stem_N name of the original destination is tried.
+    """
+    dest = pathlib.Path(dest)
+    if replace:
+        os.replace(tmp, dest)
+        return dest
+    with _numbered_lock:
+        base = _bases.pop(dest, dest)
+
+    def renumber():
+        numbered = next_numbered(base, rescan=True)
+        with _numbered_lock:
+            del _bases[numbered]
+        return numbered
+
+    while True:
+        try:
+            os.link(tmp, dest)
+        except FileExistsError:
+            dest = renumber()
+            continue
+        except OSError:
+            # no hard links on this filesystem: reserve the name, then rename over it
+            try:
+                os.close(os.open(dest, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                dest = renumber()
+                continue
+            os.replace(tmp, dest)
+            return dest
+        os.unlink(tmp)
+        return dest
 
 def normalize_source(path_str: str):
     path = pathlib.Path(path_str).expanduser().resolve()
@@ -26,6 +109,24 @@ def normalize_source(path_str: str):
         sys.exit(f"\033[31mSource file does not exist: {path}\033[0m")
     return path
 
+def probe_source(path):
+    """Header of a source file (buffers.Header), read without decoding; None for other formats.
+
+    Only the header bytes are read, so a damaged file fails here instead of
+    after it has been read and handed to the decoder.
+    """
+    try:
+        return read_header(path)
+    except ValueError as e:
+        error(f"Could not read the source image: {path}: {e}")
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        def read(offset, size):
+            f.seek(offset)
+            return f.read(size)
+        return buffers.parse_header(read)
+
 def prepare_destination(dest_str: str | None, source: pathlib.Path, suffix: str):
     if dest_str:
         dest = pathlib.Path(dest_str).expanduser()
@@ -35,13 +136,39 @@ def prepare_destination(dest_str: str | None, source: pathlib.Path, suffix: str)
     dest.parent.mkdir(parents=True, exist_ok=True)
     return dest
 
+def write_image(path, data, replace=True):
+    """Write encoded image bytes atomically; returns the path written, or None on failure like cv2.imwrite.
+
+    Readers never see a half-written file. Without replace, an existing file is
+    kept and the image goes to the next free stem_N name.
+    """
+    path = pathlib.Path(path)
+    tmp = None
+    try:
+        tmp = temp_path(path)
+        tmp.write_bytes(data)
+        # a rename never writes into the old file, which may be a hard link into the result cache
+        return publish(tmp, path, replace)
+    except OSError:
+        if tmp is not None:
+            tmp.unlink(missing_ok=True)
+        return None
+
+def info(msg):
+    # a single write, so lines printed by concurrent batch threads do not interleave
+    sys.stdout.write(f"{msg}\n")
+
 def error(msg):
         sys.exit(f"\033[31m{msg}\033[0m")
 
 def givecorrectdestination(dest, force):
-    if dest.exists() and not force:
-        return unique_path(dest)
-    return dest
+    """Where to write dest: itself, or a stem_N name if it exists and force is off.
+
+    This is only a proposal; publish() settles the name when the file is written.
+    """
+    if force:
+        return dest
+    return unique_path(dest)
 
 def determineformat(args):
     if args.format:
@@ -60,8 +187,169 @@ def determineformat(args):
 def generalargs():
     common = argparse.ArgumentParser(add_help=False)
     common.add_argument('--force', action='store_true', help='Overwrite output file')
+    profiling.add_profile_arguments(common)
+    add_execution_arguments(common)
     return common
 
+# Execution settings. OpenCV runs a thread pool of its own inside resize,
+# imdecode and imencode, sized to every core of the host. A batch of N worker
+# processes (or N CLI processes side by side) then runs N times that many
+# threads, and the switching costs more than the extra threads gain. The cores
+# are divided instead: --jobs images at a time, each with --cv-threads threads.
+# In auto mode (the default) small images get one thread each, since splitting
+# them costs more than it saves, and large ones share the cores left over by
+# the workers. --cpus pins the run, workers included, to a set of cores so
+# several runs on one host can be kept apart.
+
+SMALL_IMAGE_PIXELS = 1_000_000
+# seconds a worker of a --queue batch holds a claimed image (see workqueue.py)
+DEFAULT_LEASE = 600
+
+def add_execution_arguments(parser):
+    parser.add_argument('--cv-threads', type=cv_threads_value, default='auto',
+                        help="Threads OpenCV may use per image: a number, 'auto' (divide the cores between the "
+                             "images in flight) or 'opencv' (OpenCV's own default)")
+    parser.add_argument('--cpus', type=cpu_list, metavar='LIST', help='Run on these CPUs only, e.g. 0-3,8 (Linux)')
+
+def add_jobs_argument(parser, help='Number of worker processes'):
+    parser.add_argument('-j', '--jobs', type=positive_int, help=f'{help} (default: one per available CPU)')
+
+def positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text} is not a whole number")
+    if value <= 0:
+        raise argparse.ArgumentTypeError("The value must be positive")
+    return value
+
+def shard_value(text):
+    index, sep, count = text.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text} is not a shard like 2/4")
+    if not sep or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"{text} is not a shard like 2/4 (1 <= I <= N)")
+    return index, count
+
+def cv_threads_value(text):
+    if text in ('auto', 'opencv'):
+        return text
+    return positive_int(text)
+
+def cpu_list(text):
+    """Parse a CPU list like 0-3,8 into a set of CPU numbers."""
+    cpus = set()
+    try:
+        for part in text.split(','):
+            first, _, last = part.partition('-')
+            cpus.update(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text} is not a CPU list like 0-3,8")
+    if not cpus or min(cpus) < 0:
+        raise argparse.ArgumentTypeError(f"{text} is not a CPU list like 0-3,8")
+    return cpus
+
+def pin_cpus(args):
+    """Restrict this process, and the workers it starts, to --cpus."""
+    cpus = getattr(args, 'cpus', None)
+    if not cpus:
+        return
+    if not hasattr(os, 'sched_setaffinity'):
+        error("--cpus is not supported on this platform.")
+    try:
+        os.sched_setaffinity(0, cpus)
+    except OSError as e:
+        error(f"Could not run on CPUs {sorted(cpus)}: {e.strerror}")
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def split_cores(cpus, jobs, images, pixels=None, cv_threads='auto'):
+    """Divide cpus between images in flight and OpenCV threads per image.
+
+    Returns (workers, threads); threads is None when OpenCV keeps its default.
+    jobs None means one worker per core, pixels None an image of unknown size.
+    """
+    workers = max(1, min(jobs or cpus, images))
+    if cv_threads == 'opencv':
+        return workers, None
+    if cv_threads != 'auto':
+        return workers, cv_threads
+    if pixels is not None and pixels < SMALL_IMAGE_PIXELS:
+        return workers, 1
+    return workers, max(1, cpus // workers)
+
+def execution_plan(args, sources):
+    """(workers, cv2 threads per worker) for a run over sources, sized from the first one."""
+    pixels = source_pixels(sources[0]) if sources else None
+    return split_cores(available_cpus(), getattr(args, 'jobs', None), len(sources), pixels,
+                       getattr(args, 'cv_threads', 'auto'))
+
+def apply_execution(args):
+    """Pin the process to --cpus and give cv2 the threads of a run that handles one image at a time.
+
+    Commands that run several images at once set their own split (see execution_plan).
+    """
+    pin_cpus(args)
+    buffers.set_threads(execution_plan(args, [])[1])
+
+def source_pixels(path):
+    """Pixel count from the header of path, or None if it cannot be read."""
+    try:
+        header = read_header(path)
+    except (OSError, ValueError):
+        return None
+    return header.width * header.height if header else None
+
+def add_batch_arguments(parser):
+    add_jobs_argument(parser, 'Number of worker processes (threads with --engine async) for batch runs')
+    parser.add_argument('--shard', type=shard_value, metavar='I/N', help='Only process the I-th of N parts of the batch (1 <= I <= N), split by a hash of each path')
+    parser.add_argument('--queue', metavar='QUEUE', help='Claim the images of the batch from this shared queue (SQLite), together with the other workers using it')
+    parser.add_argument('--lease', type=positive_int, default=DEFAULT_LEASE, metavar='SECONDS', help='With --queue, how long a claimed image is reserved before another worker may retry it')
+    parser.add_argument('--engine', choices=('process', 'async'), default='process', help='Batch engine: a process pool, or overlapped reads/writes with a thread pool for slow or network storage')
+    parser.add_argument('--prefetch', type=int, default=8, help='With --engine async, images buffered between the read, transform and write stages')
+    parser.add_argument('--io-threads', type=int, default=8, help='With --engine async, concurrent file reads and writes')
+
+def valid_source(path):
+    """Accept an image file, a directory, a glob pattern, a .txt list of files or - for stdin."""
+    if path == '-':
+        return path
+    if glob.has_magic(path):
+        if not glob.glob(path):
+            raise argparse.ArgumentTypeError(f"{path} did not match any file")
+        return path
+    p = pathlib.Path(path)
+    if not (p.is_file() or p.is_dir()):
+        raise argparse.ArgumentTypeError(f"{path} is not a valid file")
+    return p
+
+BYTE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+def byte_size(text):
+    """Parse a size like 200000, 200K or 1.5M (K = 1024 bytes)."""
+    text = text.strip().lower().removesuffix('b').removesuffix('i')
+    unit = text[-1:] if text[-1:] in BYTE_UNITS else ''
+    try:
+        size = int(float(text[:len(text) - len(unit)]) * BYTE_UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text} is not a size in bytes")
+    if size <= 0:
+        raise argparse.ArgumentTypeError("The size must be positive")
+    return size
+
+def non_negative_float(text):
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text} is not a number")
+    if value < 0:
+        raise argparse.ArgumentTypeError("The value must not be negative")
+    return value
+
 def valid_file(path):
     p = pathlib.Path(path)
     if not p.is_file():
@@ -72,14 +360,26 @@ def get_extension(path):
     path = pathlib.Path(path)
     return path.suffix.lower().lstrip('.')
 
-def validate_supported_format_string(fmt, role):
-    fmt = fmt.lower()
-    if fmt not in SUPPORTED_FORMATS:
-        error(f"\033[31mUnsupported {role} format: {fmt}\nSupported formats: {', '.join(sorted(SUPPORTED_FORMATS))}\033[0m")
+def is_supported_format(fmt):
+    # the core formats are known without importing cv2
+    return fmt in SUPPORTED_FORMATS or (fmt in buffers.OPTIONAL_FORMATS and fmt in buffers.available_formats())
+
+def check_format(fmt, role):
+    # unknown formats are rejected from the static list; only WebP/AVIF need cv2 to check the build
+    if fmt not in SUPPORTED_FORMATS and fmt not in buffers.OPTIONAL_FORMATS:
+        error(f"\033[31mUnsupported {role} format: {fmt}\nSupported formats: {', '.join(buffers.CORE_FORMATS + buffers.OPTIONAL_FORMATS)}\033[0m")
+    if not is_supported_format(fmt):
+        error(f"Unsupported {role} format: {fmt} is not available in this OpenCV build")
     return fmt
 
+def validate_supported_format_string(fmt, role):
+    return check_format(fmt.lower(), role)
+
 def validate_supported_format(path, role):
-    ext = get_extension(path)
-    if ext not in SUPPORTED_FORMATS:
-        error(f"\033[31mUnsupported {role} format: {ext}\nSupported formats: {', '.join(sorted(SUPPORTED_FORMATS))}\033[0m")
-    return ext
+    return check_format(get_extension(path), role)
+
+def validate_compression(fmt, level):
+    """Not every format has every level: lossless is WebP only."""
+    levels = buffers.COMPRESSION_MAP[fmt]
+    if level not in levels:
+        error(f"Compression level {level} is not available for {fmt} (choose from: {', '.join(levels)})")
@@ -0,0 +1,177 @@
+#Work queue for batches shared by several workers and hosts
+
+# With --queue QUEUE every worker started on the same batch, on this host or
+# on another one that mounts the same filesystem, adds the batch's sources to
+# a SQLite file (once: a source is only queued one time) and then claims
+# images from it until none are left:
+#
+#   host-a$ resize -s /shared/in -d /shared/out --width 800 --height 600 --queue /shared/q.db
+#   host-b$ resize -s /shared/in -d /shared/out --width 800 --height 600 --queue /shared/q.db
+#
+# A claim is a lease of --lease seconds. A worker that crashes or loses the
+# host leaves its images claimed; once their lease runs out another worker
+# claims them again, up to MAX_ATTEMPTS times. An image that fails (a bad
+# source, an unwritable destination) is recorded as failed and not retried:
+# running it again would fail the same way. Every job runs through
+# batch.run_one, so it is validated exactly like any other batch image.
+#
+# The queue also records the command and its operation options (size,
+# format, quality, filters, destination...): a worker started with different
+# options is refused instead of writing mismatched outputs into the batch.
+# Options that only change how a worker runs (RUN_OPTIONS) may differ.
+#
+# Leases compare wall-clock times of different hosts, which need roughly
+# synchronised clocks. The file keeps SQLite's rollback journal rather than
+# WAL, since WAL does not work on network filesystems.
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import pathlib
+import contextlib
+import concurrent.futures
+import batch
+import buffers
+import utilities
+
+MAX_ATTEMPTS = 3
+# options that do not change the outputs, so workers of one queue may differ in them
+RUN_OPTIONS = {'command', 'source', 'queue', 'lease', 'shard', 'jobs', 'engine', 'prefetch', 'io_threads',
+               'cv_threads', 'cpus', 'profile', 'metrics', 'cprofile', 'cache', 'cache_max_mb', 'cache_stats',
+               'dedupe', 'dedupe_distance', 'incremental', 'framed'}
+
+SCHEMA = ['''CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    destination TEXT,
+    error TEXT
+)''', 'CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until)',
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)']
+
+
+def operation(args):
+    """The options of a batch that decide what its outputs are, as a JSON object."""
+    return json.dumps({key: value for key, value in vars(args).items() if key not in RUN_OPTIONS},
+                      sort_keys=True, default=str)
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """SQLite file of the images of a batch and of who is working on them."""
+
+    def __init__(self, path, lease=utilities.DEFAULT_LEASE, owner=None):
+        path = pathlib.Path(path).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.lease = lease
+        self.owner = owner or worker_name()
+
+    def add(self, command, sources, operation=None):
+        """Queue the sources of a batch; sources already in the queue keep their state.
+
+        Raises ValueError if the queue holds another command, or the same one
+        with other operation options (a JSON object from operation()).
+        """
+        with self.transaction():
+            self.db.execute("INSERT OR IGNORE INTO meta VALUES ('command', ?)", (command,))
+            queued = self.db.execute("SELECT value FROM meta WHERE key = 'command'").fetchone()[0]
+            if queued != command:
+                raise ValueError(f"The queue holds a {queued} batch, not {command}")
+            if operation is not None:
+                self.db.execute("INSERT OR IGNORE INTO meta VALUES ('operation', ?)", (operation,))
+                queued = self.db.execute("SELECT value FROM meta WHERE key = 'operation'").fetchone()[0]
+                if queued != operation:
+                    theirs, ours = json.loads(queued), json.loads(operation)
+                    differ = ', '.join(f"{key}={theirs.get(key)!r} (here {ours.get(key)!r})"
+                                       for key in sorted(set(theirs) | set(ours)) if theirs.get(key) != ours.get(key))
+                    raise ValueError(f"The queue holds a {command} batch with other options: {differ}")
+            self.db.executemany('INSERT OR IGNORE INTO jobs (source) VALUES (?)', ((str(s),) for s in sources))
+
+    def claim(self, count=1):
+        """Lease up to count images to this worker: pending ones first, then expired leases. Returns [(id, source)]."""
+        now = time.time()
+        with self.transaction():
+            # the worker holding these for the last allowed attempt is gone
+            self.db.execute("UPDATE jobs SET status = 'failed', error = ? WHERE status = 'claimed' AND lease_until < ? "
+                            "AND attempts >= ?", (f"Lease expired {MAX_ATTEMPTS} times", now, MAX_ATTEMPTS))
+            rows = self.db.execute("SELECT id, source FROM jobs WHERE status = 'pending' "
+                                   "OR (status = 'claimed' AND lease_until < ?) ORDER BY status = 'claimed', id LIMIT ?",
+                                   (now, count)).fetchall()
+            self.db.executemany("UPDATE jobs SET status = 'claimed', owner = ?, lease_until = ?, attempts = attempts + 1 "
+                                "WHERE id = ?", ((self.owner, now + self.lease, job_id) for job_id, _ in rows))
+        return rows
+
+    def complete(self, job_id, result):
+        """Record the result of a claimed image, unless the lease went to another worker meanwhile."""
+        status = 'done' if result['ok'] else 'failed'
+        self.db.execute('UPDATE jobs SET status = ?, destination = ?, error = ?, lease_until = NULL '
+                        "WHERE id = ? AND owner = ? AND status = 'claimed'",
+                        (status, result.get('destination'), result.get('error'), job_id, self.owner))
+
+    def counts(self):
+        return dict(self.db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never claim the same image
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.db
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+
+def run_queue(args, sources, workers, threads, recorder):
+    """Work through the queue with workers processes; returns the number of images this worker failed."""
+    queue = WorkQueue(args.queue, getattr(args, 'lease', utilities.DEFAULT_LEASE))
+    try:
+        queue.add(args.command, sources, operation(args))
+    except ValueError as e:
+        utilities.error(str(e))
+    done = failures = 0
+
+    def finish(job_id, result):
+        nonlocal done, failures
+        queue.complete(job_id, result)
+        done += 1
+        failures += batch.report(args.command, [result], recorder)
+
+    def job(source):
+        return batch.job_args(args, pathlib.Path(source))
+
+    if workers == 1:
+        buffers.set_threads(threads)
+        while claimed := queue.claim():
+            (job_id, source), = claimed
+            finish(job_id, batch.run_one(args.command, job(source)))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=buffers.set_threads,
+                                                    initargs=(threads,)) as pool:
+            pending = {}
+            while True:
+                for job_id, source in queue.claim(workers - len(pending)):
+                    pending[pool.submit(batch.run_one, args.command, job(source))] = job_id
+                if not pending:
+                    break
+                finished, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    finish(pending.pop(future), future.result())
+
+    counts = queue.counts()
+    print(f"Processed {done} image(s): {done - failures} succeeded, {failures} failed")
+    print(f"Queue {args.queue}: {counts.get('done', 0)} done, {counts.get('failed', 0)} failed, "
+          f"{counts.get('pending', 0) + counts.get('claimed', 0)} left", file=sys.stderr)
+    return failures
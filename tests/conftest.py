@@ -0,0 +1,21 @@
+import sys
+import subprocess
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+CLI_MAIN = REPO_ROOT / "src" / "image_processing" / "main.py"
+
+# The CLI modules import each other by bare name (main.py is run as a script),
+# so put their directory on sys.path for the tests as well.
+sys.path.insert(0, str(CLI_MAIN.parent))
+
+
+def run_cli(args, data=None, timeout=120):
+    """Run main.py with args in a subprocess. With bytes data stdin and stdout are binary, otherwise text.
+
+    stdin is always given, so a command that reads it never waits on the terminal.
+    """
+    cmd = [sys.executable, str(CLI_MAIN)] + list(args)
+    binary = isinstance(data, bytes)
+    return subprocess.run(cmd, cwd=str(REPO_ROOT), input=data if data is not None else "", capture_output=True,
+                          text=not binary, timeout=timeout)
@@ -0,0 +1,74 @@
+# Asyncio batch engine: overlapped reads, thread-pool transforms and bounded buffering
+
+import time
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from src.image_processing import aiobatch
+from tests.conftest import run_cli
+
+
+def _write_images(folder: Path, count, w=96, h=64):
+    folder.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        assert cv2.imwrite(str(folder / f"img{i}.png"), rng.integers(0, 255, (h, w, 3), dtype=np.uint8))
+
+
+def test_async_engine_matches_process_engine(tmp_path: Path):
+    src = tmp_path / "in"
+    _write_images(src, 5)
+    (src / "broken.png").write_text("not an image")
+
+    common = ["resize", "-s", str(src), "--width", "40", "--height", "30", "-j", "2"]
+    cp_process = run_cli(common + ["-d", str(tmp_path / "process")])
+    cp_async = run_cli(common + ["-d", str(tmp_path / "async"), "--engine", "async",
+                                 "--prefetch", "1", "--io-threads", "2"])
+
+    assert cp_async.returncode == cp_process.returncode == 1
+    assert "5 succeeded, 1 failed" in cp_async.stdout
+    assert "broken.png" in cp_async.stderr
+    names = sorted(p.name for p in (tmp_path / "process").iterdir())
+    assert names == sorted(p.name for p in (tmp_path / "async").iterdir())
+    for name in names:
+        assert (tmp_path / "process" / name).read_bytes() == (tmp_path / "async" / name).read_bytes()
+
+
+def test_in_flight_images_are_bounded(tmp_path: Path, monkeypatch):
+    _write_images(tmp_path, 20, w=32, h=32)
+    out = tmp_path / "out"
+    out.mkdir()
+    in_flight, peak = [0], [0]
+    lock = threading.Lock()
+    read_step, write_step = aiobatch.read_step, aiobatch.write_step
+
+    def counting_read(job):
+        read_step(job)
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+
+    def slow_write(job):
+        time.sleep(0.01)  # a slow disk: writers are the bottleneck
+        try:
+            write_step(job)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    monkeypatch.setattr(aiobatch, "read_step", counting_read)
+    monkeypatch.setattr(aiobatch, "write_step", slow_write)
+    jobs = [SimpleNamespace(command="convert", source=p, destination=str(out / f"{p.stem}.jpg"),
+                            format="jpg", compression="medium", force=True)
+            for p in sorted(tmp_path.glob("*.png"))]
+
+    results = aiobatch.run_jobs("convert", jobs, workers=2, prefetch=1, io_threads=1)
+
+    assert len(results) == 20 and all(r["ok"] for r in results)
+    assert {"read", "decode", "encode", "write"} <= set(results[0]["stages_ms"])
+    assert peak[0] <= 2 * 1 + 2 * 1 + 2
+    assert len(list(out.iterdir())) == 20
@@ -0,0 +1,88 @@
+# Batch mode for convert and resize (directory, glob and file-list sources)
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from src.image_processing import batch
+from tests.conftest import run_cli
+
+
+def _write_images(folder: Path, names, w=64, h=48):
+    folder.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        img = np.full((h, w, 3), 127, dtype=np.uint8)
+        assert cv2.imwrite(str(folder / name), img)
+
+
+def test_expand_sources_directory_glob_and_list(tmp_path: Path):
+    _write_images(tmp_path, ["a.png", "b.jpg"])
+    (tmp_path / "notes.md").write_text("not an image")
+    listing = tmp_path / "files.txt"
+    listing.write_text("a.png\n\nb.jpg\n")
+
+    from_dir = batch.expand_sources([tmp_path])
+    from_glob = batch.expand_sources([str(tmp_path / "*.png")])
+    from_list = batch.expand_sources([listing])
+
+    assert [p.name for p in from_dir] == ["a.png", "b.jpg"]
+    assert [p.name for p in from_glob] == ["a.png"]
+    assert [p.name for p in from_list] == ["a.png", "b.jpg"]
+    # duplicates are dropped
+    assert len(batch.expand_sources([tmp_path, str(tmp_path / "*.png")])) == 2
+
+
+def test_is_batch():
+    assert not batch.is_batch([Path(__file__)])
+    assert batch.is_batch([Path(__file__), Path(__file__)])
+    assert batch.is_batch([Path(__file__).parent])
+    assert batch.is_batch(["*.png"])
+
+
+def test_run_one_reports_failure_instead_of_exiting(tmp_path: Path):
+    bad = tmp_path / "bad.png"
+    bad.write_text("not an image")
+    args = SimpleNamespace(source=bad, destination=None, width=0, height=10, force=True)
+
+    result = batch.run_one("resize", args)
+
+    assert result["ok"] is False
+    assert "positive" in result["error"]
+
+
+def test_batch_convert_directory_to_output_dir(tmp_path: Path):
+    src = tmp_path / "in"
+    out = tmp_path / "out"
+    _write_images(src, ["a.png", "b.png", "c.tiff"])
+
+    cp = run_cli(["convert", "-s", str(src), "-d", str(out), "-f", "jpg", "--jobs", "2"])
+
+    assert cp.returncode == 0, cp.stdout + cp.stderr
+    # same names single-file mode would produce without --destination
+    assert sorted(p.name for p in out.iterdir()) == ["a_converted.jpg", "b_converted.jpg", "c_converted.jpg"]
+    assert "3 succeeded, 0 failed" in cp.stdout
+
+
+def test_batch_resize_glob_next_to_sources(tmp_path: Path):
+    _write_images(tmp_path, ["a.png", "b.png"])
+
+    cp = run_cli(["resize", "-s", str(tmp_path / "*.png"), "--width", "20", "--height", "10", "--jobs", "2"])
+
+    assert cp.returncode == 0, cp.stdout + cp.stderr
+    for name in ["a_resized.png", "b_resized.png"]:
+        img = cv2.imread(str(tmp_path / name))
+        assert img is not None and img.shape[:2] == (10, 20)
+
+
+def test_batch_failure_is_reported_per_file(tmp_path: Path):
+    _write_images(tmp_path, ["good.png"])
+    (tmp_path / "bad.png").write_text("this is not a real image")
+
+    cp = run_cli(["convert", "-s", str(tmp_path / "good.png"), str(tmp_path / "bad.png"), "-f", "jpg"])
+
+    assert cp.returncode != 0
+    assert (tmp_path / "good_converted.jpg").exists()
+    assert "bad.png" in cp.stderr
+    assert "1 succeeded, 1 failed" in cp.stdout
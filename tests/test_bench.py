@@ -0,0 +1,69 @@
+# Benchmark harness: report shape and baseline comparison
+
+from benchmarks import bench
+
+
+def _report(**metrics):
+    result = {"name": "library/convert/png->jpg-medium/640x480", "iterations": 10, "images_per_sec": 100.0,
+              "p50_ms": 10.0, "p99_ms": 12.0, "peak_rss_mb": 70.0, "output_bytes": 1000}
+    result.update(metrics)
+    return {"meta": {}, "results": [result]}
+
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    baseline = _report()
+    assert bench.compare(_report(images_per_sec=90.0, p50_ms=11.0), baseline, 0.25) == []
+    assert bench.compare(_report(images_per_sec=200.0, p50_ms=5.0), baseline, 0.25) == []
+
+    regressions = bench.compare(_report(images_per_sec=50.0, peak_rss_mb=140.0), baseline, 0.25)
+    assert len(regressions) == 2
+    assert any("images_per_sec" in line for line in regressions)
+    assert any("peak_rss_mb" in line for line in regressions)
+
+
+def test_summarize_percentiles():
+    summary = bench.summarize("x", [0.01] * 98 + [0.5] * 2, 123, 2048)
+    assert summary["p50_ms"] == 10.0
+    assert summary["p99_ms"] == 500.0
+    assert summary["peak_rss_mb"] == 2.0
+    assert summary["output_bytes"] == 123
+
+
+def test_build_cases_cover_levels_and_interpolations():
+    cases = bench.build_cases(["small"], ["png"], ["low", "high"])
+    converts = [c for c in cases if c["op"] == "convert"]
+    resizes = [c for c in cases if c["op"] == "resize"]
+    assert {(c["format"], c["level"]) for c in converts} == {("jpg", "low"), ("jpg", "high"), ("tiff", "low"), ("tiff", "high")}
+    # one shrinking (INTER_AREA) and one enlarging (INTER_LINEAR) resize per source
+    assert sorted(c["width"] for c in resizes) == [320, 960]
+
+
+def test_quick_library_run(tmp_path):
+    out = tmp_path / "bench.json"
+    assert bench.main(["--quick", "--paths", "library", "--repeat", "2", "--output", str(out),
+                       "--save-baseline", str(tmp_path / "base.json")]) == 0
+    report = out.read_text()
+    assert "images_per_sec" in report and "peak_rss_mb" in report
+    # a run never regresses against itself with a generous tolerance
+    assert bench.main(["--quick", "--paths", "library", "--repeat", "2", "--output", str(out),
+                       "--baseline", str(tmp_path / "base.json"), "--tolerance", "100"]) == 0
+
+
+def test_thread_splits_compare_auto_with_opencv_defaults():
+    cases = [c for c in bench.build_cases(["small"], ["png"], ["medium"]) if c["op"] == "threads"]
+    assert sorted(c["cv_threads"] for c in cases) == ["auto", "opencv"]
+    results = [{"name": bench.case_name("cli", c), "images_per_sec": 30.0 if c["cv_threads"] == "auto" else 20.0}
+               for c in cases]
+
+    (split,) = bench.thread_splits(results)
+    assert split["speedup"] == 1.5
+    assert "-cv-" not in split["name"]
+
+
+def test_format_table_reports_every_available_format(monkeypatch):
+    import buffers
+    monkeypatch.setattr(bench, "SIZES", {"tiny": (48, 32)})
+    rows = bench.format_table(["tiny"], 1)
+    expected = {(fmt, level) for fmt in buffers.available_formats() if fmt != "jpeg" for level in buffers.COMPRESSION_MAP[fmt]}
+    assert {(r["format"], r["level"]) for r in rows} == expected
+    assert all(r["bytes"] > 0 and r["encode_ms"] >= 0 for r in rows)
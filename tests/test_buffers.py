@@ -0,0 +1,101 @@
+# In-memory API: decode/encode/resize_array on bytes, memoryviews and arrays
+
+import cv2
+import numpy as np
+import pytest
+
+import src.image_processing as image_processing
+from src.image_processing import buffers
+
+
+def _image(w=64, h=48):
+    img = np.zeros((h, w, 3), dtype=np.uint8)
+    cv2.circle(img, (w // 2, h // 2), min(w, h) // 3, (40, 180, 250), -1)
+    return img
+
+
+def test_package_exports():
+    assert image_processing.decode is buffers.decode
+    assert image_processing.encode is buffers.encode
+    assert image_processing.resize_array is buffers.resize_array
+
+
+@pytest.mark.parametrize("fmt, magic", [("png", b"\x89PNG"), ("jpg", b"\xff\xd8"), ("tiff", b"II*\x00")])
+def test_encode_decode_roundtrip(fmt, magic):
+    img = _image()
+    data = buffers.encode(img, fmt, "medium")
+    assert bytes(data[:len(magic)]) == magic
+
+    for view in (bytes(data), bytearray(data), data, np.frombuffer(data, dtype=np.uint8)):
+        decoded = buffers.decode(view)
+        assert decoded.shape == img.shape
+
+
+def test_png_roundtrip_is_lossless():
+    img = _image()
+    assert np.array_equal(buffers.decode(buffers.encode(img, "png", "high")), img)
+
+
+def test_compression_levels_change_jpeg_size():
+    img = np.random.default_rng(0).integers(0, 255, (128, 128, 3), dtype=np.uint8)
+    low = buffers.encode(img, "jpg", "low")
+    high = buffers.encode(img, "jpg", "high")
+    assert len(high) < len(low)
+
+
+def test_decode_rejects_garbage():
+    with pytest.raises(ValueError):
+        buffers.decode(b"this is not an image")
+    with pytest.raises(ValueError):
+        buffers.decode(b"")
+
+
+def test_encode_rejects_unknown_level():
+    with pytest.raises(ValueError):
+        buffers.encode(_image(), "png", "extreme")
+
+
+def test_resize_array():
+    img = _image(200, 100)
+    assert buffers.resize_array(img, 50, 25).shape == (25, 50, 3)
+    assert buffers.resize_array(img, 400, 300).shape == (300, 400, 3)
+    assert buffers.choose_interpolation(img, 50, 25) == cv2.INTER_AREA
+    assert buffers.choose_interpolation(img, 400, 50) == cv2.INTER_LINEAR
+    with pytest.raises(ValueError):
+        buffers.resize_array(img, 0, 10)
+
+
+def _smooth_jpeg(w, h):
+    img = np.random.default_rng(1).integers(0, 255, (h, w, 3), dtype=np.uint8)
+    return bytes(buffers.encode(cv2.GaussianBlur(img, (0, 0), 4), "jpg", "low"))
+
+
+def test_jpeg_size_reads_header_only():
+    assert buffers.jpeg_size(_smooth_jpeg(320, 200)) == (320, 200)
+    assert buffers.jpeg_size(buffers.encode(_image(), "png")) is None
+    assert buffers.jpeg_size(b"\xff\xd8") is None
+
+
+@pytest.mark.parametrize("src, target, factor", [
+    ((4000, 3000), (800, 600), 4),
+    ((4000, 3000), (400, 300), 8),
+    ((4000, 3000), (2000, 1500), 2),
+    ((4000, 3000), (2001, 1500), 1),
+])
+def test_reduction_factor(src, target, factor):
+    assert buffers.reduction_factor(*src, *target) == factor
+
+
+def test_decode_for_size_reduces_large_jpeg_downscales():
+    data = _smooth_jpeg(1600, 1200)
+
+    reduced = buffers.decode_for_size(data, 200, 150)
+    full = buffers.decode(data)
+
+    assert reduced.shape == (150, 200, 3)
+    a = buffers.resize_array(full, 200, 150).astype(int)
+    b = buffers.resize_array(reduced, 200, 150).astype(int)
+    assert np.abs(a - b).mean() < 2.0
+    # small downscales and other formats decode in full
+    assert buffers.decode_for_size(data, 1000, 800).shape == (1200, 1600, 3)
+    assert buffers.decode_for_size(buffers.encode(full, "png"), 200, 150).shape == (1200, 1600, 3)
@@ -0,0 +1,125 @@
+# Content-addressed result cache for convert and resize
+
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from src.image_processing import cache, convert, resize, utilities
+from tests.conftest import run_cli
+
+
+def _write_image(path: Path, w=64, h=48, value=120):
+    assert cv2.imwrite(str(path), np.full((h, w, 3), value, dtype=np.uint8))
+
+
+def test_key_depends_on_content_and_operation():
+    op = cache.convert_operation("jpg", "high")
+    assert cache.operation_key(b"a", op) == cache.operation_key(b"a", dict(op))
+    assert cache.operation_key(b"a", op) != cache.operation_key(b"b", op)
+    assert cache.operation_key(b"a", op) != cache.operation_key(b"a", cache.convert_operation("jpg", "low"))
+    # jpg and jpeg encode the same bytes
+    assert cache.convert_operation("jpeg", "high") == op
+
+
+def test_convert_hit_is_served_from_cache(tmp_path: Path, monkeypatch):
+    src = tmp_path / "input.png"
+    _write_image(src)
+    cache_dir = tmp_path / "cache"
+
+    def run(dest):
+        args = SimpleNamespace(source=str(src), destination=str(dest), format="jpg", compression="high",
+                               force=False, cache=str(cache_dir), cache_max_mb=10)
+        return convert.validatecommandsandconvert(args)
+
+    first = run(tmp_path / "a.jpg")
+    # a hit must not decode again
+    def fail_decode(*args):
+        raise AssertionError("cache hit should not decode")
+    monkeypatch.setattr(convert.buffers, "decode", fail_decode)
+    second = run(tmp_path / "b.jpg")
+
+    assert first.read_bytes() == second.read_bytes()
+    assert os.path.samefile(second, next((cache_dir).glob("??/*.jpg")))
+    stats = cache.ResultCache(cache_dir).stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_resize_uses_cache_per_size(tmp_path: Path):
+    src = tmp_path / "input.png"
+    _write_image(src)
+    cache_dir = tmp_path / "cache"
+    for name, w in [("a.png", 10), ("b.png", 10), ("c.png", 20)]:
+        args = SimpleNamespace(source=str(src), destination=str(tmp_path / name), width=w, height=10,
+                               force=True, cache=str(cache_dir))
+        resize.validate_resize_arguments(args)
+        resize.resize_image(args)
+
+    stats = cache.ResultCache(cache_dir).stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    assert cv2.imread(str(tmp_path / "c.png")).shape[:2] == (10, 20)
+
+
+def test_forced_overwrite_does_not_touch_cached_entry(tmp_path: Path):
+    src = tmp_path / "input.png"
+    _write_image(src)
+    results = cache.ResultCache(tmp_path / "cache")
+    entry = results.store("ab" * 32, "png", src.read_bytes())
+    dest = results.materialize(entry, tmp_path / "out.png")
+
+    assert utilities.write_image(dest, b"new contents")
+    assert entry.read_bytes() == src.read_bytes()
+
+
+def test_lru_eviction(tmp_path: Path):
+    results = cache.ResultCache(tmp_path / "cache", max_bytes=250)
+    old = results.store("aa" * 32, "png", b"x" * 100)
+    recent = results.store("bb" * 32, "png", b"x" * 100)
+    assert results.lookup("aa" * 32, "png") == old  # a hit makes it recent again
+    results.store("cc" * 32, "png", b"x" * 100)
+
+    assert old.exists() and not recent.exists()
+    stats = results.stats()
+    assert stats["evictions"] == 1 and stats["bytes"] == 200
+
+
+def test_eviction_frees_down_to_low_water(tmp_path: Path):
+    results = cache.ResultCache(tmp_path / "cache", max_bytes=1000)
+    for i in range(11):
+        results.store(f"{i:02d}" * 32, "png", b"x" * 100)
+    assert results.stats()["evictions"] == 2  # 1100 -> 900, not just under 1000
+
+    scans = []
+    results.evict = lambda *args: scans.append(args)
+    results.store("ff" * 32, "png", b"x" * 100)
+
+    assert scans == [] and results.stats()["bytes"] == 1000
+
+
+def test_hits_do_not_touch_published_outputs(tmp_path: Path):
+    results = cache.ResultCache(tmp_path / "cache")
+    entry = results.store("aa" * 32, "png", b"x" * 100)
+    dest = results.materialize(entry, tmp_path / "out.png")
+    os.utime(dest, (1, 1))
+
+    for _ in range(3):
+        assert results.lookup("aa" * 32, "png") == entry
+    assert results.lookup("bb" * 32, "png") is None
+
+    assert dest.stat().st_mtime == 1
+    stats = results.stats()
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+
+
+def test_cli_cache_stats(tmp_path: Path):
+    src = tmp_path / "input.png"
+    _write_image(src)
+    cmd = ["convert", "-s", str(src), "-f", "jpg", "--cache", str(tmp_path / "cache"), "--cache-stats"]
+    assert run_cli(cmd).returncode == 0
+    cp = run_cli(cmd)
+
+    assert cp.returncode == 0, cp.stderr
+    assert "cached" in cp.stdout
+    assert "1 hits, 1 misses" in cp.stdout
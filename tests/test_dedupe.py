@@ -0,0 +1,111 @@
+# Perceptual-hash index: near-duplicate sources reuse an earlier output
+
+import random
+from pathlib import Path
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_processing import buffers, convert, dedupe, resize
+from tests.conftest import run_cli
+
+
+def _photo(w=320, h=240, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:h, 0:w].astype(np.float32)
+    img = np.dstack([x / w * 255, y / h * 255, (x + y) / (w + h) * 255]) + rng.normal(0, 10, (h, w, 3))
+    img = cv2.GaussianBlur(np.clip(img, 0, 255).astype(np.uint8), (0, 0), 1.5)
+    cv2.circle(img, (int(rng.integers(60, w - 60)), h // 2), 50, (30, 200, 240), -1)
+    return img
+
+
+def _resaved(path: Path, dest: Path, quality):
+    cv2.imwrite(str(dest), cv2.imread(str(path)), [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+
+def test_fingerprint_survives_resaving_but_not_other_content(tmp_path: Path):
+    cv2.imwrite(str(tmp_path / "a.jpg"), _photo(), [cv2.IMWRITE_JPEG_QUALITY, 95])
+    _resaved(tmp_path / "a.jpg", tmp_path / "b.jpg", 60)
+    cv2.imwrite(str(tmp_path / "c.jpg"), cv2.flip(_photo(seed=1), 1))
+    a, b, c = (buffers.fingerprint((tmp_path / n).read_bytes()) for n in ("a.jpg", "b.jpg", "c.jpg"))
+
+    assert buffers.hamming(a.dhash, b.dhash) <= dedupe.DEFAULT_DISTANCE
+    assert buffers.hamming(a.dhash, c.dhash) > dedupe.MAX_DISTANCE
+    assert max(abs(p - q) for p, q in zip(a.colour, b.colour)) <= dedupe.COLOUR_TOLERANCE
+
+
+@pytest.mark.parametrize("distance", [3, 7, 11])
+def test_multi_index_search_matches_brute_force(tmp_path: Path, distance):
+    rng = random.Random(distance)
+    index = dedupe.DuplicateIndex(tmp_path / "index.db", distance)
+    stored = [rng.getrandbits(64) for _ in range(2000)]
+    query = stored[0]
+    # plant hashes at every distance around the query
+    for d in range(distance + 3):
+        stored.append(query ^ sum(1 << bit for bit in rng.sample(range(64), d)))
+    for i, h in enumerate(stored):
+        index.record(dedupe.Key("g", h, (10, 10, 10)), f"src{i}", tmp_path / f"out{i}")
+
+    found = {row[3] for row in index.candidates(dedupe.Key("g", query, (10, 10, 10)))
+             if buffers.hamming(row[0] & ((1 << 64) - 1), query) <= distance}
+    expected = {str(tmp_path / f"out{i}") for i, h in enumerate(stored) if buffers.hamming(h, query) <= distance}
+
+    assert found == expected
+    # another group, or another mean colour, is never a match
+    assert not index.candidates(dedupe.Key("other", query, (10, 10, 10)))
+    (tmp_path / "out0").write_bytes(b"x")
+    assert index.find(dedupe.Key("g", query, (10, 10, 10))).output == str(tmp_path / "out0")
+    assert index.find(dedupe.Key("g", query, (200, 10, 10))) is None
+
+
+def test_lookups_use_the_chunk_indexes(tmp_path: Path):
+    index = dedupe.DuplicateIndex(tmp_path / "index.db")
+    plan = index.db.execute("EXPLAIN QUERY PLAN SELECT hash FROM sources WHERE grp = ? AND c2 IN (?, ?)", ("g", 1, 2)).fetchall()
+    assert any("sources_c2" in row[-1] for row in plan)
+
+
+def test_resaved_source_reuses_the_earlier_output(tmp_path: Path):
+    src = tmp_path / "photo.jpg"
+    cv2.imwrite(str(src), _photo(), [cv2.IMWRITE_JPEG_QUALITY, 95])
+    _resaved(src, tmp_path / "upload.jpg", 70)
+    cv2.imwrite(str(tmp_path / "other.jpg"), cv2.flip(_photo(seed=3), 0))
+    index = tmp_path / "dedupe.db"
+
+    def convert(name):
+        return run_cli(["convert", "-s", str(tmp_path / name), "-d", str(tmp_path / f"{Path(name).stem}.png"),
+                        "--dedupe", str(index)])
+
+    first, again, other = convert("photo.jpg"), convert("upload.jpg"), convert("other.jpg")
+
+    assert first.returncode == again.returncode == other.returncode == 0, first.stderr + again.stderr + other.stderr
+    assert "Near-duplicate of" in again.stdout and str(src) in again.stdout
+    assert (tmp_path / "upload.png").read_bytes() == (tmp_path / "photo.png").read_bytes()
+    assert "Near-duplicate" not in other.stdout
+    # a different operation does not share outputs
+    resized = run_cli(["resize", "-s", str(tmp_path / "upload.jpg"), "-d", str(tmp_path / "small.jpg"),
+                       "--width", "160", "--height", "120", "--dedupe", str(index)])
+    assert resized.returncode == 0 and "Near-duplicate" not in resized.stdout
+
+
+def test_png_source_is_decoded_once(tmp_path: Path, monkeypatch):
+    src = tmp_path / "photo.png"
+    cv2.imwrite(str(src), _photo())
+    decodes = []
+    real = convert.buffers.decode
+    monkeypatch.setattr(convert.buffers, "decode", lambda *args: decodes.append(1) or real(*args))
+
+    args = SimpleNamespace(source=str(src), destination=str(tmp_path / "out.jpg"), format="jpg", compression="high",
+                           force=False, dedupe=str(tmp_path / "dedupe.db"))
+    convert.validatecommandsandconvert(args)
+    args = SimpleNamespace(source=str(src), destination=str(tmp_path / "small.png"), width=80, height=60,
+                           force=False, dedupe=str(tmp_path / "dedupe.db"))
+    resize.validate_resize_arguments(args)
+    resize.resize_image(args)
+
+    # the fingerprint's decode is the one the transform uses
+    assert len(decodes) == 2
+    assert cv2.imread(str(tmp_path / "small.png")).shape == (60, 80, 3)
+    data = src.read_bytes()
+    assert buffers.fingerprint(data, buffers.shared_decode(data)) == buffers.fingerprint(data)
@@ -0,0 +1,81 @@
+# Destination allocation: numbered names without a cap, atomic publish, parallel writers
+
+import sys
+import subprocess
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from src.image_processing import utilities
+from tests.conftest import CLI_MAIN, run_cli
+
+
+def test_no_cap_on_numbered_names(tmp_path: Path):
+    src = tmp_path / "input.png"
+    assert cv2.imwrite(str(src), np.zeros((8, 8, 3), dtype=np.uint8))
+    (tmp_path / "output.jpg").write_bytes(b"keep")
+    for i in range(1, 201):
+        (tmp_path / f"output_{i}.jpg").write_bytes(b"keep")
+
+    cp = run_cli(["convert", "-s", str(src), "-d", str(tmp_path / "output.jpg")], timeout=60)
+
+    assert cp.returncode == 0, cp.stderr
+    assert cv2.imread(str(tmp_path / "output_201.jpg")) is not None
+    assert (tmp_path / "output.jpg").read_bytes() == b"keep"
+
+
+def test_parallel_processes_take_consecutive_names(tmp_path: Path):
+    src = tmp_path / "s.png"
+    assert cv2.imwrite(str(src), np.zeros((8, 8, 3), dtype=np.uint8))
+    dest = tmp_path / "t.png"
+    dest.write_bytes(b"original")
+
+    # every process scans the directory on its own, so they all propose t_1 first
+    procs = [subprocess.Popen([sys.executable, str(CLI_MAIN), "convert", "-s", str(src), "-d", str(dest)],
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) for _ in range(4)]
+    for p in procs:
+        _, err = p.communicate(timeout=60)
+        assert p.returncode == 0, err
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["s.png", "t.png", "t_1.png", "t_2.png", "t_3.png", "t_4.png"]
+    assert dest.read_bytes() == b"original"
+
+
+def test_lost_proposal_numbers_the_original_name(tmp_path: Path):
+    dest = tmp_path / "out.png"
+    dest.write_bytes(b"original")
+    proposed = utilities.givecorrectdestination(dest, force=False)
+    assert proposed.name == "out_1.png"
+    tmp = utilities.temp_path(proposed)
+    tmp.write_bytes(b"new")
+    proposed.write_bytes(b"written by another process meanwhile")
+
+    final = utilities.publish(tmp, proposed, replace=False)
+
+    assert final.name == "out_2.png" and final.read_bytes() == b"new"
+
+
+def test_publish_takes_next_name_when_destination_appears(tmp_path: Path):
+    dest = tmp_path / "photo.png"
+    tmp = utilities.temp_path(dest)
+    tmp.write_bytes(b"new")
+    dest.write_bytes(b"written by someone else meanwhile")
+
+    final = utilities.publish(tmp, dest, replace=False)
+
+    assert final.name == "photo_1.png" and final.read_bytes() == b"new"
+    assert not tmp.exists()
+
+
+def test_replace_is_a_rename(tmp_path: Path):
+    dest = tmp_path / "photo.png"
+    dest.write_bytes(b"old")
+    reader = open(dest, "rb")
+
+    assert utilities.write_image(dest, b"new") == dest
+
+    # an open reader keeps the complete old file, new readers get the complete new one
+    assert reader.read() == b"old"
+    reader.close()
+    assert dest.read_bytes() == b"new"
@@ -0,0 +1,75 @@
+# Execution settings: --cv-threads, --jobs and --cpus, and the auto split of the cores
+
+import os
+import sys
+import argparse
+import subprocess
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_processing import utilities
+from tests.conftest import CLI_MAIN, run_cli
+
+MODULE_DIR = CLI_MAIN.parent
+
+
+def test_cpu_list_and_thread_values():
+    assert utilities.cpu_list("0-3,8") == {0, 1, 2, 3, 8}
+    assert utilities.cpu_list("2") == {2}
+    assert utilities.cv_threads_value("auto") == "auto"
+    assert utilities.cv_threads_value("3") == 3
+    for bad in ("", "a-b", "3-1", "-1"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            utilities.cpu_list(bad)
+    with pytest.raises(argparse.ArgumentTypeError):
+        utilities.cv_threads_value("0")
+
+
+@pytest.mark.parametrize("jobs, images, pixels, cv_threads, expected", [
+    (None, 100, 4000 * 3000, "auto", (8, 1)),     # a big batch: one thread per worker
+    (None, 2, 4000 * 3000, "auto", (2, 4)),       # few large images share the spare cores
+    (None, 2, 640 * 480, "auto", (2, 1)),         # small images are not worth splitting
+    (None, 1, None, "auto", (1, 8)),              # a single image of unknown size gets every core
+    (3, 100, 4000 * 3000, "auto", (3, 2)),
+    (3, 100, 4000 * 3000, 4, (3, 4)),
+    (3, 100, 4000 * 3000, "opencv", (3, None)),
+])
+def test_split_cores(jobs, images, pixels, cv_threads, expected):
+    assert utilities.split_cores(8, jobs, images, pixels, cv_threads) == expected
+
+
+def test_thread_count_applies_when_cv2_is_first_used():
+    code = ("import sys, buffers; buffers.set_threads(3); assert 'cv2' not in sys.modules;"
+            "print(buffers.cv2.getNumThreads()); buffers.set_threads(1); print(buffers.cv2.getNumThreads())")
+    cp = subprocess.run([sys.executable, "-c", code], cwd=str(MODULE_DIR), capture_output=True, text=True, timeout=30)
+    assert cp.returncode == 0, cp.stderr
+    # 1 thread runs in the caller: OpenCV reports that as a pool of one
+    assert cp.stdout.split() == ["3", "1"]
+
+
+def test_batch_runs_pinned_with_explicit_settings(tmp_path: Path):
+    src = tmp_path / "in"
+    src.mkdir()
+    for i in range(3):
+        cv2.imwrite(str(src / f"{i}.png"), np.full((40, 60, 3), i * 40, np.uint8))
+    cpu = min(os.sched_getaffinity(0))
+
+    cp = run_cli(["resize", "-s", str(src), "-d", str(tmp_path / "out"), "--width", "30", "--height", "20",
+                  "-j", "2", "--cv-threads", "2", "--cpus", str(cpu)])
+
+    assert cp.returncode == 0, cp.stderr
+    assert len(list((tmp_path / "out").iterdir())) == 3
+
+
+def test_unusable_cpus_and_jobs_are_rejected(tmp_path: Path):
+    src = tmp_path / "in.png"
+    cv2.imwrite(str(src), np.zeros((10, 10, 3), np.uint8))
+
+    no_cpu = run_cli(["resize", "-s", str(src), "--width", "5", "--height", "5", "--cpus", "100000"])
+    no_jobs = run_cli(["resize", "-s", str(src), "--width", "5", "--height", "5", "-j", "0"])
+
+    assert no_cpu.returncode != 0 and "CPUs" in no_cpu.stderr
+    assert no_jobs.returncode != 0 and "positive" in no_jobs.stderr
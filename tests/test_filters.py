@@ -0,0 +1,97 @@
+# Filter chain: fused blur/sharpen/LUT steps, the filter command and resize filters
+
+import json
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_processing import filters
+from tests.conftest import run_cli
+
+
+def _image(w=80, h=60, channels=3, dtype=np.uint8):
+    shape = (h, w, channels) if channels > 1 else (h, w)
+    peak = np.iinfo(dtype).max
+    return np.random.default_rng(5).integers(0, peak, shape, endpoint=True).astype(dtype)
+
+
+def test_point_steps_fuse_into_one_lookup_table():
+    steps = [["blur", 1.0], ["blur", 1.0], ["gamma", 2.0], ["levels", [0, 255]], ["recolour", [1, 1, 1]], ["sharpen", [1.0, 1.0]]]
+    passes = filters.plan_filters(steps, np.dtype(np.uint8), 3)
+    assert [p[0] for p in passes] == ["blur", "lut", "sharpen"]
+    assert passes[0][1] == pytest.approx(2 ** 0.5)
+    assert passes[1][1].shape == (256, 3)
+
+
+def test_blur_matches_gaussian_blur():
+    img = _image()
+    expected = cv2.GaussianBlur(img, (0, 0), 2.0, borderType=cv2.BORDER_REFLECT_101)
+    out = filters.filter_array(img.copy(), [["blur", 2.0]])
+    assert np.abs(out.astype(int) - expected.astype(int)).max() <= 1
+
+
+def test_gamma_and_levels_tables_match_the_formulas():
+    img = _image(channels=1)
+    out = filters.filter_array(img.copy(), [["levels", [50, 200]], ["gamma", 2.0]])
+    x = np.clip((img / 255 - 50 / 255) / (150 / 255), 0, 1) ** 0.5
+    assert np.abs(out.astype(int) - np.rint(x * 255).astype(int)).max() <= 1
+
+
+def test_recolour_scales_rgb_and_leaves_alpha_alone():
+    img = _image(channels=4, dtype=np.uint16)
+    out = filters.filter_array(img.copy(), [["recolour", [0.0, 1.0, 0.5]], ["gamma", 1.5]])
+    assert out.dtype == np.uint16
+    assert np.array_equal(out[..., 3], img[..., 3])
+    assert out[..., 2].max() == 0  # red, cv2 order is BGR(A)
+    with pytest.raises(ValueError):
+        filters.filter_array(_image(channels=1), [["recolour", [1, 1, 1]]])
+
+
+def test_sharpen_adds_contrast_and_read_only_frames_are_copied():
+    img = cv2.GaussianBlur(_image(), (0, 0), 3)
+    img.flags.writeable = False
+    out = filters.filter_array(img, [["sharpen", [2.0, 2.0]]])
+    assert out is not img
+    assert out.std() > img.std()
+
+
+def test_filter_command_keeps_order_and_format(tmp_path: Path):
+    src = tmp_path / "in.png"
+    cv2.imwrite(str(src), _image())
+
+    cp = run_cli(["filter", "-s", str(src), "--gamma", "1.5", "--blur", "1"])
+
+    assert cp.returncode == 0, cp.stderr
+    out = cv2.imread(str(tmp_path / "in_filtered.png"))
+    expected = filters.filter_array(_image(), [["gamma", 1.5], ["blur", 1.0]])
+    assert np.array_equal(out, expected)
+
+
+def test_resize_with_filters_decodes_and_encodes_once(tmp_path: Path):
+    src = tmp_path / "in.jpg"
+    cv2.imwrite(str(src), _image(400, 300))
+    out = tmp_path / "out.jpg"
+    profile = tmp_path / "profile.jsonl"
+
+    cp = run_cli(["resize", "-s", str(src), "-d", str(out), "--width", "100", "--height", "75",
+                  "--sharpen", "0.5", "--recolour", "1.1,1,0.9", "--profile", str(profile)])
+
+    assert cp.returncode == 0, cp.stderr
+    assert cv2.imread(str(out)).shape == (75, 100, 3)
+    stages = json.loads(profile.read_text())["stages_ms"]
+    assert {"decode", "transform", "filter", "encode"} <= set(stages)
+
+
+@pytest.mark.parametrize("args, message", [
+    (["filter"], "at least one filter"),
+    (["filter", "--blur", "1", "--width", "10"], "go together"),
+    (["resize", "--width", "10", "--height", "10", "--tiled", "--blur", "1"], "does not run filters"),
+])
+def test_filter_argument_errors(tmp_path: Path, args, message):
+    src = tmp_path / "in.png"
+    cv2.imwrite(str(src), _image())
+    cp = run_cli(args[:1] + ["-s", str(src)] + args[1:])
+    assert cp.returncode != 0
+    assert message in cp.stderr
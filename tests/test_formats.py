@@ -0,0 +1,63 @@
+# WebP and AVIF outputs, offered when the local cv2 build has the codecs
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_processing import buffers
+from tests.conftest import run_cli
+
+
+def _noisy(w=64, h=48):
+    return np.random.default_rng(0).integers(0, 256, (h, w, 3), dtype=np.uint8)
+
+
+def needs(fmt):
+    return pytest.mark.skipif(fmt not in buffers.available_formats(), reason=f"cv2 built without {fmt}")
+
+
+def test_presets_set_every_encoder_parameter():
+    assert buffers.write_params("avif", "medium") == [cv2.IMWRITE_AVIF_QUALITY, 75, cv2.IMWRITE_AVIF_SPEED, 8]
+    assert buffers.write_params("webp", "lossless") == [cv2.IMWRITE_WEBP_QUALITY, 101]
+    assert buffers.write_params("png", "high") == [cv2.IMWRITE_PNG_COMPRESSION, 9]
+    assert set(buffers.CORE_FORMATS) <= set(buffers.available_formats())
+
+
+@needs("webp")
+def test_webp_lossless_round_trips_and_lossy_is_smaller(tmp_path: Path):
+    src = tmp_path / "in.png"
+    cv2.imwrite(str(src), _noisy())
+
+    lossless = run_cli(["convert", "-s", str(src), "-d", str(tmp_path / "exact.webp"), "-c", "lossless"])
+    lossy = run_cli(["convert", "-s", str(src), "-f", "webp", "-c", "high"])
+
+    assert lossless.returncode == 0 and lossy.returncode == 0, lossless.stderr + lossy.stderr
+    assert np.array_equal(cv2.imread(str(tmp_path / "exact.webp")), _noisy())
+    assert (tmp_path / "in_converted.webp").stat().st_size < (tmp_path / "exact.webp").stat().st_size
+
+
+@needs("avif")
+def test_avif_output_and_webp_sources_in_a_batch(tmp_path: Path):
+    src = tmp_path / "in"
+    src.mkdir()
+    cv2.imwrite(str(src / "a.webp"), _noisy())
+    cv2.imwrite(str(src / "b.png"), _noisy())
+
+    cp = run_cli(["convert", "-s", str(src), "-d", str(tmp_path / "out"), "-f", "avif", "-j", "1"])
+
+    assert cp.returncode == 0, cp.stderr
+    outputs = sorted(p.name for p in (tmp_path / "out").iterdir())
+    assert outputs == ["a_converted.avif", "b_converted.avif"]
+    assert cv2.imread(str(tmp_path / "out" / "a_converted.avif")).shape == (48, 64, 3)
+
+
+def test_lossless_level_is_webp_only(tmp_path: Path):
+    src = tmp_path / "in.png"
+    cv2.imwrite(str(src), _noisy())
+
+    cp = run_cli(["convert", "-s", str(src), "-f", "jpg", "-c", "lossless"])
+
+    assert cp.returncode != 0
+    assert "not available for jpg" in cp.stderr
@@ -0,0 +1,100 @@
+# Shared-memory frame pool and pipeline -j
+
+import sys
+import threading
+import subprocess
+import concurrent.futures
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+import framepool
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+CLI_MAIN = REPO_ROOT / "src" / "image_processing" / "main.py"
+
+
+def _frame(value=0, shape=(30, 40, 3), dtype=np.uint8):
+    return (np.arange(np.prod(shape)).reshape(shape) + value).astype(dtype)
+
+
+def _checksum(handle):
+    return int(framepool.frame(handle).sum())
+
+
+def test_workers_read_frames_by_handle():
+    img = _frame(dtype=np.uint16)
+    with framepool.FramePool(2, img.nbytes) as pool:
+        handle = pool.put(img)
+        with concurrent.futures.ProcessPoolExecutor(2) as executor:
+            sums = list(executor.map(_checksum, [handle] * 3))
+        pool.release(handle)
+    assert sums == [int(img.sum())] * 3
+
+
+def test_frames_are_read_only_views():
+    with framepool.FramePool(1, 4096) as pool:
+        handle = pool.put(_frame(7, shape=(8, 8)))
+        view = framepool.frame(handle)
+        assert np.array_equal(view, _frame(7, shape=(8, 8)))
+        with pytest.raises(ValueError):
+            view[0, 0] = 1
+        del view
+
+
+def test_slots_are_recycled_and_put_waits_when_full():
+    with framepool.FramePool(2, 1200) as pool:
+        first = pool.put(_frame(1, shape=(10, 40)))
+        second = pool.put(_frame(2, shape=(10, 40)))
+        with pytest.raises(TimeoutError):
+            pool.put(_frame(3, shape=(10, 40)), timeout=0.05)
+
+        threading.Timer(0.05, pool.release, [first]).start()
+        third = pool.put(_frame(3, shape=(10, 40)), timeout=5)
+
+        assert third.slot == first.slot
+        assert np.array_equal(framepool.frame(second), _frame(2, shape=(10, 40)))
+        assert pool.stats() == {'slots': 2, 'slot_bytes': 1200, 'in_use': 2, 'peak_in_use': 2, 'puts': 3, 'waits': 2}
+
+
+def test_misuse_is_rejected():
+    with framepool.FramePool(1, 100) as pool:
+        with pytest.raises(ValueError):
+            pool.put(_frame())
+        handle = pool.put(_frame(shape=(10,)))
+        pool.release(handle)
+        with pytest.raises(ValueError):
+            pool.release(handle)
+
+
+def test_close_unlinks_the_block():
+    pool = framepool.FramePool(1, 64)
+    name = pool.name
+    pool.close()
+    pool.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_pipeline_jobs_match_serial_outputs(tmp_path: Path):
+    src = tmp_path / "in.png"
+    cv2.imwrite(str(src), _frame(shape=(120, 160, 3)))
+    outputs = ["a.jpg,width=40,height=30", "b.png", "c.tiff,width=80,height=60", "d.png,width=40,height=30"]
+
+    def run(folder, extra):
+        args = ["pipeline", "-s", str(src)]
+        for spec in outputs:
+            args += ["-o", str(tmp_path / folder / spec)]
+        return subprocess.run([sys.executable, str(CLI_MAIN)] + args + extra,
+                              cwd=str(REPO_ROOT), capture_output=True, text=True, timeout=60)
+
+    serial = run("serial", [])
+    parallel = run("parallel", ["-j", "3", "--pool-stats"])
+
+    assert serial.returncode == 0 and parallel.returncode == 0, serial.stderr + parallel.stderr
+    assert "Frame pool: 1/1 slot(s)" in parallel.stderr
+    for name in ("a.jpg", "b.png", "c.tiff", "d.png"):
+        assert (tmp_path / "serial" / name).read_bytes() == (tmp_path / "parallel" / name).read_bytes()
@@ -0,0 +1,87 @@
+# bulk: convert/resize jobs from CSV or JSON-lines files
+
+import json
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from tests.conftest import run_cli
+
+
+def _source(tmp_path: Path) -> Path:
+    src = tmp_path / "in.png"
+    cv2.imwrite(str(src), np.full((30, 40, 3), 90, dtype=np.uint8))
+    return src
+
+
+def _report(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def test_jsonl_jobs_report_one_line_per_row(tmp_path: Path):
+    src = _source(tmp_path)
+    rows = [
+        {"op": "resize", "source": str(src), "destination": str(tmp_path / f"r{i}.png"), "width": 10 + i, "height": 8, "id": f"job-{i}"}
+        for i in range(12)
+    ]
+    lines = [json.dumps(r) for r in rows]
+    lines += [
+        "{not json",
+        json.dumps({"op": "rotate", "source": str(src)}),
+        json.dumps({"op": "convert", "source": str(src), "quality": 3}),
+        json.dumps({"op": "resize", "source": str(src), "width": 0, "height": 5, "id": "bad-size"}),
+        json.dumps({"op": "resize", "source": str(src), "width": "a", "height": 5}),
+        json.dumps({"op": "resize", "source": str(src), "width": True, "height": 5}),
+    ]
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text("\n".join(lines) + "\n")
+
+    cp = run_cli(["bulk", "-i", str(jobs), "-j", "2"])
+
+    assert cp.returncode == 1
+    report = _report(cp.stdout)  # nothing but the report on stdout
+    assert sorted(r["line"] for r in report) == list(range(1, 19))
+    ok = {r["id"]: r for r in report if r["ok"]}
+    assert len(ok) == 12
+    assert cv2.imread(ok["job-3"]["destination"]).shape == (8, 13, 3)
+    failed = {r["line"]: r["error"] for r in report if not r["ok"]}
+    assert "Invalid JSON" in failed[13]
+    assert "Unknown op" in failed[14]
+    assert "quality" in failed[15]
+    assert "positive" in failed[16]
+    assert [r["id"] for r in report if r["line"] == 16] == ["bad-size"]
+    assert failed[17] == "width must be a positive integer, got 'a'"
+    assert failed[18] == "width must be a positive integer, got True"
+    assert "12 succeeded, 6 failed" in cp.stderr
+
+
+def test_csv_jobs_with_report_file(tmp_path: Path):
+    src = _source(tmp_path)
+    jobs = tmp_path / "jobs.csv"
+    jobs.write_text(
+        "op,source,destination,format,width,height\n"
+        f"convert,{src},{tmp_path / 'out' / 'a.jpg'},,,\n"
+        f"resize,{src},{tmp_path / 'small.png'},,20,15\n"
+        f"resize,{src},,,wide,15\n"
+    )
+    report = tmp_path / "report.jsonl"
+
+    cp = run_cli(["bulk", "-i", str(jobs), "--report", str(report)])
+
+    assert cp.returncode == 1, cp.stderr
+    results = {r["line"]: r for r in _report(report.read_text())}
+    assert results[2]["ok"] and cv2.imread(results[2]["destination"]) is not None
+    assert results[3]["ok"] and cv2.imread(results[3]["destination"]).shape == (15, 20, 3)
+    assert not results[4]["ok"] and "width" in results[4]["error"]
+
+
+def test_jobs_from_stdin_all_succeed(tmp_path: Path):
+    src = _source(tmp_path)
+    data = json.dumps({"op": "convert", "source": str(src), "format": "tiff"}) + "\n"
+
+    cp = run_cli(["bulk", "-i", "-"], data=data)
+
+    assert cp.returncode == 0, cp.stderr
+    (result,) = _report(cp.stdout)
+    assert result["ok"] and result["destination"].endswith(".tiff")
@@ -0,0 +1,81 @@
+# Grayscale, alpha and 16-bit sources keep their layout through convert and resize
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_processing import buffers
+from tests.conftest import run_cli
+
+
+def _gradient(w=64, h=48, channels=1, dtype=np.uint16):
+    peak = np.iinfo(dtype).max
+    row = np.linspace(0, peak, w).astype(dtype)
+    img = np.tile(row, (h, 1))
+    return np.dstack([img] * channels) if channels > 1 else img
+
+
+def _read(path):
+    return cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+
+
+@pytest.mark.parametrize("ext, img", [
+    ("tiff", _gradient()),
+    ("png", _gradient(channels=4)),
+    ("png", _gradient(dtype=np.uint8)),
+])
+def test_resize_keeps_depth_and_channels(tmp_path: Path, ext, img):
+    src = tmp_path / f"in.{ext}"
+    cv2.imwrite(str(src), img)
+    out = tmp_path / f"out.{ext}"
+
+    cp = run_cli(["resize", "-s", str(src), "-d", str(out), "--width", "32", "--height", "24"])
+
+    assert cp.returncode == 0, cp.stderr
+    result = _read(out)
+    assert result.dtype == img.dtype
+    assert result.shape == (24, 32) + img.shape[2:]
+
+
+def test_convert_keeps_alpha_and_scales_16_bit_for_jpeg(tmp_path: Path):
+    src = tmp_path / "in.png"
+    img = _gradient(channels=4)
+    img[..., 3] = 1000
+    cv2.imwrite(str(src), img)
+
+    tiff = run_cli(["convert", "-s", str(src), "-d", str(tmp_path / "out.tiff")])
+    jpeg = run_cli(["convert", "-s", str(src), "-d", str(tmp_path / "out.jpg"), "-c", "low"])
+
+    assert tiff.returncode == 0 and jpeg.returncode == 0, tiff.stderr + jpeg.stderr
+    assert np.array_equal(_read(tmp_path / "out.tiff"), img)
+    as_jpeg = _read(tmp_path / "out.jpg")
+    assert as_jpeg.dtype == np.uint8 and as_jpeg.shape == (48, 64, 3)
+    # scaled, not saturated: the gradient still runs from black to white
+    assert as_jpeg[:, :4].mean() < 20 and as_jpeg[:, -4:].mean() > 235
+
+
+def test_grayscale_jpeg_stays_single_channel_in_reduced_decode():
+    data = buffers.encode(cv2.GaussianBlur(_gradient(800, 600, dtype=np.uint8), (0, 0), 3), "jpg")
+
+    img = buffers.decode_for_size(data, 100, 75)
+
+    assert img.shape == (75, 100)
+
+
+def test_decode_unchanged_still_applies_exif_orientation():
+    data = bytes(buffers.encode(_gradient(40, 30, channels=3, dtype=np.uint8), "jpg"))
+    exif = (b"Exif\x00\x00II*\x00\x08\x00\x00\x00\x01\x00"
+            b"\x12\x01\x03\x00\x01\x00\x00\x00\x06\x00\x00\x00\x00\x00\x00\x00")
+    rotated = data[:2] + b"\xff\xe1" + (len(exif) + 2).to_bytes(2, "big") + exif + data[2:]
+
+    assert buffers.decode_unchanged(rotated).shape == (40, 30, 3)
+    assert buffers.decode_unchanged(data).shape == (30, 40, 3)
+
+
+def test_encodable_avoids_copies_when_the_encoder_takes_the_image():
+    img = _gradient()
+    assert buffers.encodable(img, "png") is img
+    assert buffers.encodable(img, "tiff") is img
+    assert buffers.encodable(img, "jpg").dtype == np.uint8
@@ -0,0 +1,74 @@
+# Incremental mode: --incremental MANIFEST skips sources whose output is up to date
+
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_processing import manifest
+from tests.conftest import run_cli
+
+
+def _write_image(path: Path, value=90):
+    assert cv2.imwrite(str(path), np.full((32, 48, 3), value, dtype=np.uint8))
+
+
+@pytest.mark.parametrize("engine", ["process", "async"])
+def test_rerun_skips_unchanged_and_reuses_output_names(tmp_path: Path, engine):
+    src, out = tmp_path / "in", tmp_path / "out"
+    src.mkdir()
+    for name in ["a.png", "b.png", "c.png"]:
+        _write_image(src / name)
+    cmd = ["convert", "-s", str(src), "-d", str(out), "-f", "jpg",
+           "--incremental", str(tmp_path / "manifest.db"), "--engine", engine]
+
+    first = run_cli(cmd)
+    assert first.returncode == 0, first.stderr
+    assert first.stdout.count("converted successfully") == 3
+
+    # a touched file is recognised by its hash, a changed one is redone in place
+    os.utime(src / "a.png", ns=(1, 1))
+    _write_image(src / "b.png", value=200)
+    second = run_cli(cmd)
+    assert second.returncode == 0, second.stderr
+    assert second.stdout.count("skipped") == 2
+    assert "b_converted.jpg" in second.stdout
+    assert sorted(p.name for p in out.iterdir()) == ["a_converted.jpg", "b_converted.jpg", "c_converted.jpg"]
+    assert cv2.imread(str(out / "b_converted.jpg"))[0, 0, 0] > 150
+
+    third = run_cli(cmd)
+    assert third.stdout.count("skipped") == 3
+
+
+def test_missing_output_or_other_operation_is_not_skipped(tmp_path: Path):
+    src = tmp_path / "photo.png"
+    _write_image(src)
+    manifest = str(tmp_path / "manifest.db")
+    resize = ["resize", "-s", str(src), "--height", "16", "--incremental", manifest]
+
+    assert "skipped" not in run_cli(resize + ["--width", "24"]).stdout
+    assert "skipped" in run_cli(resize + ["--width", "24"]).stdout
+    # a different size is a different operation with its own entry
+    assert "skipped" not in run_cli(resize + ["--width", "12"]).stdout
+
+    # the 24 px output took the default name, so the 12 px one went next to it
+    (tmp_path / "photo_resized_1.png").unlink()
+    cp = run_cli(resize + ["--width", "12"])
+    assert "skipped" not in cp.stdout
+    assert cv2.imread(str(tmp_path / "photo_resized_1.png")).shape[:2] == (16, 12)
+
+
+def test_jobs_of_a_process_share_one_connection(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_image(tmp_path / "a.png")
+    _write_image(tmp_path / "b.png")
+    op = {"op": "convert", "format": "jpg"}
+    entries = [manifest.entry(SimpleNamespace(incremental=path, source=str(tmp_path / name), destination="out.jpg"), op)
+               for path, name in [("manifest.db", "a.png"), (str(tmp_path / "manifest.db"), "b.png")]]
+
+    assert entries[0].manifest is entries[1].manifest
+    entries[0].record(tmp_path / "out.jpg", b"a")
+    assert entries[1].manifest.lookup(tmp_path / "a.png", entries[0].operation)[3] == str(tmp_path / "out.jpg")
@@ -0,0 +1,96 @@
+# pipeline: decode once, write several resized/converted outputs
+
+import json
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_processing import pipeline
+from tests.conftest import run_cli
+
+
+def _write_image(path: Path, w=320, h=240):
+    img = np.zeros((h, w, 3), dtype=np.uint8)
+    cv2.rectangle(img, (20, 20), (w - 20, h - 20), (0, 200, 255), -1)
+    assert cv2.imwrite(str(path), img)
+
+
+def test_parse_output_spec():
+    spec = pipeline.parse_output_spec("thumb.jpg, width=160,height=120,compression=high")
+    assert spec == {"destination": "thumb.jpg", "width": 160, "height": 120, "compression": "high"}
+
+
+def test_run_pipeline_decodes_once(tmp_path: Path, monkeypatch):
+    src = tmp_path / "photo.png"
+    _write_image(src)
+    reads = []
+    real_decode = pipeline.buffers.decode
+    monkeypatch.setattr(pipeline.buffers, "decode", lambda *a, **k: reads.append(a) or real_decode(*a, **k))
+
+    written = pipeline.run_pipeline(src, [
+        {"destination": str(tmp_path / "thumb.jpg"), "width": 80, "height": 60, "compression": "high"},
+        {"destination": str(tmp_path / "medium.png"), "width": 160, "height": 120},
+        {"format": "tiff"},
+    ])
+
+    assert len(reads) == 1
+    assert [p.name for p in written] == ["thumb.jpg", "medium.png", "photo_converted.tiff"]
+    assert cv2.imread(str(written[0])).shape[:2] == (60, 80)
+    assert cv2.imread(str(written[1])).shape[:2] == (120, 160)
+    assert cv2.imread(str(written[2])).shape[:2] == (240, 320)
+
+
+def test_run_pipeline_validates_before_writing(tmp_path: Path):
+    src = tmp_path / "photo.png"
+    _write_image(src)
+
+    with pytest.raises(SystemExit):
+        pipeline.run_pipeline(src, [
+            {"destination": str(tmp_path / "ok.jpg")},
+            {"destination": str(tmp_path / "bad.jpg"), "width": 10},
+        ])
+    assert not (tmp_path / "ok.jpg").exists()
+
+
+@pytest.mark.parametrize("width", ["160", True, 1.5])
+def test_spec_dimensions_must_be_integers(tmp_path: Path, width):
+    src = tmp_path / "photo.png"
+    _write_image(src)
+    spec = tmp_path / "spec.json"
+    spec.write_text(json.dumps([{"destination": str(tmp_path / "small.png"), "width": width, "height": 120}]))
+
+    cp = run_cli(["pipeline", "-s", str(src), "--spec", str(spec)])
+
+    assert cp.returncode == 1
+    assert "width must be an integer" in cp.stderr and "small.png" in cp.stderr
+    assert "Traceback" not in cp.stderr
+
+
+def test_encode_failure_is_a_clean_error(tmp_path: Path, monkeypatch):
+    src = tmp_path / "photo.png"
+    _write_image(src)
+
+    def fail(*args, **kwargs):
+        raise ValueError("Could not encode image as jpg")
+    monkeypatch.setattr(pipeline.buffers, "encode", fail)
+
+    with pytest.raises(SystemExit) as exc:
+        pipeline.run_pipeline(src, [{"destination": str(tmp_path / "out.jpg")}])
+    assert "Failed to encode" in str(exc.value.code) and "out.jpg" in str(exc.value.code)
+    assert not (tmp_path / "out.jpg").exists()
+
+
+def test_pipeline_cli_with_outputs_and_spec(tmp_path: Path):
+    src = tmp_path / "photo.png"
+    _write_image(src)
+    spec = tmp_path / "spec.json"
+    spec.write_text(json.dumps([{"destination": str(tmp_path / "small.tiff"), "width": 32, "height": 24}]))
+
+    cp = run_cli(["pipeline", "-s", str(src), "-o", f"{tmp_path / 'thumb.jpg'},width=64,height=48",
+                  "--spec", str(spec)])
+
+    assert cp.returncode == 0, cp.stdout + cp.stderr
+    assert cv2.imread(str(tmp_path / "thumb.jpg")).shape[:2] == (48, 64)
+    assert cv2.imread(str(tmp_path / "small.tiff")).shape[:2] == (24, 32)
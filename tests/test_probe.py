@@ -0,0 +1,98 @@
+# Header-only probing and byte copies for no-op convert/resize
+
+import json
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_processing import buffers
+from tests.conftest import run_cli
+
+
+def _image(w=40, h=30, channels=3, dtype=np.uint8):
+    shape = (h, w, channels) if channels > 1 else (h, w)
+    return np.random.default_rng(3).integers(0, 200, shape).astype(dtype)
+
+
+@pytest.mark.parametrize("fmt, img, expected", [
+    ("png", _image(), ("png", 40, 30, 3, 8)),
+    ("png", _image(channels=4, dtype=np.uint16), ("png", 40, 30, 4, 16)),
+    ("jpg", _image(channels=1), ("jpeg", 40, 30, 1, 8)),
+    ("tiff", _image(w=7, h=5, dtype=np.uint16), ("tiff", 7, 5, 3, 16)),
+])
+def test_probe_reads_header_fields(fmt, img, expected):
+    header = buffers.probe(bytes(buffers.encode(img, fmt)))
+    assert tuple(header[:5]) == expected
+
+
+@pytest.mark.parametrize("fmt, level, setting", [
+    ("jpg", "high", 70), ("jpg", "low", 95), ("png", "high", 3), ("tiff", "high", 8),
+])
+def test_probe_recovers_encoder_setting(fmt, level, setting):
+    header = buffers.probe(buffers.encode(_image(), fmt, level))
+    assert header.setting == setting
+    assert buffers.is_noop(header, fmt, level)
+    assert not buffers.is_noop(header, fmt, "medium")
+
+
+def test_probe_rejects_damaged_headers_and_ignores_other_data():
+    png = bytes(buffers.encode(_image(), "png"))
+    assert buffers.probe(b"plain text") is None
+    with pytest.raises(ValueError):
+        buffers.probe(png[:20])
+    with pytest.raises(ValueError):
+        buffers.probe(b"\xff\xd8\xff\xe0\x00")
+
+
+def test_is_noop_needs_same_format_size_and_upright_source():
+    header = buffers.probe(buffers.encode(_image(), "jpg", "medium"))
+    assert buffers.is_noop(header, "jpeg", size=(40, 30))
+    assert not buffers.is_noop(header, "png", size=(40, 30))
+    assert not buffers.is_noop(header, "jpg", size=(30, 40))
+    assert not buffers.is_noop(header._replace(orientation=6), "jpg", size=(40, 30))
+
+
+def test_convert_to_same_format_and_level_copies_bytes(tmp_path: Path):
+    src = tmp_path / "in.jpg"
+    src.write_bytes(buffers.encode(_image(), "jpg", "medium"))
+    out = tmp_path / "out.jpg"
+    profile = tmp_path / "profile.jsonl"
+
+    cp = run_cli(["convert", "-s", str(src), "-d", str(out), "-c", "medium", "--profile", str(profile)])
+
+    assert cp.returncode == 0, cp.stderr
+    assert out.read_bytes() == src.read_bytes()
+    stages = json.loads(profile.read_text())["stages_ms"]
+    assert "probe" in stages and "decode" not in stages
+    # another level re-encodes
+    other = tmp_path / "other.jpg"
+    assert run_cli(["convert", "-s", str(src), "-d", str(other), "-c", "high"]).returncode == 0
+    assert other.read_bytes() != src.read_bytes()
+
+
+def test_resize_to_same_size_copies_bytes_and_keeps_alpha(tmp_path: Path):
+    src = tmp_path / "in.png"
+    src.write_bytes(buffers.encode(_image(channels=4, dtype=np.uint16), "png"))
+    out = tmp_path / "out.png"
+    tiled_out = tmp_path / "tiled.png"
+
+    cp = run_cli(["resize", "-s", str(src), "-d", str(out), "--width", "40", "--height", "30"])
+    tiled = run_cli(["resize", "-s", str(src), "-d", str(tiled_out), "--width", "40", "--height", "30", "--tiled"])
+
+    assert cp.returncode == 0 and tiled.returncode == 0, cp.stderr + tiled.stderr
+    assert out.read_bytes() == src.read_bytes() == tiled_out.read_bytes()
+    assert cv2.imread(str(out), cv2.IMREAD_UNCHANGED).shape == (30, 40, 4)
+
+
+def test_damaged_header_fails_validation(tmp_path: Path):
+    src = tmp_path / "cut.png"
+    src.write_bytes(bytes(buffers.encode(_image(), "png"))[:12])
+    out = tmp_path / "out.jpg"
+
+    cp = run_cli(["convert", "-s", str(src), "-d", str(out)])
+
+    assert cp.returncode != 0
+    assert "Could not read the source image" in cp.stderr
+    assert not out.exists()
@@ -0,0 +1,71 @@
+# Per-stage timings, --profile/--metrics/--cprofile outputs
+
+import json
+import pstats
+from pathlib import Path
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from src.image_processing import batch, profiling
+from tests.conftest import run_cli
+
+
+def _write_image(path: Path, w=200, h=100):
+    assert cv2.imwrite(str(path), np.full((h, w, 3), 60, dtype=np.uint8))
+
+
+def test_stage_is_noop_outside_trace():
+    with profiling.stage("decode"):
+        pass
+    with profiling.trace() as stages:
+        with profiling.stage("decode"):
+            pass
+        with profiling.stage("decode"):
+            pass
+    assert set(stages) == {"decode"} and stages["decode"] >= 0
+
+
+def test_run_one_reports_every_resize_stage(tmp_path: Path):
+    src = tmp_path / "input.png"
+    _write_image(src)
+    args = SimpleNamespace(source=src, destination=None, width=50, height=20, force=True)
+
+    result = batch.run_one("resize", args)
+
+    assert result["ok"], result
+    assert {"validate", "destination", "read", "decode", "transform", "encode", "write"} <= set(result["stages_ms"])
+
+
+def test_cli_batch_writes_profile_metrics_and_cprofile(tmp_path: Path):
+    for name in ("a.png", "b.png"):
+        _write_image(tmp_path / name)
+    profile, metrics, cprof = tmp_path / "trace.jsonl", tmp_path / "metrics.prom", tmp_path / "run.pstats"
+
+    cp = run_cli(["convert", "-s", str(tmp_path / "*.png"), "-f", "jpg", "--jobs", "2",
+                  "--profile", str(profile), "--metrics", str(metrics), "--cprofile", str(cprof)], timeout=60)
+
+    assert cp.returncode == 0, cp.stdout + cp.stderr
+    lines = [json.loads(line) for line in profile.read_text().splitlines()]
+    assert len(lines) == 2 and all(line["ok"] for line in lines)
+    assert {"decode", "encode", "write"} <= set(lines[0]["stages_ms"])
+
+    text = metrics.read_text()
+    assert 'image_processing_stage_seconds_count{stage="decode"} 2' in text
+    assert 'image_processing_images_total{command="convert",status="ok"} 2' in text
+
+    stats = pstats.Stats(str(cprof))
+    assert any(func[2] == "convertimage" for func in stats.stats)
+
+
+def test_cli_single_image_profile(tmp_path: Path):
+    src = tmp_path / "input.png"
+    _write_image(src)
+    profile = tmp_path / "trace.jsonl"
+
+    cp = run_cli(["resize", "-s", str(src), "--width", "10", "--height", "10", "--profile", str(profile)], timeout=30)
+
+    assert cp.returncode == 0, cp.stdout + cp.stderr
+    line = json.loads(profile.read_text())
+    assert line["command"] == "resize" and "transform" in line["stages_ms"]
@@ -0,0 +1,88 @@
+# --target-bytes / --max-quality-loss: encoder setting search on one decoded image
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_processing import buffers
+from tests.conftest import run_cli
+
+
+def _photo(w=320, h=240):
+    rng = np.random.default_rng(1)
+    y, x = np.mgrid[0:h, 0:w].astype(np.float32)
+    img = np.dstack([x / w * 255, y / h * 255, (x + y) / (w + h) * 255]) + rng.normal(0, 10, (h, w, 3))
+    return cv2.GaussianBlur(np.clip(img, 0, 255).astype(np.uint8), (0, 0), 1.0)
+
+
+def _jpeg_size(img, quality):
+    return len(cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1])
+
+
+def test_highest_jpeg_quality_under_budget():
+    img = _photo()
+    budget = _jpeg_size(img, 60) + 1
+
+    data, quality = buffers.encode_for_target(img, "jpg", target_bytes=budget)
+
+    assert len(data) <= budget
+    assert quality >= 60 and _jpeg_size(img, quality + 1) > budget
+
+
+def test_lowest_jpeg_quality_within_loss():
+    img = _photo()
+
+    data, quality = buffers.encode_for_target(img, "jpg", max_loss=2.0)
+
+    assert buffers.quality_loss(img, data) <= 2.0
+    assert buffers.quality_loss(img, buffers.encode_for_target(img, "jpg", target_bytes=len(data) - 1)[0]) > 2.0
+    assert 1 < quality < 100
+
+
+def test_png_picks_lowest_level_that_fits_and_is_lossless():
+    img = _photo()
+    budget = len(cv2.imencode(".png", img, [cv2.IMWRITE_PNG_COMPRESSION, 9])[1]) + 100
+
+    data, level = buffers.encode_for_target(img, "png", target_bytes=budget)
+
+    assert len(data) <= budget and 0 <= level <= 9
+    assert np.array_equal(buffers.decode(data), img)
+
+
+def test_impossible_targets_raise():
+    img = _photo()
+    with pytest.raises(ValueError, match="quality 1"):
+        buffers.encode_for_target(img, "jpg", target_bytes=100)
+    with pytest.raises(ValueError, match="budget"):
+        buffers.encode_for_target(img, "jpg", target_bytes=_jpeg_size(img, 20), max_loss=0.5)
+    with pytest.raises(ValueError, match="JPEG and PNG"):
+        buffers.encode_for_target(img, "tiff", target_bytes=10_000)
+
+
+def test_ssim_identical_is_one():
+    img = _photo(64, 48)
+    assert buffers.ssim(img, img) == pytest.approx(1.0)
+    assert buffers.ssim(img, 255 - img) < 0.5
+
+
+def test_cli_target_bytes(tmp_path: Path):
+    src = tmp_path / "photo.png"
+    assert cv2.imwrite(str(src), _photo(640, 480))
+    dest = tmp_path / "photo.jpg"
+
+    cp = run_cli(["convert", "-s", str(src), "-d", str(dest), "--target-bytes", "20K"], timeout=60)
+
+    assert cp.returncode == 0, cp.stderr
+    assert "Chose quality" in cp.stderr
+    assert 0 < dest.stat().st_size <= 20 * 1024
+    assert not [p for p in tmp_path.iterdir() if p.name not in {"photo.png", "photo.jpg"}]
+
+
+def test_cli_rejects_search_for_tiff(tmp_path: Path):
+    src = tmp_path / "photo.png"
+    assert cv2.imwrite(str(src), _photo(32, 32))
+    cp = run_cli(["convert", "-s", str(src), "-f", "tiff", "--max-quality-loss", "1"], timeout=60)
+    assert cp.returncode != 0
+    assert "JPEG or PNG" in cp.stderr
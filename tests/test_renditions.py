@@ -0,0 +1,57 @@
+# renditions: cascaded widths for responsive images plus a JSON manifest
+
+import json
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from src.image_processing import renditions
+from tests.conftest import run_cli
+
+
+def _photo(w, h):
+    y, x = np.mgrid[0:h, 0:w].astype(np.float32)
+    img = np.dstack([x / w * 255, y / h * 255, (x * y) % 255]).astype(np.uint8)
+    return cv2.GaussianBlur(img, (0, 0), 2)
+
+
+def test_rendition_sizes_keep_aspect_and_skip_upscales():
+    assert renditions.rendition_sizes(1000, 750, [200, 500, 500, 1200, 333]) == [(500, 375), (333, 250), (200, 150)]
+
+
+def test_cascade_is_close_to_direct_resize():
+    img = _photo(1600, 1200)
+    sizes = renditions.rendition_sizes(1600, 1200, [1200, 800, 400, 200])
+
+    for width, height, frame in renditions.cascade(img, sizes):
+        direct = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+        assert frame.shape == direct.shape
+        assert np.abs(frame.astype(int) - direct.astype(int)).mean() < 2.0
+
+
+def test_cli_writes_renditions_and_manifest(tmp_path: Path):
+    src = tmp_path / "photo.jpg"
+    assert cv2.imwrite(str(src), _photo(1200, 800))
+    out = tmp_path / "public"
+
+    cp = run_cli(["renditions", "-s", str(src), "-d", str(out), "--widths", "300", "600", "2000", "-f", "png"],
+                 timeout=60)
+
+    assert cp.returncode == 0, cp.stderr
+    assert "2000" in cp.stderr  # skipped, larger than the source
+    manifest = json.loads((out / "photo.renditions.json").read_text())
+    assert (manifest["width"], manifest["height"], manifest["format"]) == (1200, 800, "png")
+    assert [(r["width"], r["height"]) for r in manifest["renditions"]] == [(300, 200), (600, 400)]
+    for r in manifest["renditions"]:
+        path = out / r["path"]
+        assert path.stat().st_size == r["bytes"]
+        assert cv2.imread(str(path)).shape[:2] == (r["height"], r["width"])
+
+
+def test_cli_fails_when_no_width_fits(tmp_path: Path):
+    src = tmp_path / "small.png"
+    assert cv2.imwrite(str(src), _photo(100, 80))
+    cp = run_cli(["renditions", "-s", str(src), "--widths", "400"], timeout=60)
+    assert cp.returncode != 0
+    assert "None of the widths" in cp.stderr
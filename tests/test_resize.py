@@ -7,6 +7,7 @@
 # TC-US2-07 Resize Images of Different Supported Formats
 # TC-US2-08 Resize Image With Unwritable Output Path – Error Handling
 # TC-US2-09 Image Resizing Performance Within Time Limit
+# TC-US2-10 Large JPEG Downscale Uses Reduced Decode Unless --exact Is Given
 
 
 import os
@@ -196,4 +197,28 @@ def test_resize_performance(tmp_path: Path):
     assert (w, h) == (1920, 1080)
 
     elapsed_time = end_time - start_time
-    assert elapsed_time < 3.0, f"Resizing took too long: {elapsed_time:.2f} seconds"
\ No newline at end of file
+    assert elapsed_time < 3.0, f"Resizing took too long: {elapsed_time:.2f} seconds"
+
+# 10. reduced decode for large JPEG downscales, full decode (keeping the source layout) with exact
+@pytest.mark.parametrize("exact, expected_flag", [(False, cv2.IMREAD_REDUCED_COLOR_4), (True, cv2.IMREAD_ANYCOLOR | cv2.IMREAD_ANYDEPTH)])
+def test_resize_reduced_decode(tmp_path: Path, monkeypatch, exact, expected_flag):
+    input_path = tmp_path / "input.jpg"
+    output_path = tmp_path / "output.jpg"
+    _write_temp_image(input_path, w=2000, h=1600)
+    flags = []
+    real_imdecode = cv2.imdecode
+    monkeypatch.setattr(cv2, "imdecode", lambda buf, flag: flags.append(flag) or real_imdecode(buf, flag))
+
+    args = SimpleNamespace(
+        source=str(input_path),
+        destination=str(output_path),
+        width=400,
+        height=300,
+        force=True,
+        exact=exact,
+    )
+    resize.validate_resize_arguments(args)
+    resize.resize_image(args)
+
+    assert flags == [expected_flag]
+    assert _read_image_dim(output_path) == (400, 300)
@@ -0,0 +1,79 @@
+# serve: long-running worker that accepts jobs over a Unix socket
+
+import sys
+import time
+import asyncio
+import subprocess
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_processing import client
+from tests.conftest import CLI_MAIN, REPO_ROOT
+
+
+@pytest.fixture
+def server_socket(tmp_path: Path):
+    sock = tmp_path / "ip.sock"
+    proc = subprocess.Popen([sys.executable, str(CLI_MAIN), "serve", "--socket", str(sock)],
+                            cwd=str(REPO_ROOT), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    deadline = time.time() + 20
+    while not sock.exists():
+        assert proc.poll() is None, proc.stderr.read()
+        assert time.time() < deadline, "Server did not start"
+        time.sleep(0.05)
+    yield sock
+    if proc.poll() is None:
+        proc.terminate()
+    proc.wait(timeout=10)
+
+
+def _write_image(path: Path, w=64, h=48):
+    assert cv2.imwrite(str(path), np.full((h, w, 3), 90, dtype=np.uint8))
+
+
+def test_blocking_client_convert_and_resize(tmp_path: Path, server_socket: Path):
+    src = tmp_path / "input.png"
+    _write_image(src)
+
+    with client.Client(server_socket) as c:
+        assert c.ping()["ok"]
+        converted = c.convert(src, destination=tmp_path / "out.jpg", format="jpg")
+        resized = c.resize(src, 20, 10)
+
+    assert converted["ok"], converted
+    assert Path(converted["destination"]).exists()
+    assert converted["elapsed_ms"] >= 0
+    assert resized["ok"], resized
+    assert cv2.imread(resized["destination"]).shape[:2] == (10, 20)
+
+
+def test_failed_job_returns_error_and_server_keeps_running(tmp_path: Path, server_socket: Path):
+    with client.Client(server_socket) as c:
+        missing = c.convert(tmp_path / "missing.png")
+        invalid = c.request({"op": "explode", "source": "x", "id": 7})
+        bad_width = c.request({"op": "resize", "source": "x", "width": "a", "height": 5})
+        again = c.ping()
+
+    assert not missing["ok"] and "does not exist" in missing["error"]
+    assert not invalid["ok"] and invalid["id"] == 7
+    assert not bad_width["ok"] and bad_width["error"] == "width must be a positive integer, got 'a'"
+    assert again["ok"]
+
+
+def test_async_client(tmp_path: Path, server_socket: Path):
+    src = tmp_path / "input.png"
+    _write_image(src)
+
+    async def go():
+        async with await client.AsyncClient.connect(server_socket) as c:
+            results = await asyncio.gather(c.resize(src, 8, 8, destination=tmp_path / "a.png"),
+                                           c.resize(src, 16, 16, destination=tmp_path / "b.png"))
+            await c.shutdown()
+            return results
+
+    results = asyncio.run(go())
+    assert all(r["ok"] for r in results), results
+    assert cv2.imread(str(tmp_path / "b.png")).shape[:2] == (16, 16)
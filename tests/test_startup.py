@@ -0,0 +1,84 @@
+# Startup cost: --help, argument errors and validation failures must not import cv2/NumPy
+
+import sys
+import subprocess
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+CLI_MAIN = REPO_ROOT / "src" / "image_processing" / "main.py"
+
+# cumulative import time of main.py's own imports under `python -X importtime`
+STARTUP_BUDGET_MS = 150
+HEAVY_MODULES = ("cv2", "numpy")
+
+
+def importtime(args):
+    cp = subprocess.run([sys.executable, "-X", "importtime", str(CLI_MAIN)] + args,
+                        cwd=str(REPO_ROOT), capture_output=True, text=True, timeout=30)
+    modules = {}
+    for line in cp.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.setdefault(name.strip(), []).append((int(cumulative), len(name) - len(name.lstrip())))
+    return cp, modules
+
+
+def heavy_imports(modules):
+    return {name for name in modules if name.split(".")[0] in HEAVY_MODULES}
+
+
+def _top_level_ms(modules, baseline):
+    return sum(us for name, entries in modules.items() if name not in baseline
+               for us, indent in entries if indent == 1) / 1000
+
+
+@pytest.mark.parametrize("args", [
+    ["--help"],
+    ["convert", "--help"],
+    ["resize", "-s", "no_such_file.png", "--width", "10", "--height", "10"],
+])
+def test_help_and_argument_errors_skip_heavy_imports(args):
+    cp, modules = importtime(args)
+    assert "usage" in (cp.stdout + cp.stderr).lower()
+    assert not heavy_imports(modules), f"heavy imports for {args}"
+
+
+def test_validation_failure_skips_heavy_imports(tmp_path: Path):
+    src = tmp_path / "input.png"
+    src.write_bytes(b"not decoded before validation")
+    cp, modules = importtime(["resize", "-s", str(src), "--width", "0", "--height", "10"])
+    assert cp.returncode != 0
+    assert "positive" in cp.stderr
+    assert not heavy_imports(modules)
+
+
+@pytest.mark.parametrize("args", [["-f", "bmp"], ["-d", "out.gif"]])
+def test_unsupported_format_skips_heavy_imports(tmp_path: Path, args):
+    src = tmp_path / "input.png"
+    src.write_bytes(b"not decoded before validation")
+    cp, modules = importtime(["convert", "-s", str(src)] + args)
+    assert cp.returncode != 0
+    assert "Unsupported" in cp.stderr and "webp" in cp.stderr
+    assert not heavy_imports(modules)
+
+
+def test_startup_import_budget():
+    baseline = subprocess.run([sys.executable, "-X", "importtime", "-c", "pass"],
+                              capture_output=True, text=True).stderr
+    startup_modules = {line.split("|")[-1].strip() for line in baseline.splitlines()}
+    _, modules = importtime(["--help"])
+    spent = _top_level_ms(modules, startup_modules)
+    assert spent < STARTUP_BUDGET_MS, f"CLI imports took {spent:.1f} ms (budget {STARTUP_BUDGET_MS} ms)"
+
+
+def test_image_work_still_imports_cv2(tmp_path: Path):
+    import cv2
+    import numpy as np
+    src = tmp_path / "input.png"
+    assert cv2.imwrite(str(src), np.zeros((10, 10, 3), dtype=np.uint8))
+    cp, modules = importtime(["convert", "-s", str(src), "-f", "jpg"])
+    assert cp.returncode == 0, cp.stderr
+    assert "numpy" in heavy_imports(modules)
@@ -0,0 +1,81 @@
+# Streaming mode: convert -s - / -d - and length-prefixed frames
+
+import struct
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from tests.conftest import run_cli
+
+
+def _png(value=80, w=40, h=30):
+    ok, buf = cv2.imencode(".png", np.full((h, w, 3), value, dtype=np.uint8))
+    assert ok
+    return buf.tobytes()
+
+
+def _decode(data):
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def _frames(data):
+    frames, i = [], 0
+    while i < len(data):
+        (size,) = struct.unpack(">I", data[i:i + 4])
+        frames.append(data[i + 4:i + 4 + size])
+        i += 4 + size
+    return frames
+
+
+def test_stdin_to_stdout(tmp_path: Path):
+    cp = run_cli(["convert", "-s", "-", "-d", "-", "-f", "jpg"], data=_png())
+
+    assert cp.returncode == 0, cp.stderr
+    assert cp.stdout[:3] == b"\xff\xd8\xff"
+    assert _decode(cp.stdout).shape == (30, 40, 3)
+    assert not list(tmp_path.iterdir())
+
+
+def test_file_to_stdout_and_stdin_to_file(tmp_path: Path):
+    src = tmp_path / "in.png"
+    src.write_bytes(_png())
+
+    to_stdout = run_cli(["convert", "-s", str(src), "-d", "-", "-f", "tiff"], data=b"")
+    from_stdin = run_cli(["convert", "-s", "-", "-d", str(tmp_path / "out.jpg")], data=_png())
+
+    assert to_stdout.returncode == 0 and _decode(to_stdout.stdout).shape == (30, 40, 3)
+    assert from_stdin.returncode == 0, from_stdin.stderr
+    assert cv2.imread(str(tmp_path / "out.jpg")) is not None
+
+
+def test_framed_stream_keeps_order_and_marks_failures():
+    frames = [_png(10), b"not an image", _png(200, w=8, h=6)]
+    data = b"".join(struct.pack(">I", len(f)) + f for f in frames)
+
+    cp = run_cli(["convert", "-s", "-", "-d", "-", "-f", "png", "--framed"], data=data)
+
+    assert cp.returncode == 1
+    out = _frames(cp.stdout)
+    assert [len(f) > 0 for f in out] == [True, False, True]
+    assert _decode(out[0])[0, 0, 0] == 10
+    assert _decode(out[2]).shape == (6, 8, 3)
+    assert b"frame 1" in cp.stderr
+
+
+def test_truncated_frame_is_an_error():
+    cp = run_cli(["convert", "-s", "-", "-d", "-", "--framed"], data=struct.pack(">I", 100) + b"short")
+    assert cp.returncode != 0
+    assert b"middle of a frame" in cp.stderr
+
+
+def test_several_files_to_stdout_need_framing(tmp_path: Path):
+    for name in ["a.png", "b.png"]:
+        (tmp_path / name).write_bytes(_png())
+
+    plain = run_cli(["convert", "-s", str(tmp_path), "-d", "-"], data=b"")
+    framed = run_cli(["convert", "-s", str(tmp_path), "-d", "-", "--framed", "-f", "jpg"], data=b"")
+
+    assert plain.returncode != 0 and plain.stdout == b""
+    assert framed.returncode == 0
+    assert len(_frames(framed.stdout)) == 2
@@ -0,0 +1,151 @@
+# Tiled/streaming resize with a memory ceiling
+
+import sys
+import subprocess
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_processing import buffers, resize, tiled
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src" / "image_processing"
+
+
+def _smooth(shape, dtype=np.uint8, seed=0):
+    img = np.random.default_rng(seed).integers(0, np.iinfo(dtype).max, shape, dtype=dtype)
+    return cv2.GaussianBlur(img, (0, 0), 2)
+
+
+def _resize_in_bands(img, width, height, max_memory):
+    out = np.empty((height, width) + img.shape[2:], dtype=img.dtype)
+    for y0, band in tiled.resize_tiled(tiled.ArrayStrips(img), width, height, max_memory):
+        out[y0:y0 + band.shape[0]] = band
+    return out
+
+
+@pytest.mark.parametrize("shape, dtype", [((600, 900, 3), np.uint8), ((500, 300), np.uint8),
+                                          ((200, 260, 3), np.uint16), ((240, 320, 4), np.uint8)])
+@pytest.mark.parametrize("size", [(300, 200), (97, 61), (700, 650), (400, 30)])
+def test_bands_match_cv2_resize(shape, dtype, size):
+    img = _smooth(shape, dtype)
+    # a tiny budget forces many bands, so the band borders are exercised
+    out = _resize_in_bands(img, *size, max_memory=64 * 1024)
+    ref = cv2.resize(img, size, interpolation=buffers.choose_interpolation(img, *size))
+    assert out.shape == ref.shape
+    assert np.abs(out.astype(int) - ref).max() <= 1
+
+
+def test_uncompressed_tiff_is_read_in_bands(tmp_path: Path):
+    src = tmp_path / "scan.tiff"
+    img = _smooth((400, 500, 3))
+    assert cv2.imwrite(str(src), img, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+
+    strips = tiled.open_strips(src)
+
+    assert isinstance(strips, tiled.TiffStrips) and tiled.streamable(src)
+    assert np.array_equal(strips.rows(10, 20), img[10:20])
+    assert np.array_equal(strips.rows(390, 400), img[390:400])
+
+
+def test_compressed_tiff_falls_back_to_decode(tmp_path: Path):
+    src = tmp_path / "scan.tiff"
+    assert cv2.imwrite(str(src), _smooth((40, 50, 3)), [cv2.IMWRITE_TIFF_COMPRESSION, 5])
+    assert isinstance(tiled.open_strips(src), tiled.ArrayStrips) and not tiled.streamable(src)
+    # a decode that would not fit in the ceiling is refused before it happens
+    with pytest.raises(ValueError, match="max-memory"):
+        tiled.open_strips(src, max_memory=1024)
+
+
+def test_whole_image_output_must_fit_the_ceiling(tmp_path: Path):
+    src = tmp_path / "scan.tiff"
+    assert cv2.imwrite(str(src), _smooth((300, 400, 3)), [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+    with pytest.raises(ValueError, match="write a TIFF"):
+        tiled.resize_file(src, tmp_path / "out.png", 2000, 1500, max_memory=1024 * 1024)
+    tiled.resize_file(src, tmp_path / "out.tiff", 2000, 1500, max_memory=1024 * 1024)
+    assert cv2.imread(str(tmp_path / "out.tiff")).shape == (1500, 2000, 3)
+
+
+@pytest.mark.parametrize("shape, dtype", [((300, 400, 3), np.uint8), ((300, 400), np.uint16), ((60, 80, 4), np.uint8)])
+def test_tiff_writer_roundtrip(tmp_path: Path, shape, dtype):
+    img = _smooth(shape, dtype)
+    writer = tiled.TiffWriter(tmp_path / "out.tiff", shape[1], shape[0], shape[2] if len(shape) > 2 else 1, dtype)
+    for y0 in range(0, shape[0], 7):
+        writer.write(img[y0:y0 + 7])
+    writer.close()
+
+    back = cv2.imread(str(tmp_path / "out.tiff"), cv2.IMREAD_UNCHANGED)
+    assert np.array_equal(back, img)
+
+
+def test_resize_file_memory_stays_under_ceiling(tmp_path: Path):
+    src = tmp_path / "scan.tiff"
+    img = _smooth((3000, 4000, 3))
+    assert cv2.imwrite(str(src), img, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+    del img
+
+    tracemalloc.start()
+    tiled.resize_file(src, tmp_path / "out.tiff", 1000, 750, max_memory=8 * 1024 * 1024)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # the decoded source alone would be 36 MB
+    assert peak < 16 * 1024 * 1024
+    assert cv2.imread(str(tmp_path / "out.tiff")).shape == (750, 1000, 3)
+
+
+RSS_SCRIPT = """
+import resource, sys
+sys.path.insert(0, sys.argv[1])
+import buffers, tiled
+buffers.cv2.resize  # cv2 and NumPy are part of the baseline
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+tiled.resize_file(sys.argv[2], sys.argv[3], 2000, 750, max_memory=16 * 1024 * 1024)
+print((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) // 1024)
+"""
+
+
+def test_resize_file_resident_memory_stays_under_ceiling(tmp_path: Path):
+    src = tmp_path / "scan.tiff"
+    writer = tiled.TiffWriter(src, 6000, 3000, 3, np.uint8)
+    band = _smooth((250, 6000, 3))
+    for _ in range(12):
+        writer.write(band)
+    writer.close()  # 54 MB of pixels
+
+    cp = subprocess.run([sys.executable, "-c", RSS_SCRIPT, str(SRC_DIR), str(src), str(tmp_path / "out.tiff")],
+                        capture_output=True, text=True, timeout=120)
+
+    assert cp.returncode == 0, cp.stderr
+    assert int(cp.stdout) < 32, f"resident memory grew by {cp.stdout.strip()} MB"
+    assert cv2.imread(str(tmp_path / "out.tiff")).shape == (750, 2000, 3)
+
+
+def test_resize_tiled_allows_larger_dimensions(tmp_path: Path):
+    input_path = tmp_path / "input.tiff"
+    output_path = tmp_path / "output.tiff"
+    assert cv2.imwrite(str(input_path), _smooth((20, 30, 3)), [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+
+    args = SimpleNamespace(source=str(input_path), destination=str(output_path), width=resize.MAX_DIMENSION + 100,
+                           height=10, force=True, tiled=True, max_memory=4)
+    resize.validate_resize_arguments(args)
+    resize.resize_image(args)
+
+    assert cv2.imread(str(output_path)).shape == (10, resize.MAX_DIMENSION + 100, 3)
+    args.tiled = False
+    with pytest.raises(SystemExit):
+        resize.validate_resize_arguments(args)
+
+
+@pytest.mark.parametrize("source, dest", [("input.png", "output.tiff"), ("input.tiff", "output.png")])
+def test_large_tiled_resize_needs_tiff_to_tiff(tmp_path: Path, source, dest):
+    img = _smooth((20, 30, 3))
+    assert cv2.imwrite(str(tmp_path / source), img, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+    args = SimpleNamespace(source=str(tmp_path / source), destination=str(tmp_path / dest),
+                           width=resize.MAX_DIMENSION + 100, height=10, force=True, tiled=True, max_memory=4)
+
+    with pytest.raises(SystemExit, match="uncompressed TIFF source and a TIFF destination"):
+        resize.validate_resize_arguments(args)
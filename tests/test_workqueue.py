@@ -0,0 +1,106 @@
+# Splitting batches across workers: --shard I/N and the shared --queue
+
+import sys
+import time
+import subprocess
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_processing import batch, workqueue
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+CLI_MAIN = REPO_ROOT / "src" / "image_processing" / "main.py"
+
+
+def _cli(args):
+    return [sys.executable, str(CLI_MAIN)] + list(args)
+
+
+def _sources(tmp_path: Path, count):
+    src = tmp_path / "in"
+    src.mkdir()
+    for i in range(count):
+        cv2.imwrite(str(src / f"{i:02}.png"), np.full((24, 32, 3), i * 10, np.uint8))
+    return src
+
+
+def test_shards_cover_every_image_once(tmp_path: Path):
+    src = _sources(tmp_path, 12)
+    out = tmp_path / "out"
+
+    runs = [subprocess.run(_cli(["resize", "-s", str(src), "-d", str(out), "--width", "16", "--height", "12",
+                                 "--shard", f"{i}/3", "-j", "1"]), capture_output=True, text=True, timeout=60)
+            for i in (1, 2, 3)]
+
+    assert all(cp.returncode == 0 for cp in runs), [cp.stderr for cp in runs]
+    assert sorted(p.name for p in out.iterdir()) == [f"{i:02}_resized.png" for i in range(12)]
+    paths = batch.expand_sources([src])
+    assert sum(batch.in_shard(p, (i, 3)) for p in paths for i in (1, 2, 3)) == len(paths)
+
+
+def test_local_workers_share_a_queue(tmp_path: Path):
+    src = _sources(tmp_path, 20)
+    out, queue = tmp_path / "out", tmp_path / "queue.db"
+    args = ["convert", "-s", str(src), "-d", str(out), "-f", "jpg", "--queue", str(queue)]
+
+    workers = [subprocess.Popen(_cli(args + ["-j", j]), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+               for j in ("1", "2", "1")]
+    outputs = [w.communicate(timeout=120) for w in workers]
+
+    assert all(w.returncode == 0 for w in workers), [err for _, err in outputs]
+    # every image was converted by exactly one of the workers
+    processed = [int(stdout.split("Processed ")[1].split()[0]) for stdout, _ in outputs]
+    assert sum(processed) == 20
+    assert sorted(p.name for p in out.iterdir()) == [f"{i:02}_converted.jpg" for i in range(20)]
+    assert workqueue.WorkQueue(queue).counts() == {"done": 20}
+
+
+def test_expired_leases_are_retried_and_failures_are_not(tmp_path: Path):
+    src = _sources(tmp_path, 3)
+    (src / "bad.png").write_bytes(b"not an image")
+    queue_path = tmp_path / "queue.db"
+    crashed = workqueue.WorkQueue(queue_path, lease=1, owner="crashed:1")
+    crashed.add("resize", batch.expand_sources([src]))
+    assert len(crashed.claim(2)) == 2
+    time.sleep(1.1)  # the crashed worker never completes its claims
+
+    cp = subprocess.run(_cli(["resize", "-s", str(src), "-d", str(tmp_path / "out"), "--width", "16", "--height", "12",
+                              "--queue", str(queue_path), "-j", "1"]), capture_output=True, text=True, timeout=60)
+
+    assert cp.returncode == 1
+    assert "Processed 4 image(s): 3 succeeded, 1 failed" in cp.stdout
+    queue = workqueue.WorkQueue(queue_path)
+    assert queue.counts() == {"done": 3, "failed": 1}
+    attempts = dict(queue.db.execute("SELECT source, attempts FROM jobs").fetchall())
+    assert sorted(attempts.values()) == [1, 1, 2, 2]
+    # nothing left: a second run has nothing to claim
+    again = subprocess.run(_cli(["resize", "-s", str(src), "--width", "16", "--height", "12",
+                                 "--queue", str(queue_path), "-d", str(tmp_path / "out")]), capture_output=True, text=True, timeout=60)
+    assert "Processed 0 image(s)" in again.stdout
+
+
+def test_queue_keeps_one_command(tmp_path: Path):
+    queue = workqueue.WorkQueue(tmp_path / "queue.db")
+    queue.add("convert", [tmp_path / "a.png"])
+    with pytest.raises(ValueError, match="convert batch"):
+        queue.add("resize", [tmp_path / "a.png"])
+
+
+def test_workers_with_other_options_are_refused(tmp_path: Path):
+    src = _sources(tmp_path, 2)
+    queue = tmp_path / "queue.db"
+
+    def resize(width, *extra):
+        return subprocess.run(_cli(["resize", "-s", str(src), "-d", str(tmp_path / "out"), "--width", width,
+                                    "--height", "12", "--queue", str(queue), *extra]), capture_output=True, text=True, timeout=60)
+
+    assert resize("16", "-j", "1").returncode == 0
+    # run options such as -j may differ between workers
+    assert resize("16", "-j", "2").returncode == 0
+    refused = resize("20")
+
+    assert refused.returncode == 1
+    assert "other options" in refused.stderr and "width=16 (here 20)" in refused.stderr